@@ -0,0 +1,112 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+FSYNC_ALWAYS = 'always'
+FSYNC_EVERYSEC = 'everysec'
+FSYNC_NO = 'no'
+
+
+class AppendOnlyFile:
+    """Write-ahead log of every propagated command in RESP form.
+
+    Commands are collected with feed() and written by flush() with a
+    single write per event-loop iteration (group commit). With 'always'
+    the write is fsync'd before any reply goes out; with 'everysec' a
+    background thread fsyncs at most once a second, so the loop never
+    waits on the disk; with 'no' flushing is left to the kernel.
+    """
+
+    def __init__(self, filename, fsync_policy=FSYNC_EVERYSEC):
+        self.filename = filename
+        self.fsync_policy = fsync_policy
+        self.fd = self._open()
+        # Commands fed since the last flush
+        self.buf = bytearray()
+        # Commands written while a rewrite child runs, None otherwise.
+        # They are appended to the child's output before it replaces the log.
+        self.rewrite_buf = None
+        self.unsynced = False
+        self.last_fsync = time.monotonic()
+        # fsync and close run on this thread, in submission order
+        self._jobs = queue.Queue()
+        threading.Thread(target=self._run_jobs, daemon=True).start()
+
+    def _open(self):
+        return os.open(self.filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _run_jobs(self):
+        while True:
+            job, fd = self._jobs.get()
+            try:
+                job(fd)
+            except OSError as e:
+                logger.warning(f"AOF background {job.__name__} failed: {e}")
+
+    def feed(self, data):
+        self.buf += data
+
+    def flush(self):
+        """Writes the commands fed so far, then fsyncs as the policy says."""
+        if self.buf:
+            view = memoryview(self.buf)
+            try:
+                while view:
+                    view = view[os.write(self.fd, view):]
+            except OSError as e:
+                # Keep what was not written and retry on the next flush
+                logger.warning(f"Error writing to the AOF: {e}")
+                written = len(self.buf) - len(view)
+                view.release()
+                self._written(written)
+                return
+            view.release()
+            self._written(len(self.buf))
+            self.unsynced = True
+
+        if not self.unsynced:
+            return
+        if self.fsync_policy == FSYNC_ALWAYS:
+            os.fsync(self.fd)
+            self.unsynced = False
+        elif self.fsync_policy == FSYNC_EVERYSEC:
+            now = time.monotonic()
+            if now - self.last_fsync >= 1:
+                self._jobs.put((os.fsync, self.fd))
+                self.last_fsync = now
+                self.unsynced = False
+
+    def _written(self, count):
+        if self.rewrite_buf is not None:
+            self.rewrite_buf += self.buf[:count]
+        del self.buf[:count]
+
+    def start_rewrite(self):
+        """Called right before forking the rewrite child.
+
+        Everything fed so far is written out first: the child's snapshot
+        already contains those commands, only later ones belong after it.
+        """
+        self.flush()
+        self.rewrite_buf = bytearray()
+
+    def finish_rewrite(self, temp_filename):
+        """Appends the commands logged during the rewrite to temp_filename
+        and swaps it in for the current log."""
+        with open(temp_filename, 'ab') as f:
+            f.write(self.rewrite_buf)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_filename, self.filename)
+        self.rewrite_buf = None
+        old_fd = self.fd
+        self.fd = self._open()
+        # A pending fsync may still use the old descriptor
+        self._jobs.put((os.close, old_fd))
+
+    def abort_rewrite(self):
+        self.rewrite_buf = None
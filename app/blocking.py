@@ -0,0 +1,87 @@
+from app.commandTable import CommandError
+
+
+class BlockedState:
+    """Why a client is parked and how to finish its command."""
+
+    def __init__(self, keys, serve, on_timeout):
+        self.keys = keys
+        # serve() returns the reply once the client can be answered, else None
+        self.serve = serve
+        self.on_timeout = on_timeout
+        self.timer = None
+
+
+class Blocker:
+    """Clients parked inside the event loop until a key is written to.
+
+    ``waiters`` maps each key to the clients blocked on it in arrival
+    order. Writes only mark a key as ready; serve_ready_keys() then
+    retries just the clients waiting on those keys, so a write never wakes
+    clients blocked on other keys. Timeouts are event loop timers.
+    """
+
+    def __init__(self, event_loop, on_unblock):
+        self.event_loop = event_loop
+        # on_unblock(client, reply) sends the reply and resumes the client
+        self.on_unblock = on_unblock
+        self.waiters = {}
+        self.ready_keys = {}
+
+    def block(self, client, keys, serve, timeout=None, on_timeout=None):
+        """Parks client on keys. timeout is in seconds, None waits forever."""
+        state = BlockedState(keys, serve, on_timeout)
+        client.blocked = state
+        for key in keys:
+            self.waiters.setdefault(key, {})[client] = None
+        if timeout is not None:
+            state.timer = self.event_loop.call_later(timeout, lambda: self._timed_out(client, state))
+
+    def signal_key(self, key):
+        if key in self.waiters:
+            self.ready_keys[key] = None
+
+    def serve_ready_keys(self):
+        while self.ready_keys:
+            ready_keys = list(self.ready_keys)
+            self.ready_keys.clear()
+            for key in ready_keys:
+                for client in list(self.waiters.get(key, ())):
+                    state = client.blocked
+                    if state is None:
+                        continue
+                    try:
+                        reply = state.serve()
+                    except CommandError as e:
+                        # The key changed type under the client, e.g. a
+                        # stream replaced by a string inside one EXEC
+                        reply = e
+                    if reply is not None:
+                        self.unblock(client, reply)
+
+    def _timed_out(self, client, state):
+        if client.blocked is state:
+            self.unblock(client, state.on_timeout() if state.on_timeout else None)
+
+    def _detach(self, client):
+        state = client.blocked
+        if state is None:
+            return None
+        client.blocked = None
+        if state.timer is not None:
+            state.timer.cancel()
+        for key in state.keys:
+            clients = self.waiters.get(key)
+            if clients is not None:
+                clients.pop(client, None)
+                if not clients:
+                    del self.waiters[key]
+        return state
+
+    def unblock(self, client, reply):
+        if self._detach(client) is not None:
+            self.on_unblock(client, reply)
+
+    def remove_client(self, client):
+        """Forgets a disconnected client without replying to it."""
+        self._detach(client)
@@ -0,0 +1,110 @@
+import binascii
+import logging
+import os
+import signal
+import sys
+from bisect import bisect_right
+
+logger = logging.getLogger(__name__)
+
+CLUSTER_SLOTS = 16384
+
+
+def key_hash_slot(key):
+    """The Redis Cluster hash slot of key: CRC16 (XMODEM) mod 16384.
+
+    Only the part inside the first non-empty {...} is hashed, so keys
+    sharing a hash tag land in the same slot.
+    """
+    data = key.encode('utf-8', 'surrogateescape')
+    start = data.find(b'{')
+    if start != -1:
+        end = data.find(b'}', start + 1)
+        if end > start + 1:
+            data = data[start + 1:end]
+    # binascii.crc_hqx is CRC-CCITT, which with a zero seed is XMODEM
+    return binascii.crc_hqx(data, 0) & (CLUSTER_SLOTS - 1)
+
+
+class SlotMap:
+    """Static assignment of the hash slots to the shard workers.
+
+    The slots are split into as many contiguous, equally sized ranges as
+    there are workers. Worker i owns range i and listens on port + i.
+    """
+
+    def __init__(self, host, port, node_ids):
+        self.host = host
+        self.port = port
+        self.node_ids = node_ids
+        count = len(node_ids)
+        self.starts = [i * CLUSTER_SLOTS // count for i in range(count)]
+        self.ends = [(i + 1) * CLUSTER_SLOTS // count - 1 for i in range(count)]
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def owner(self, slot):
+        """Index of the worker serving slot."""
+        return bisect_right(self.starts, slot) - 1
+
+    def address(self, index):
+        return self.host, self.port + index
+
+    def slots_reply(self):
+        """The CLUSTER SLOTS reply: one [start, end, [host, port, id]] per range."""
+        return [[self.starts[i], self.ends[i], [self.host, self.port + i, self.node_ids[i]]]
+                for i in range(len(self))]
+
+    def nodes_reply(self, myself):
+        """The CLUSTER NODES reply, one line per worker."""
+        lines = []
+        for i, node_id in enumerate(self.node_ids):
+            flags = "myself,master" if i == myself else "master"
+            lines.append(f"{node_id} {self.host}:{self.port + i}@{self.port + i + 10000} {flags} - 0 0 "
+                         f"{i + 1} connected {self.starts[i]}-{self.ends[i]}\n")
+        return "".join(lines)
+
+
+def fork_workers(count):
+    """Forks count shard workers and returns the index of the calling worker.
+
+    The original process never returns: it stays behind as a supervisor
+    that forwards SIGINT and SIGTERM to the workers and, as soon as one
+    of them exits, stops the rest and exits with its status.
+    """
+    pids = []
+    # Set once the supervisor was asked to stop, so that is not a failure
+    stopping = []
+    for index in range(count):
+        sys.stdout.flush()
+        pid = os.fork()
+        if pid == 0:
+            return index
+        pids.append(pid)
+
+    def stop_workers(signum, frame):
+        if signum is not None:
+            stopping.append(signum)
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop_workers)
+    signal.signal(signal.SIGINT, stop_workers)
+    pid, status = os.wait()
+    if not stopping:
+        logger.warning(f"Shard worker {pid} exited with status {status}, stopping the others")
+    pids.remove(pid)
+    stop_workers(None, None)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    sys.exit(1 if status and not stopping else 0)
+
+
+def shard_filename(filename, index):
+    """Per-worker name for a data file: dump.rdb -> dump-2.rdb."""
+    root, ext = os.path.splitext(filename)
+    return f"{root}-{index}{ext}"
@@ -0,0 +1,94 @@
+from app.stats import LatencyHistogram
+
+# Command flags
+WRITE = "write"          # modifies the keyspace
+READONLY = "readonly"    # only reads the keyspace
+BLOCKING = "blocking"    # may park the client instead of replying right away
+PROPAGATE = "propagate"  # forwarded to replicas after a successful run
+DENYOOM = "denyoom"      # may grow the dataset, refused when over maxmemory
+
+
+class CommandError(Exception):
+    """Raised by a command handler to send an error reply to the client."""
+
+
+class Command:
+    def __init__(self, name, handler, arity, flags=(), first_key=0, last_key=0, key_step=1,
+                 get_keys=None):
+        self.name = name
+        self.handler = handler
+        # Same convention as Redis: a positive arity is the exact number of
+        # arguments including the command name, a negative one is a minimum
+        self.arity = arity
+        # Positions of the key arguments, also as in Redis: first_key 0
+        # means no keys, a negative last_key counts from the end
+        self.first_key = first_key
+        self.last_key = last_key
+        self.key_step = key_step
+        # get_keys(content) replaces the positions for commands whose keys
+        # can't be described by them, like XREAD ... STREAMS key [key ...] id [id ...]
+        self.get_keys = get_keys
+        self.flags = frozenset(flags)
+        # Flags are checked on every call, so keep them as plain attributes
+        self.is_write = WRITE in self.flags
+        self.propagate = PROPAGATE in self.flags
+        self.denyoom = DENYOOM in self.flags
+        self.reset_stats()
+
+    def reset_stats(self):
+        # INFO commandstats and LATENCY HISTOGRAM
+        self.calls = 0
+        self.usec = 0
+        self.rejected_calls = 0
+        self.failed_calls = 0
+        self.latency = LatencyHistogram()
+
+    def check_arity(self, argc):
+        if self.arity >= 0:
+            return argc == self.arity
+        return argc >= -self.arity
+
+    def keys(self, content):
+        """The key arguments of a call, per the command's key positions."""
+        if self.get_keys is not None:
+            return self.get_keys(content)
+        if not self.first_key:
+            return []
+        last_key = self.last_key if self.last_key >= 0 else len(content) + self.last_key
+        return content[self.first_key:last_key + 1:self.key_step]
+
+
+class CommandTable:
+    def __init__(self):
+        self.commands = {}
+
+    def register(self, name, arity, flags=(), first_key=0, last_key=None, key_step=1, get_keys=None):
+        """Decorator that adds a handler(client, args) to the table.
+
+        last_key defaults to first_key, for the many commands that take a
+        single key.
+        """
+        if last_key is None:
+            last_key = first_key
+
+        def decorator(handler):
+            command = Command(name.lower(), handler, arity, flags, first_key, last_key, key_step,
+                              get_keys)
+            # Clients send either case, so both spellings hit on the first lookup
+            self.commands[command.name] = command
+            self.commands[command.name.upper()] = command
+            return handler
+        return decorator
+
+    def lookup(self, name):
+        if not isinstance(name, str):
+            return None
+        command = self.commands.get(name)
+        if command is None:
+            command = self.commands.get(name.lower())
+        return command
+
+    def all(self):
+        """Every command once, sorted by name."""
+        return sorted({command.name: command for command in self.commands.values()}.values(),
+                      key=lambda command: command.name)
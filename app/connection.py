@@ -0,0 +1,117 @@
+import time
+
+from app.redisParser import ParseState
+
+
+class OutputBufferLimits:
+    """Hard and soft limits on the bytes waiting to be written to a client.
+
+    A client is disconnected as soon as its output buffer grows past
+    ``hard`` bytes, or when it stays above ``soft`` bytes for longer than
+    ``soft_seconds``. A limit of 0 disables that check.
+    """
+
+    def __init__(self, hard=0, soft=0, soft_seconds=0):
+        self.hard = hard
+        self.soft = soft
+        self.soft_seconds = soft_seconds
+
+
+class Connection:
+    """State the server keeps for one client socket."""
+
+    def __init__(self, sock, address, pending_writes, limits=None):
+        self.sock = sock
+        self.address = address
+        # Bytes received but not yet parsed, and the command they continue
+        self.read_buffer = bytearray()
+        self.parse_state = ParseState()
+        # Replies waiting for the socket to become writable
+        self.write_buffer = bytearray()
+        # Set shared by all connections that have replies to flush
+        self.pending_writes = pending_writes
+        self.limits = limits or OutputBufferLimits()
+        self.soft_limit_since = None
+        # Set when the client fell too far behind and has to be dropped
+        self.close_requested = False
+        # Commands queued since MULTI, None outside a transaction
+        self.multi_queue = None
+        # Set when a command could not be queued; EXEC then aborts
+        self.multi_error = False
+        # WATCHed keys and their versions at the time of WATCH
+        self.watched = {}
+        self.in_exec = False
+        # BlockedState while parked by a blocking command
+        self.blocked = None
+        # Parsed commands that arrived behind a blocking command
+        self.pending_commands = None
+        # Capabilities and port announced with REPLCONF
+        self.capabilities = set()
+        self.listening_port = None
+        # Replication offset the replica last acknowledged, and when
+        self.repl_ack_offset = 0
+        self.repl_ack_time = None
+        # Master replication offset right after this client's last write
+        self.write_offset = 0
+        # Pid of the child streaming a snapshot to this replica. Output is
+        # held back until it exits so nothing interleaves with the RDB.
+        self.sync_child = None
+        self.closed = False
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def send(self, data):
+        """Queues data for the next flush instead of writing it right away."""
+        if self.close_requested or self.closed:
+            return
+        if not self.write_buffer:
+            self.pending_writes.add(self)
+        self.write_buffer += data
+        self._check_limits()
+
+    def _check_limits(self):
+        limits = self.limits
+        size = len(self.write_buffer)
+        if limits.hard and size > limits.hard:
+            self._request_close()
+        elif limits.soft and size > limits.soft:
+            now = time.monotonic()
+            if self.soft_limit_since is None:
+                self.soft_limit_since = now
+            elif now - self.soft_limit_since > limits.soft_seconds:
+                self._request_close()
+        else:
+            self.soft_limit_since = None
+
+    def _request_close(self):
+        # Output is dropped from now on, so the connection must not stay
+        # open: the pending writes are handled before the loop sleeps
+        # again and close the client there, even if it never becomes
+        # writable
+        self.close_requested = True
+        self.pending_writes.add(self)
+
+    def flush(self):
+        """Writes as much of the output buffer as the socket accepts.
+
+        Returns True once the buffer is empty. Raises OSError if the peer
+        has gone away.
+        """
+        if not self.write_buffer:
+            return True
+        try:
+            sent = self.sock.send(self.write_buffer)
+        except BlockingIOError:
+            return False
+        del self.write_buffer[:sent]
+        if not self.write_buffer:
+            self.soft_limit_since = None
+            return True
+        self._check_limits()
+        return False
+
+    def close(self):
+        self.closed = True
+        self.pending_writes.discard(self)
+        self.sock.close()
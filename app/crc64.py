@@ -0,0 +1,97 @@
+# CRC-64/Jones as used by Redis for RDB checksums (reflected, polynomial
+# 0xad93d23594c935a9, init 0, no final xor).
+_POLY = (1 << 64) | 0xad93d23594c935a9
+_POLY_REFLECTED = 0x95ac9329ac4bc9b5
+
+# Inputs shorter than this go through the byte table; longer ones are folded
+# as one big polynomial, at most FOLD_CHUNK_SIZE bytes at a time
+_TABLE_CUTOFF = 64
+FOLD_CHUNK_SIZE = 1 << 20
+
+
+def _make_table():
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = (crc >> 1) ^ _POLY_REFLECTED if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+_TABLE = _make_table()
+
+# Reverses the bits of every byte, turning the reflected bit order into
+# plain polynomial order
+_REVERSE_BITS = bytes(int(f'{i:08b}'[::-1], 2) for i in range(256))
+
+
+def _reverse64(value):
+    return int.from_bytes(value.to_bytes(8, 'little').translate(_REVERSE_BITS), 'big')
+
+
+def _clmul(a, b):
+    """Carry-less product of two polynomials over GF(2)."""
+    result = 0
+    while b:
+        low = b & -b
+        result ^= a << (low.bit_length() - 1)
+        b ^= low
+    return result
+
+
+def _reduce_small(value):
+    while value.bit_length() > 64:
+        value ^= _POLY << (value.bit_length() - 65)
+    return value
+
+
+_x_power_cache = {}
+
+
+def _x_power(k):
+    """x^k mod P."""
+    result = _x_power_cache.get(k)
+    if result is None:
+        if k < 64:
+            result = 1 << k
+        elif k % 2:
+            result = _reduce_small(_x_power(k - 1) << 1)
+        else:
+            half = _x_power(k // 2)
+            result = _reduce_small(_clmul(half, half))
+        _x_power_cache[k] = result
+    return result
+
+
+def _reduce(value):
+    """value mod P. Each pass folds the high half onto the low one with
+    whole-integer shifts and xors, so the work per byte is done in C."""
+    length = value.bit_length()
+    while length > 128:
+        k = (length // 2 + 32) & ~63
+        value = (value & ((1 << k) - 1)) ^ _clmul(value >> k, _x_power(k))
+        length = value.bit_length()
+    return _reduce_small(value)
+
+
+def _crc64_fold(crc, data):
+    # With init 0 and no final xor the CRC is M(x) * x^64 mod P, where the
+    # running crc is xored into the first eight message bytes
+    message = int.from_bytes(bytes(data).translate(_REVERSE_BITS), 'big')
+    message ^= _reverse64(crc) << (8 * len(data) - 64)
+    return _reverse64(_reduce(message << 64))
+
+
+def crc64(crc, data):
+    """Continues crc over data (bytes, bytearray or a memoryview of bytes)."""
+    if len(data) < _TABLE_CUTOFF:
+        table = _TABLE
+        for byte in data:
+            crc = table[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+        return crc
+    view = memoryview(data)
+    for start in range(0, len(view), FOLD_CHUNK_SIZE):
+        chunk = view[start:start + FOLD_CHUNK_SIZE]
+        crc = crc64(crc, chunk) if len(chunk) < _TABLE_CUTOFF else _crc64_fold(crc, chunk)
+    return crc
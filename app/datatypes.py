@@ -0,0 +1,475 @@
+import sys
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from itertools import islice
+
+from app.keyspace import encode_string
+from app.sortedList import SortedList
+
+# Estimated bytes of an empty container object
+CONTAINER_SIZE = 64
+# Estimated bytes a container spends per element on top of the element
+# objects: a list or deque pointer, a set slot, a dict slot, an intset
+# integer, a sorted set (score, member) tuple with its float
+LIST_SLOT_SIZE = 8
+SET_SLOT_SIZE = 16
+DICT_SLOT_SIZE = 32
+INTSET_SLOT_SIZE = 8
+ZSET_ENTRY_SIZE = sys.getsizeof((0.0, '')) + sys.getsizeof(0.0) + LIST_SLOT_SIZE
+
+
+def string_memory(value):
+    return sys.getsizeof(value)
+
+
+class EncodingLimits:
+    """Sizes up to which collections keep their compact encodings.
+
+    Names and defaults are those of the Redis configuration parameters,
+    except that list-max-listpack-size only takes a positive entry count.
+    A collection that grows past a limit converts once and keeps the
+    general encoding from then on.
+    """
+
+    def __init__(self):
+        self.hash_max_listpack_entries = 128
+        self.hash_max_listpack_value = 64
+        self.list_max_listpack_size = 128
+        self.set_max_intset_entries = 512
+        self.set_max_listpack_entries = 128
+        self.set_max_listpack_value = 64
+        self.zset_max_listpack_entries = 128
+        self.zset_max_listpack_value = 64
+
+
+limits = EncodingLimits()
+
+
+class List:
+    """A list kept in a Python list while small, in a deque once it grows.
+
+    Small lists are contiguous like a Redis listpack, so indexing and
+    slicing are direct; pushing at the head moves at most
+    list-max-listpack-size pointers. Long lists take the O(1) pushes and
+    pops of a deque at both ends.
+    """
+
+    type_name = "list"
+
+    def __init__(self, items=()):
+        self.items = list(items)
+        # Estimated bytes used, kept up to date by the methods below
+        self.memory = CONTAINER_SIZE + sum(string_memory(item) + LIST_SLOT_SIZE for item in self.items)
+        self._check_size()
+
+    @property
+    def encoding(self):
+        return "listpack" if type(self.items) is list else "quicklist"
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def _check_size(self):
+        if type(self.items) is list and len(self.items) > limits.list_max_listpack_size:
+            self.items = deque(self.items)
+
+    def push(self, values, left=False):
+        items = self.items
+        if not left:
+            items.extend(values)
+        elif type(items) is list:
+            items[:0] = values[::-1]
+        else:
+            items.extendleft(values)
+        self.memory += sum(string_memory(value) + LIST_SLOT_SIZE for value in values)
+        self._check_size()
+
+    def pop(self, count, left=False):
+        """Removes and returns up to count elements from one end."""
+        items = self.items
+        count = min(count, len(items))
+        if type(items) is list:
+            if left:
+                popped = items[:count]
+                del items[:count]
+            else:
+                popped = items[len(items) - count:][::-1]
+                del items[len(items) - count:]
+        elif left:
+            popped = [items.popleft() for _ in range(count)]
+        else:
+            popped = [items.pop() for _ in range(count)]
+        self.memory -= sum(string_memory(value) + LIST_SLOT_SIZE for value in popped)
+        return popped
+
+    def index(self, index):
+        """The element at index, negative counting from the tail; None if out of range."""
+        if not -len(self.items) <= index < len(self.items):
+            return None
+        return self.items[index]
+
+    def set(self, index, value):
+        """Replaces the element at index; False if out of range."""
+        if not -len(self.items) <= index < len(self.items):
+            return False
+        self.memory += string_memory(value) - string_memory(self.items[index])
+        self.items[index] = value
+        return True
+
+    def range(self, start, stop):
+        """Elements at positions start <= i < stop, both non-negative."""
+        if type(self.items) is list:
+            return self.items[start:stop]
+        return list(islice(self.items, start, stop))
+
+    def trim(self, start, stop):
+        """Keeps only positions start <= i < stop, both non-negative."""
+        items = self.items
+        start = min(start, len(items))
+        stop = max(start, min(stop, len(items)))
+        if type(items) is list:
+            removed = items[stop:] + items[:start]
+            del items[stop:]
+            del items[:start]
+        else:
+            removed = [items.pop() for _ in range(len(items) - stop)]
+            removed += [items.popleft() for _ in range(start)]
+        self.memory -= sum(string_memory(item) + LIST_SLOT_SIZE for item in removed)
+
+
+class Hash:
+    """Field -> value map.
+
+    Small hashes are a flat [field, value, field, value, ...] list, like
+    a Redis listpack: no dict slot per field, and a scan over at most
+    hash-max-listpack-entries fields costs about as much as hashing.
+    Bigger hashes, or ones with long fields or values, use a dict.
+    """
+
+    type_name = "hash"
+
+    def __init__(self, pairs=()):
+        self.fields = []
+        self.memory = CONTAINER_SIZE
+        for field, value in pairs:
+            self.set(field, value)
+
+    @property
+    def encoding(self):
+        return "listpack" if type(self.fields) is list else "hashtable"
+
+    def __len__(self):
+        if type(self.fields) is list:
+            return len(self.fields) // 2
+        return len(self.fields)
+
+    def __contains__(self, field):
+        if type(self.fields) is list:
+            return self._find(field) >= 0
+        return field in self.fields
+
+    def _find(self, field):
+        """Position of field in the listpack, -1 if it is not there."""
+        try:
+            return self.fields[::2].index(field) * 2
+        except ValueError:
+            return -1
+
+    def _convert(self):
+        fields = self.fields
+        self.fields = dict(zip(fields[::2], fields[1::2]))
+        self.memory += len(self.fields) * (DICT_SLOT_SIZE - 2 * LIST_SLOT_SIZE)
+
+    def get(self, field):
+        if type(self.fields) is list:
+            i = self._find(field)
+            return None if i < 0 else self.fields[i + 1]
+        return self.fields.get(field)
+
+    def set(self, field, value):
+        """Sets field to value; True if the field is new."""
+        fields = self.fields
+        if type(fields) is list:
+            i = self._find(field)
+            if i >= 0:
+                self.memory += string_memory(value) - string_memory(fields[i + 1])
+                fields[i + 1] = value
+            else:
+                fields += (field, value)
+                self.memory += string_memory(field) + string_memory(value) + 2 * LIST_SLOT_SIZE
+            if (len(fields) > 2 * limits.hash_max_listpack_entries
+                    or len(field) > limits.hash_max_listpack_value
+                    or len(value) > limits.hash_max_listpack_value):
+                self._convert()
+            return i < 0
+        old = fields.get(field)
+        fields[field] = value
+        if old is None:
+            self.memory += string_memory(field) + string_memory(value) + DICT_SLOT_SIZE
+            return True
+        self.memory += string_memory(value) - string_memory(old)
+        return False
+
+    def delete(self, field):
+        """Removes field; False if it was not there."""
+        fields = self.fields
+        if type(fields) is list:
+            i = self._find(field)
+            if i < 0:
+                return False
+            value = fields[i + 1]
+            del fields[i:i + 2]
+            self.memory -= string_memory(field) + string_memory(value) + 2 * LIST_SLOT_SIZE
+            return True
+        value = fields.pop(field, None)
+        if value is None:
+            return False
+        self.memory -= string_memory(field) + string_memory(value) + DICT_SLOT_SIZE
+        return True
+
+    def items(self):
+        if type(self.fields) is list:
+            return zip(self.fields[::2], self.fields[1::2])
+        return self.fields.items()
+
+    def keys(self):
+        if type(self.fields) is list:
+            return self.fields[::2]
+        return self.fields.keys()
+
+    def values(self):
+        if type(self.fields) is list:
+            return self.fields[1::2]
+        return self.fields.values()
+
+
+class Set:
+    """A set of strings in one of three encodings, like in Redis.
+
+    intset: a sorted array of 64-bit integers while every member is a
+    canonical integer, 8 bytes a member with no objects at all.
+    listpack: a list searched linearly while the set is small.
+    hashtable: a Python set.
+    Members always come out as str.
+    """
+
+    type_name = "set"
+
+    def __init__(self, members=()):
+        self.members = array('q')
+        self.memory = CONTAINER_SIZE
+        for member in members:
+            self.add(member)
+
+    @property
+    def encoding(self):
+        kind = type(self.members)
+        if kind is array:
+            return "intset"
+        return "listpack" if kind is list else "hashtable"
+
+    def __len__(self):
+        return len(self.members)
+
+    def __iter__(self):
+        if type(self.members) is array:
+            return map(str, self.members)
+        return iter(self.members)
+
+    def __contains__(self, member):
+        members = self.members
+        if type(members) is array:
+            number = encode_string(member)
+            if type(number) is not int:
+                return False
+            i = bisect_left(members, number)
+            return i < len(members) and members[i] == number
+        return member in members
+
+    def _convert(self, kind):
+        members = list(self)
+        self.members = set(members) if kind is set else members
+        slot_size = SET_SLOT_SIZE if kind is set else LIST_SLOT_SIZE
+        self.memory = CONTAINER_SIZE + sum(string_memory(member) + slot_size for member in members)
+
+    def add(self, member):
+        """Adds member; True if it was not there yet."""
+        members = self.members
+        kind = type(members)
+        if kind is array:
+            number = encode_string(member)
+            if type(number) is not int:
+                fits = (len(members) < limits.set_max_listpack_entries
+                        and len(member) <= limits.set_max_listpack_value)
+                self._convert(list if fits else set)
+                return self.add(member)
+            i = bisect_left(members, number)
+            if i < len(members) and members[i] == number:
+                return False
+            members.insert(i, number)
+            self.memory += INTSET_SLOT_SIZE
+            if len(members) > limits.set_max_intset_entries:
+                self._convert(set)
+            return True
+        if member in members:
+            return False
+        if kind is list:
+            members.append(member)
+            self.memory += string_memory(member) + LIST_SLOT_SIZE
+            if len(members) > limits.set_max_listpack_entries or len(member) > limits.set_max_listpack_value:
+                self._convert(set)
+        else:
+            members.add(member)
+            self.memory += string_memory(member) + SET_SLOT_SIZE
+        return True
+
+    def remove(self, member):
+        """Removes member; False if it was not there."""
+        members = self.members
+        kind = type(members)
+        if kind is array:
+            number = encode_string(member)
+            if type(number) is not int:
+                return False
+            i = bisect_left(members, number)
+            if i == len(members) or members[i] != number:
+                return False
+            del members[i]
+            self.memory -= INTSET_SLOT_SIZE
+            return True
+        if member not in members:
+            return False
+        members.remove(member)
+        self.memory -= string_memory(member) + (LIST_SLOT_SIZE if kind is list else SET_SLOT_SIZE)
+        return True
+
+
+class _Top:
+    """Sorts after every string, so (score, TOP) follows all entries with that score."""
+
+    __slots__ = ()
+
+    def __lt__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return True
+
+
+TOP = _Top()
+
+
+class ZSet:
+    """Members ordered by (score, member).
+
+    listpack: a sorted list of (score, member) tuples; finding a member's
+    score is a linear scan over at most zset-max-listpack-entries entries.
+    skiplist: the same tuples in a SortedList plus a member -> score dict,
+    so score lookups are O(1) and inserts, removals, ranks and range
+    starts are O(log n), like Redis' skiplist and dict pair.
+    """
+
+    type_name = "zset"
+
+    def __init__(self, pairs=()):
+        self.entries = []
+        # member -> score, once the set uses the skiplist encoding
+        self.scores = None
+        self.memory = CONTAINER_SIZE
+        for member, score in pairs:
+            self.add(member, score)
+
+    @property
+    def encoding(self):
+        return "listpack" if self.scores is None else "skiplist"
+
+    def __len__(self):
+        return len(self.entries)
+
+    def items(self):
+        """(member, score) pairs in order."""
+        return ((member, score) for score, member in self.entries)
+
+    def _convert(self):
+        self.scores = {member: score for score, member in self.entries}
+        self.entries = SortedList(self.entries)
+        self.memory += len(self.scores) * DICT_SLOT_SIZE
+
+    def _bisect_left(self, key):
+        if self.scores is None:
+            return bisect_left(self.entries, key)
+        return self.entries.bisect_left(key)
+
+    def _bisect_right(self, key):
+        if self.scores is None:
+            return bisect_right(self.entries, key)
+        return self.entries.bisect_right(key)
+
+    def score(self, member):
+        if self.scores is not None:
+            return self.scores.get(member)
+        for score, entry_member in self.entries:
+            if entry_member == member:
+                return score
+        return None
+
+    def add(self, member, score):
+        """Sets the score of member; True if the member is new."""
+        old = self.score(member)
+        if old is not None:
+            if old == score:
+                return False
+            self._remove_entry(old, member)
+        else:
+            self.memory += string_memory(member) + ZSET_ENTRY_SIZE
+            if self.scores is not None:
+                self.memory += DICT_SLOT_SIZE
+        if self.scores is None:
+            insort(self.entries, (score, member))
+            if len(self.entries) > limits.zset_max_listpack_entries or len(member) > limits.zset_max_listpack_value:
+                self._convert()
+        else:
+            self.entries.add((score, member))
+            self.scores[member] = score
+        return old is None
+
+    def _remove_entry(self, score, member):
+        if self.scores is None:
+            del self.entries[bisect_left(self.entries, (score, member))]
+        else:
+            self.entries.remove((score, member))
+
+    def remove(self, member):
+        """Removes member; False if it was not there."""
+        score = self.score(member)
+        if score is None:
+            return False
+        self._remove_entry(score, member)
+        self.memory -= string_memory(member) + ZSET_ENTRY_SIZE
+        if self.scores is not None:
+            del self.scores[member]
+            self.memory -= DICT_SLOT_SIZE
+        return True
+
+    def rank(self, member):
+        """0-based position of member in score order, None if it is not there."""
+        score = self.score(member)
+        if score is None:
+            return None
+        return self._bisect_left((score, member))
+
+    def score_range(self, low, low_exclusive, high, high_exclusive):
+        """(start, stop) positions of the entries with scores within the bounds."""
+        start = self._bisect_right((low, TOP)) if low_exclusive else self._bisect_left((low,))
+        stop = self._bisect_left((high,)) if high_exclusive else self._bisect_right((high, TOP))
+        return start, max(start, stop)
+
+    def range(self, start, stop):
+        """(score, member) entries at positions start <= i < stop, both non-negative."""
+        if self.scores is None:
+            return self.entries[start:stop]
+        return self.entries.slice(start, stop)
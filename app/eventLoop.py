@@ -0,0 +1,90 @@
+import heapq
+import itertools
+import selectors
+import time
+
+
+class Timer:
+    def __init__(self, when, callback):
+        self.when = when
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        # Cancelled timers stay in the heap and are skipped when they come due
+        self.cancelled = True
+
+
+class EventLoop:
+    """Readiness loop over the platform's best selector (epoll on Linux).
+
+    Sockets are registered once with a callback, so a wakeup only costs
+    time for the sockets that are actually ready, and registering or
+    removing a socket is O(1) no matter how many are idle. Timers live in
+    a min-heap and bound how long the loop sleeps.
+    """
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        # Called once per iteration before the loop waits for events
+        self.before_sleep = []
+        self.timers = []
+        self._timer_sequence = itertools.count()
+
+    def add_reader(self, fileobj, callback):
+        """Calls callback(mask) whenever fileobj becomes readable."""
+        self.selector.register(fileobj, selectors.EVENT_READ, callback)
+
+    def watch_writable(self, fileobj, enabled):
+        """Also calls the reader callback when fileobj becomes writable."""
+        try:
+            key = self.selector.get_key(fileobj)
+        except (KeyError, ValueError):
+            return
+        events = selectors.EVENT_READ | selectors.EVENT_WRITE if enabled else selectors.EVENT_READ
+        if key.events != events:
+            self.selector.modify(fileobj, events, key.data)
+
+    def remove(self, fileobj):
+        try:
+            self.selector.unregister(fileobj)
+        except (KeyError, ValueError):
+            pass
+
+    def call_later(self, delay, callback):
+        """Runs callback() after delay seconds and returns a cancellable Timer."""
+        timer = Timer(time.monotonic() + delay, callback)
+        heapq.heappush(self.timers, (timer.when, next(self._timer_sequence), timer))
+        return timer
+
+    def call_every(self, interval, callback):
+        """Runs callback() every interval seconds for as long as the loop runs."""
+        def tick():
+            callback()
+            self.call_later(interval, tick)
+        return self.call_later(interval, tick)
+
+    def _run_due_timers(self):
+        timers = self.timers
+        now = time.monotonic()
+        while timers and timers[0][0] <= now:
+            timer = heapq.heappop(timers)[2]
+            if not timer.cancelled:
+                timer.callback()
+
+    def _next_timeout(self):
+        timers = self.timers
+        while timers and timers[0][2].cancelled:
+            heapq.heappop(timers)
+        if not timers:
+            return None
+        return max(0, timers[0][0] - time.monotonic())
+
+    def run_forever(self):
+        select = self.selector.select
+        while True:
+            for hook in self.before_sleep:
+                hook()
+            for key, mask in select(self._next_timeout()):
+                key.data(mask)
+            self._run_due_timers()
@@ -0,0 +1,173 @@
+import math
+import random
+import time
+from bisect import insort
+
+# maxmemory policies
+NOEVICTION = 'noeviction'
+ALLKEYS_LRU = 'allkeys-lru'
+ALLKEYS_LFU = 'allkeys-lfu'
+VOLATILE_TTL = 'volatile-ttl'
+POLICIES = (NOEVICTION, ALLKEYS_LRU, ALLKEYS_LFU, VOLATILE_TTL)
+
+# Keys looked at per eviction round and best candidates remembered, as in Redis
+SAMPLES = 5
+POOL_SIZE = 16
+
+# LFU counter: logarithmic, 8 bits, new keys start at LFU_INIT_VAL and lose
+# one point per LFU_DECAY_MINUTES without access
+LFU_INIT_VAL = 5
+LFU_LOG_FACTOR = 10
+LFU_DECAY_MINUTES = 1
+LFU_COUNTER_MAX = 255
+
+
+def lru_clock():
+    # Tenths of a second; one int object is shared by every key touched
+    # within the same tick, so the per-key cost is just the dict slot
+    return int(time.monotonic() * 10)
+
+
+def lfu_minutes():
+    return int(time.monotonic() / 60) & 0xFFFF
+
+
+def lfu_decayed(packed, now_minutes):
+    """The counter of a packed (minutes << 8 | counter) entry after decay."""
+    counter = packed & 0xFF
+    elapsed = (now_minutes - (packed >> 8)) & 0xFFFF
+    return max(counter - elapsed // LFU_DECAY_MINUTES, 0)
+
+
+def lfu_increment(counter):
+    """Logarithmic increment: the higher the counter, the less likely it grows."""
+    if counter == LFU_COUNTER_MAX:
+        return counter
+    base = max(counter - LFU_INIT_VAL, 0)
+    if random.random() < 1.0 / (base * LFU_LOG_FACTOR + 1):
+        return counter + 1
+    return counter
+
+
+class Evictor:
+    """Keeps the keyspace under maxmemory by evicting keys per policy.
+
+    Access metadata lives in one dict shared with the keyspace: an LRU
+    clock per key for allkeys-lru, a packed decay-time and logarithmic
+    counter (like the 24 bits Redis keeps in every object) for
+    allkeys-lfu, nothing for the other policies.
+
+    Candidates are sampled SAMPLES at a time, walking a snapshot of the
+    keys like a clock hand instead of random picks (dicts have no random
+    access), and the best POOL_SIZE of them are kept between rounds. Each
+    eviction therefore looks at a constant number of keys; the snapshot
+    is a single list copy, refreshed once per pass over the keyspace.
+    """
+
+    def __init__(self, keyspace, maxmemory=0, policy=NOEVICTION, on_evict=None):
+        self.keyspace = keyspace
+        self.maxmemory = maxmemory
+        self.on_evict = on_evict
+        self.evicted_keys = 0
+        self.clock = lru_clock()
+        self.policy = None
+        self.pool = []
+        self._candidates = []
+        self._position = 0
+        self.set_policy(policy)
+
+    def set_policy(self, policy):
+        if policy == self.policy:
+            return
+        self.policy = policy
+        self.pool = []
+        keyspace = self.keyspace
+        if policy == ALLKEYS_LRU:
+            keyspace.access = {}
+            keyspace.on_access = self._record_lru
+        elif policy == ALLKEYS_LFU:
+            keyspace.access = {}
+            keyspace.on_access = self._record_lfu
+        else:
+            keyspace.access = None
+            keyspace.on_access = None
+
+    def update_clock(self):
+        self.clock = lru_clock()
+
+    def _record_lru(self, key):
+        self.keyspace.access[key] = self.clock
+
+    def _record_lfu(self, key):
+        access = self.keyspace.access
+        now = lfu_minutes()
+        packed = access.get(key)
+        counter = LFU_INIT_VAL if packed is None else lfu_decayed(packed, now)
+        access[key] = (now << 8) | lfu_increment(counter)
+
+    def _score(self, key):
+        """Higher means a better candidate for eviction."""
+        keyspace = self.keyspace
+        if self.policy == ALLKEYS_LRU:
+            # Keys never seen since the policy was set count as the oldest
+            return self.clock - keyspace.access.get(key, 0)
+        if self.policy == ALLKEYS_LFU:
+            packed = keyspace.access.get(key)
+            return LFU_COUNTER_MAX - (0 if packed is None else lfu_decayed(packed, lfu_minutes()))
+        return -keyspace.expires.get(key)
+
+    def _sample(self):
+        """Adds up to SAMPLES live keys to the pool. Returns False when
+        there is nothing left to sample."""
+        keyspace = self.keyspace
+        source = keyspace.expires.deadlines if self.policy == VOLATILE_TTL else keyspace.data
+        if self._position >= len(self._candidates):
+            self._candidates = list(source)
+            self._position = 0
+            if not self._candidates:
+                return False
+        chunk = self._candidates[self._position:self._position + SAMPLES]
+        self._position += SAMPLES
+        pool = self.pool
+        for key in chunk:
+            if key not in source or any(pooled == key for _, pooled in pool):
+                continue
+            entry = (self._score(key), key)
+            if len(pool) < POOL_SIZE:
+                insort(pool, entry)
+            elif entry > pool[0]:
+                pool[0] = entry
+                pool.sort()
+        return True
+
+    def _evict_one(self):
+        """Evicts the best candidate. Returns False if none could be found."""
+        keyspace = self.keyspace
+        source = keyspace.expires.deadlines if self.policy == VOLATILE_TTL else keyspace.data
+        # One pass over the whole keyspace at most
+        for _ in range(math.ceil(len(source) / SAMPLES) + 1):
+            if not self._sample():
+                return False
+            while self.pool:
+                _, key = self.pool.pop()
+                if key in source:
+                    # An already expired key goes the expiry way instead
+                    if keyspace.delete(key):
+                        self.evicted_keys += 1
+                        if self.on_evict is not None:
+                            self.on_evict(key)
+                    return True
+        return False
+
+    def free_memory(self):
+        """Evicts until the dataset fits in maxmemory. Returns False if it
+        still doesn't, so commands that need memory must be refused."""
+        keyspace = self.keyspace
+        if not self.maxmemory or keyspace.used_memory <= self.maxmemory:
+            return True
+        if self.policy == NOEVICTION:
+            return False
+        while keyspace.used_memory > self.maxmemory:
+            if not self._evict_one():
+                return False
+        return True
@@ -0,0 +1,80 @@
+import heapq
+import time
+
+_last_now_ms = 0
+
+
+def now_ms():
+    """Current unix time in integer milliseconds that never goes backwards.
+
+    Deadlines are absolute unix milliseconds because RDB files store them
+    that way, but a wall clock step back must not resurrect expired keys.
+    """
+    global _last_now_ms
+    now = time.time_ns() // 1_000_000
+    if now > _last_now_ms:
+        _last_now_ms = now
+    return _last_now_ms
+
+
+class Expires:
+    """Expiry deadlines for the keys that have one.
+
+    ``deadlines`` maps key -> unix ms and is the source of truth. ``heap``
+    orders the same deadlines so the active expire cycle can find due keys
+    without scanning; entries left behind by overwritten or removed
+    deadlines are skipped when popped.
+    """
+
+    def __init__(self):
+        self.deadlines = {}
+        self.heap = []
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def __contains__(self, key):
+        return key in self.deadlines
+
+    def get(self, key):
+        return self.deadlines.get(key)
+
+    def set(self, key, when_ms):
+        self.deadlines[key] = when_ms
+        heapq.heappush(self.heap, (when_ms, key))
+        # Stale entries pile up when keys get a new TTL on every write
+        if len(self.heap) > 2 * len(self.deadlines) + 64:
+            self.heap = [(when, key) for key, when in self.deadlines.items()]
+            heapq.heapify(self.heap)
+
+    def remove(self, key):
+        self.deadlines.pop(key, None)
+
+    def is_expired(self, key, now=None):
+        when = self.deadlines.get(key)
+        if when is None:
+            return False
+        return when <= (now_ms() if now is None else now)
+
+    def active_expire_cycle(self, on_expire, time_limit_ms):
+        """Removes due keys until none are left or the time budget is spent.
+
+        on_expire(key) is called for every key that was removed. Returns the
+        number of expired keys.
+        """
+        heap = self.heap
+        deadlines = self.deadlines
+        now = now_ms()
+        stop_at = time.monotonic() + time_limit_ms / 1000
+        expired = 0
+        while heap and heap[0][0] <= now:
+            when, key = heapq.heappop(heap)
+            if deadlines.get(key) != when:
+                continue
+            del deadlines[key]
+            on_expire(key)
+            expired += 1
+            # Checking the clock costs more than a pop, so only do it now and then
+            if expired % 64 == 0 and time.monotonic() > stop_at:
+                break
+        return expired
@@ -0,0 +1,60 @@
+import re
+from functools import lru_cache
+
+
+def _translate(pattern):
+    """Turns a Redis glob (*, ?, [a-z], [^abc], backslash escapes) into a regex."""
+    out = []
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        i += 1
+        if c == '*':
+            while i < n and pattern[i] == '*':
+                i += 1
+            out.append('.*')
+        elif c == '?':
+            out.append('.')
+        elif c == '\\' and i < n:
+            out.append(re.escape(pattern[i]))
+            i += 1
+        elif c == '[':
+            negate = i < n and pattern[i] == '^'
+            if negate:
+                i += 1
+            items = []
+            # Like Redis, an unterminated class runs to the end of the pattern
+            while i < n and pattern[i] != ']':
+                if pattern[i] == '\\' and i + 1 < n:
+                    items.append(re.escape(pattern[i + 1]))
+                    i += 2
+                elif i + 2 < n and pattern[i + 1] == '-' and pattern[i + 2] != ']':
+                    low, high = sorted((pattern[i], pattern[i + 2]))
+                    items.append(re.escape(low) + '-' + re.escape(high))
+                    i += 3
+                else:
+                    items.append(re.escape(pattern[i]))
+                    i += 1
+            i += 1
+            if items:
+                out.append(('[^' if negate else '[') + ''.join(items) + ']')
+            else:
+                out.append('.' if negate else '(?!)')
+        else:
+            out.append(re.escape(c))
+    return ''.join(out)
+
+
+@lru_cache(maxsize=256)
+def compile_glob(pattern):
+    """Returns a match(key) -> bool predicate for a glob pattern.
+
+    Patterns are compiled to a regex once and cached, so SCAN pages and
+    repeated KEYS calls with the same pattern skip the translation.
+    """
+    if pattern == '*':
+        return lambda key: True
+    if not any(c in pattern for c in '*?[\\'):
+        return pattern.__eq__
+    return re.compile(_translate(pattern), re.DOTALL).fullmatch
@@ -0,0 +1,256 @@
+import sys
+
+from app.expires import Expires, now_ms
+from app.scanIndex import ScanIndex
+
+# Integer values below this are stored as one shared int object each
+SHARED_INTEGER_COUNT = 10000
+SHARED_INTEGERS = list(range(SHARED_INTEGER_COUNT))
+
+# Longest decimal representation of a signed 64-bit integer
+MAX_INTEGER_LENGTH = 20
+
+# Estimated bytes per key spent by the data dict itself: a table slot
+# (hash, key and value pointers) and its index entry, plus the key's
+# share of the SCAN index: a list slot and a part of its bucket
+KEY_SLOT_SIZE = 56
+INT_SIZE = sys.getsizeof(1 << 40)
+
+# What happens to a key whose TTL has passed. A master deletes it. A
+# replica hides it from reads but keeps it until the master's DEL arrives,
+# and the commands of the master's stream see it as live, like the master
+# did when it sent them.
+EXPIRE_DELETE = 'delete'
+EXPIRE_HIDE = 'hide'
+EXPIRE_IGNORE = 'ignore'
+
+
+def encode_string(value):
+    """Returns the int a string value canonically represents, or the string.
+
+    Only strings that round-trip exactly (no sign on zero, no leading
+    zeros, no spaces) are converted, so GET returns the same bytes that
+    were SET.
+    """
+    if not value or len(value) > MAX_INTEGER_LENGTH:
+        return value
+    digits = value[1:] if value[0] == '-' else value
+    if not digits.isdigit() or not digits.isascii():
+        return value
+    if digits[0] == '0' and (len(digits) > 1 or value[0] == '-'):
+        return value
+    number = int(value)
+    if not -(1 << 63) <= number < (1 << 63):
+        return value
+    if 0 <= number < SHARED_INTEGER_COUNT:
+        return SHARED_INTEGERS[number]
+    return number
+
+
+def is_string(value):
+    return type(value) is str or type(value) is int
+
+
+def type_name(value):
+    """The name TYPE reports for a stored value."""
+    if value is None:
+        return "none"
+    if is_string(value):
+        return "string"
+    return value.type_name
+
+
+def value_memory(value):
+    """Estimated bytes held by a stored value, excluding its key."""
+    if type(value) is int:
+        return 0 if 0 <= value < SHARED_INTEGER_COUNT else INT_SIZE
+    if type(value) is str:
+        return sys.getsizeof(value)
+    return value.memory
+
+
+def key_memory(key, value):
+    """Estimated bytes held by a key, its value and its dict slot."""
+    return KEY_SLOT_SIZE + sys.getsizeof(key) + value_memory(value)
+
+
+def decode_string(value):
+    """Turns a stored string value back into the str a client sees."""
+    if type(value) is int:
+        return str(value)
+    return value
+
+
+class Keyspace:
+    """The dataset: values in one dict, TTLs in a sparse side table.
+
+    ``data`` maps key -> value with no per-key wrapper. String values that
+    are integers are stored as (shared) ints. Only keys with a TTL have an
+    entry in ``expires``. Expired keys are removed lazily when accessed
+    and by active_expire_cycle(); on_expire(key) is called for each.
+    ``expire_mode`` changes that on replicas, see EXPIRE_HIDE.
+
+    ``used_memory`` is the estimated size of the whole dataset, updated
+    on every change; container values report their own size in
+    ``memory`` and whoever grows one in place calls adjust_memory().
+    With an LRU/LFU maxmemory policy, on_access(key) is called for every
+    read and write of a key and ``access`` holds the per-key metadata.
+
+    Keys that clients WATCH get a modification version in ``versions``.
+    touch() bumps it; every other key costs nothing.
+    """
+
+    def __init__(self, on_expire=None):
+        self.data = {}
+        self.expires = Expires()
+        self.on_expire = on_expire
+        self.expire_mode = EXPIRE_DELETE
+        self.used_memory = 0
+        self.access = None
+        self.on_access = None
+        # key -> number of clients watching it, and key -> version
+        self.watchers = {}
+        self.versions = {}
+        # Every key again, bucketed by hash for SCAN
+        self.scan_index = ScanIndex()
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data and not self.expire_if_needed(key)
+
+    def expire_if_needed(self, key):
+        """Returns True if key has expired, deleting it in EXPIRE_DELETE mode."""
+        mode = self.expire_mode
+        expires = self.expires
+        if mode is EXPIRE_IGNORE or key not in expires or not expires.is_expired(key):
+            return False
+        if mode is EXPIRE_DELETE:
+            expires.remove(key)
+            self._expired(key)
+        return True
+
+    def _expired(self, key):
+        value = self.data.pop(key, None)
+        if value is not None:
+            self._forget(key, value)
+        self.touch(key)
+        if self.on_expire is not None:
+            self.on_expire(key)
+
+    def _forget(self, key, value):
+        self.used_memory -= key_memory(key, value)
+        self.scan_index.remove(key)
+        if self.access is not None:
+            self.access.pop(key, None)
+
+    def get(self, key, default=None):
+        """Returns the stored value of key, None if it is missing or expired."""
+        value = self.data.get(key, default)
+        if value is not default:
+            if self.expire_if_needed(key):
+                return default
+            if self.on_access is not None:
+                self.on_access(key)
+        return value
+
+    def peek(self, key):
+        """Like get(), but not counted as an access by the eviction policy."""
+        value = self.data.get(key)
+        if value is not None and self.expire_if_needed(key):
+            return None
+        return value
+
+    def set(self, key, value, expire_at=None, keep_ttl=False):
+        """Stores value under key. expire_at is in unix milliseconds."""
+        old = self.data.get(key)
+        if old is None:
+            self.used_memory += key_memory(key, value)
+            self.scan_index.add(key)
+        else:
+            self.used_memory += value_memory(value) - value_memory(old)
+        self.data[key] = value
+        if self.on_access is not None:
+            self.on_access(key)
+        if expire_at is not None:
+            self.expires.set(key, expire_at)
+        elif not keep_ttl:
+            self.expires.remove(key)
+
+    def set_string(self, key, value, expire_at=None, keep_ttl=False):
+        self.set(key, encode_string(value), expire_at, keep_ttl)
+
+    def delete(self, key):
+        """Removes key. Returns True if a live key was removed."""
+        if key not in self.data:
+            return False
+        live = not self.expire_if_needed(key)
+        # A hidden expired key still goes, as nothing else would remove it
+        if key in self.data:
+            self._forget(key, self.data.pop(key))
+            self.expires.remove(key)
+        return live
+
+    def adjust_memory(self, delta):
+        """Accounts for a value that grew or shrank by delta bytes in place."""
+        self.used_memory += delta
+
+    def get_expire(self, key):
+        return self.expires.get(key)
+
+    def clear(self):
+        """Drops every key, e.g. before loading a master's snapshot."""
+        self.data = {}
+        self.expires = Expires()
+        self.scan_index = ScanIndex()
+        self.used_memory = 0
+        if self.access is not None:
+            self.access.clear()
+        for key in self.watchers:
+            self.touch(key)
+
+    def watch(self, key):
+        """Starts tracking modifications of key. Returns its current version."""
+        self.watchers[key] = self.watchers.get(key, 0) + 1
+        return self.versions.get(key, 0)
+
+    def unwatch(self, key):
+        remaining = self.watchers[key] - 1
+        if remaining:
+            self.watchers[key] = remaining
+        else:
+            del self.watchers[key]
+            self.versions.pop(key, None)
+
+    def version(self, key):
+        return self.versions.get(key, 0)
+
+    def touch(self, key):
+        """Records a modification of key, if anyone is watching it."""
+        if key in self.watchers:
+            self.versions[key] = self.versions.get(key, 0) + 1
+
+    def keys(self):
+        """Returns every live key, dropping the expired ones on the way."""
+        now = now_ms()
+        expires = self.expires
+        if self.expire_mode is EXPIRE_HIDE:
+            return [key for key in self.data if not expires.is_expired(key, now)]
+        if self.expire_mode is EXPIRE_IGNORE:
+            return list(self.data.keys())
+        for key in [key for key in expires.deadlines if expires.is_expired(key, now)]:
+            expires.remove(key)
+            self._expired(key)
+        return list(self.data.keys())
+
+    def scan(self, cursor, count):
+        """Runs one SCAN step. Returns (next_cursor, keys), cursor 0 when done.
+
+        See ScanIndex for how cursors work. Returned keys may have expired;
+        the caller checks. Raises ValueError for a cursor outside 64 bits.
+        """
+        return self.scan_index.scan(cursor, count)
+
+    def active_expire_cycle(self, time_limit_ms):
+        return self.expires.active_expire_cycle(self._expired, time_limit_ms)
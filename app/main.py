@@ -1,33 +1,80 @@
 import socket  # noqa: F401
 import select
-from datetime import datetime, timedelta, MAXYEAR
-import math
+import selectors
+import resource
+import os
+import signal
+from functools import partial
 import time
-from app.redisParser import RedisParser
-from app.rdbReader import RDBParser
+import math
+from decimal import Decimal
+from app.redisParser import RedisParser, SimpleString
+from app.rdbReader import RDBParser, RDBError
+from app.rdbWriter import RDBWriter, save_to_file
+from app.aof import AppendOnlyFile
+from app.replicationBacklog import ReplicationBacklog
+from app.masterLink import MasterLink
+from app.commandTable import CommandTable, CommandError, WRITE, READONLY, BLOCKING, PROPAGATE, DENYOOM
+from app.connection import Connection, OutputBufferLimits
+from app.eventLoop import EventLoop
+from app.blocking import Blocker
+from app.expires import now_ms
+from app.keyspace import (Keyspace, SHARED_INTEGERS, SHARED_INTEGER_COUNT, EXPIRE_HIDE, EXPIRE_IGNORE,
+                          decode_string, encode_string, is_string, type_name)
+from app.globPattern import compile_glob
+from app.eviction import Evictor, NOEVICTION, POLICIES
+from app.stats import SlowLog
+from app.cluster import CLUSTER_SLOTS, SlotMap, fork_workers, key_hash_slot, shard_filename
+from app.datatypes import Hash, List, Set, ZSet, limits
+from app.stream import Stream, StreamIdError, format_id, parse_id, parse_range_bound
 import argparse
-import threading
-from threading import Lock
-
-# Track acknowledgment responses from replicas
-acknowledged_replicas = set()  # A set of replica sockets that have acknowledged
-ack_lock = Lock()  # Lock for thread-safe access
-
-
-
-
-infinite_time = datetime(MAXYEAR - 1, 1, 1, 23, 59, 59, 999999)
-
-class MyCustomException(Exception):
-    pass
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+# Redis log levels and the logging levels they map to
+VERBOSE = 15
+LOG_LEVELS = {'debug': logging.DEBUG, 'verbose': VERBOSE, 'notice': logging.INFO, 'warning': logging.WARNING}
+logging.addLevelName(VERBOSE, 'VERBOSE')
+
+
+def parse_memory_size(value):
+    """Parses sizes like '1024', '64kb', '256mb' or '1gb' into bytes.
+
+    Raises ValueError for anything else, negative sizes included.
+    """
+    value = value.strip().lower()
+    multiplier = 1
+    for suffix, suffix_multiplier in (('gb', 1024 ** 3), ('mb', 1024 ** 2), ('kb', 1024), ('b', 1)):
+        if value.endswith(suffix):
+            value = value[:-len(suffix)]
+            multiplier = suffix_multiplier
+            break
+    size = int(value) * multiplier
+    if size < 0:
+        raise ValueError(f"negative size {value}")
+    return size
+
+def format_memory_size(value):
+    """Formats a byte count the way INFO does: '1.50M'."""
+    for suffix, multiplier in (('G', 1024 ** 3), ('M', 1024 ** 2), ('K', 1024)):
+        if value >= multiplier:
+            return f"{value / multiplier:.2f}{suffix}"
+    return f"{value}B"
+
+def resident_memory():
+    """Resident set size of the process in bytes."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # Peak rather than current, but the best other systems offer
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
 
 def main():
-    # You can use print statements as follows for debugging, they'll be visible when running tests.
-    print("Logs from your program will appear here!")
     # Create an argument parser
     args_parser = argparse.ArgumentParser(description="Parse Redis file arguments")
-    pending_writes = 0  # Track the number of pending write operations
-    pending_writes_lock = Lock()  # Lock for thread-safe updates
 
     # Define arguments
     args_parser.add_argument(
@@ -58,499 +105,1942 @@ def main():
         help="Number of port"
     )
 
+    args_parser.add_argument(
+        '--client-output-buffer-limit',
+        type=str,
+        required=False,
+        help="Hard limit, soft limit and soft seconds for client output buffers, e.g. '256mb 64mb 60'"
+    )
+
+    args_parser.add_argument(
+        '--rdbchecksum',
+        type=str,
+        choices=['yes', 'no'],
+        default='yes',
+        help="Verify the CRC64 checksum of the RDB file on load"
+    )
+
+    args_parser.add_argument(
+        '--appendonly',
+        type=str,
+        choices=['yes', 'no'],
+        default='no',
+        help="Log every write to the append-only file and load it on startup"
+    )
+
+    args_parser.add_argument(
+        '--appendfilename',
+        type=str,
+        default='appendonly.aof',
+        help="Name of the append-only file"
+    )
+
+    args_parser.add_argument(
+        '--appendfsync',
+        type=str,
+        choices=['always', 'everysec', 'no'],
+        default='everysec',
+        help="When the append-only file is fsync'd"
+    )
+
+    args_parser.add_argument(
+        '--repl-backlog-size',
+        type=str,
+        default='1mb',
+        help="Size of the replication backlog kept for partial resynchronization"
+    )
+
+    args_parser.add_argument(
+        '--maxmemory',
+        type=str,
+        default='0',
+        help="Memory limit for the dataset, e.g. '100mb'; 0 means no limit"
+    )
+
+    args_parser.add_argument(
+        '--maxmemory-policy',
+        type=str,
+        choices=POLICIES,
+        default=NOEVICTION,
+        help="How keys are chosen for eviction when maxmemory is reached"
+    )
+
+    args_parser.add_argument(
+        '--loglevel',
+        type=str,
+        choices=list(LOG_LEVELS),
+        default='notice',
+        help="Least important kind of message that is logged"
+    )
+
+    args_parser.add_argument(
+        '--slowlog-log-slower-than',
+        type=int,
+        default=10000,
+        help="Microseconds a command must take to enter the slow log; negative disables it"
+    )
+
+    args_parser.add_argument(
+        '--slowlog-max-len',
+        type=int,
+        default=128,
+        help="Number of slow log entries kept"
+    )
+
+    args_parser.add_argument(
+        '--shards',
+        type=int,
+        default=1,
+        help="Number of worker processes, each owning a range of the cluster hash slots"
+    )
+
+    # --hash-max-listpack-entries and the other compact encoding limits
+    for name, default in vars(limits).items():
+        args_parser.add_argument(
+            f"--{name.replace('_', '-')}",
+            type=int,
+            default=default,
+            help="Size up to which collections keep their compact encoding"
+        )
+
     # Parse the arguments
     args = args_parser.parse_args()
 
+    logging.basicConfig(level=LOG_LEVELS[args.loglevel], stream=sys.stdout,
+                        format="%(process)d %(asctime)s.%(msecs)03d %(levelname)s %(message)s",
+                        datefmt="%d %b %Y %H:%M:%S")
+
     # Access the arguments
+    for name in vars(limits):
+        setattr(limits, name, getattr(args, name))
     directory = args.dir
     dbfilename = args.dbfilename
     port_number = args.port
     replicaOption = args.replicaof
+    output_buffer_limit = args.client_output_buffer_limit
+    rdbchecksum = args.rdbchecksum == 'yes'
+    appendonly = args.appendonly == 'yes'
     master_host = None
     master_port = None
+    master_link = None
+    master_client = None
     current_role = "master"
-    replication_id = "8371b4fb1155b71f4a04d3e1bc3e18c4a990aeeb"
-    replication_offset = 0
+    replication_id = os.urandom(20).hex()
 
     
-    print(f"Directory: {directory}")
-    print(f"DB Filename: {dbfilename}")
+    logger.debug(f"Directory: {directory}")
+    logger.debug(f"DB Filename: {dbfilename}")
 
-    directory = "x" if directory is None else directory
-    dbfilename = "x" if dbfilename is None else dbfilename
+    directory = os.getcwd() if directory is None else directory
+    dbfilename = "dump.rdb" if dbfilename is None else dbfilename
     port_number = 6379 if port_number is None else port_number
+    output_buffer_limit = "256mb 64mb 60" if output_buffer_limit is None else output_buffer_limit
+    hard_limit, soft_limit, soft_seconds = output_buffer_limit.split()
+    output_limits = OutputBufferLimits(parse_memory_size(hard_limit), parse_memory_size(soft_limit), int(soft_seconds))
+
+    # With --shards N the process forks N workers that behave like the
+    # masters of a Redis Cluster: worker i listens on port + i, serves one
+    # range of the hash slots and keeps its own data files. Keys of other
+    # workers are answered with MOVED.
+    shard_index = None
+    slot_map = None
+    if args.shards > 1:
+        if replicaOption is not None:
+            logger.error("--shards can't be combined with --replicaof")
+            sys.exit(1)
+        node_ids = [os.urandom(20).hex() for _ in range(args.shards)]
+        shard_index = fork_workers(args.shards)
+        slot_map = SlotMap("127.0.0.1", port_number, node_ids)
+        port_number += shard_index
+        dbfilename = shard_filename(dbfilename, shard_index)
+        args.appendfilename = shard_filename(args.appendfilename, shard_index)
+        replication_id = os.urandom(20).hex()
+        logger.info(f"Shard worker {shard_index} on port {port_number}, slots "
+              f"{slot_map.starts[shard_index]}-{slot_map.ends[shard_index]}")
 
     parser = RedisParser()
     replicas = []
-    clients = {}
-    database = {}
-    streams = {}
-    new_xadd = False
-    multi_queue = {}
-
-
-
-    def handle_replica(master_host, master_port):
-        """
-        Connects the replica to the master and sends periodic PING commands.
-        """
-
-        replica_bytecount = -999999
-
+    # Tail of everything sent to the replicas, replayed on partial resync
+    backlog = ReplicationBacklog(parse_memory_size(args.repl_backlog_size))
+    # Replication stream produced during the current event-loop iteration
+    replication_buffer = bytearray()
+    # Set by WAIT: ask every replica for its offset at the end of the iteration
+    ack_requested = False
+    # Blocker key WAIT clients are parked on, signalled by every REPLCONF ACK
+    REPLICA_ACKS = "replica acks"
+    clients_pending_write = set()
+    keyspace = Keyspace()
+    slowlog = SlowLog(args.slowlog_log_slower_than, args.slowlog_max_len)
+    try:
+        maxmemory = parse_memory_size(args.maxmemory)
+    except ValueError:
+        logger.error(f"Invalid --maxmemory '{args.maxmemory}'")
+        sys.exit(1)
+    evictor = Evictor(keyspace, maxmemory, args.maxmemory_policy)
+    event_loop = EventLoop()
+    # Clients parked by XREAD BLOCK until their stream gets a new entry
+    blocker = Blocker(event_loop, lambda client, reply: resume_client(client, reply))
+    command_table = CommandTable()
+
+    WRONGTYPE = "WRONGTYPE Operation against a key holding the wrong kind of value"
+
+    # Replies with no value of their own, e.g. when a blocked client is answered later
+    NO_REPLY = object()
+
+    # Forked children still running: pid -> on_exit(succeeded)
+    children = {}
+    bgsave_child = None
+    lastsave = int(time.time())
+
+    # Opened after the dataset is loaded when --appendonly is yes
+    aof = None
+    aof_rewrite_child = None
+    # True while the AOF is replayed, so replayed commands are not logged again
+    loading = False
+
+    def check_command(command, content):
+        """Returns the error for a call that cannot run at all, else None."""
+        if command is None:
+            return CommandError(f"ERR unknown command '{content[0]}'")
+        if not command.check_arity(len(content)):
+            return CommandError(f"ERR wrong number of arguments for '{command.name}' command")
+        return None
+
+    def check_slot(command, content):
+        """Returns the redirection for a call whose keys this shard worker
+        doesn't own, else None. Every key of a call has to hash to the
+        same slot."""
+        keys = command.keys(content)
+        if not keys:
+            return None
+        slot = key_hash_slot(keys[0])
+        for key in keys[1:]:
+            if key_hash_slot(key) != slot:
+                return CommandError("CROSSSLOT Keys in request don't hash to the same slot")
+        owner = slot_map.owner(slot)
+        if owner != shard_index:
+            host, port = slot_map.address(owner)
+            return CommandError(f"MOVED {slot} {host}:{port}")
+        return None
+
+    def execute(client, content):
+        """Runs one parsed command through the command table and returns its reply."""
+        command = command_table.lookup(content[0])
+        error = check_command(command, content)
+        if error is not None:
+            if command is not None:
+                command.rejected_calls += 1
+            return error
+
+        # Replicas leave eviction to their master, like they do expiry
+        if evictor.maxmemory and not loading and current_role == "master":
+            if not evictor.free_memory() and command.denyoom:
+                command.rejected_calls += 1
+                return CommandError("OOM command not allowed when used memory > 'maxmemory'.")
+
+        started = time.perf_counter_ns()
         try:
-            # Create a socket connection to the master
-            master_socket = socket.create_connection((master_host, master_port))
-            
-            print(f"Connected to master at {master_host}:{master_port}")
-
-            # Send initial PING
-            master_socket.sendall(b"*1\r\n$4\r\nPING\r\n")
-            response = master_socket.recv(1024)
-            print(f"Response from master: {response.decode().strip()}")
-
-            master_socket.sendall(str.encode(parser.to_resp_array(['REPLCONF', 'listening-port', str(port_number)])))
-            response = master_socket.recv(1024)
-            print(f"Response from master: {response.decode().strip()}")
-
-            master_socket.sendall(str.encode(parser.to_resp_array(['REPLCONF', 'capa', 'psync2'])))
-            response = master_socket.recv(1024)
-            print(f"Response from master: {response.decode().strip()}")
-
-            master_socket.sendall(str.encode(parser.to_resp_array(['PSYNC', '?', '-1'])))
-            """ response = master_socket.recv(1024)
-            print(f"Response from master: {response}") """
-
-
-
-            while True:
-                try:
-                    # Read data from the master
-                    data = master_socket.recv(1024)
-                    if not data:
-                        print("Master disconnected.")
-                        break
-                    print(f"Received from master: {data}")
-
-                    commands = parser.parse(data)
-                    for content in commands:
-
-                        # Process write commands (e.g., SET, DEL)
-                        if content[0].lower() == "set":
-                            key, value = content[1], content[2]
-                            expire_time = infinite_time
-                            if len(content) == 5 and content[3].lower() == "px":
-                                expire_time = datetime.now() + timedelta(milliseconds=int(content[4]))
-                            database[key] = [value, expire_time]
-                        elif content[0].lower() == "del":
-                            key = content[1]
-                            if key in database:
-                                del database[key]
-                        elif content[0].lower() == 'replconf':
-                            if content[1].lower() == 'getack':
-                                if (replica_bytecount < 0):
-                                    replica_bytecount = 0
-                                master_socket.sendall(str.encode(parser.to_resp_array(['REPLCONF', 'ACK', str(replica_bytecount)])))
-                        replica_bytecount += len(str.encode(parser.to_resp_array(content)))
-
-                        # Ignore other commands silently
-                except Exception as e:
-                    print(f"Error processing command from master: {e}")
-
-
-            """ # Periodically send PING commands
-            while True:
-                # Send PING command every 10 seconds
-                threading.Event().wait(10)
-                master_socket.sendall(b"*1\r\n$4\r\nPING\r\n")
-                response = master_socket.recv(1024)
-                print(f"Response from master: {response.decode().strip()}") """
-
+            reply = command.handler(client, content)
+            failed = False
+        except CommandError as e:
+            reply = e
+            failed = True
         except Exception as e:
-            print(f"Error connecting to master: {e}")
+            # A bug in one command must not take the whole server down
+            logger.exception(f"Unexpected error running {content}")
+            reply = CommandError(f"ERR internal error running '{command.name}': {e}")
+            failed = True
+        usec = (time.perf_counter_ns() - started) // 1000
+        command.calls += 1
+        command.usec += usec
+        command.latency.record(usec)
+        slowlog.record(content, usec, client.address)
+        if failed:
+            command.failed_calls += 1
+            return reply
+
+        if command.is_write and keyspace.watchers:
+            # Bump the version of watched keys so their transactions abort
+            for key in command.keys(content):
+                keyspace.touch(key)
+        if command.propagate:
+            propagate(content)
+            # WAIT waits for the replicas to get this far
+            client.write_offset = master_repl_offset()
+        return reply
+
+    def propagate(content):
+        # Propagate the command to the AOF and the replicas. Commands
+        # replayed from the AOF at startup are history, not new writes.
+        if loading:
+            return
+        resp_command = parser.to_resp_array(content)
+        if aof is not None:
+            feed_append_only_file(content, resp_command)
+        replicate(resp_command)
+
+    def replicate(resp_command):
+        # Everything sent to the replicas goes through the backlog so the
+        # master offset counts exactly the bytes a replica has to process
+        replication_buffer.extend(resp_command)
+
+    def flush_replication():
+        """Hands this iteration's stream to the backlog and, as one chunk, to
+        every replica's output buffer. The event loop writes it out with the
+        client replies, so a slow replica only grows its own buffer."""
+        nonlocal ack_requested
+        if ack_requested:
+            # One GETACK answers every WAIT issued during this iteration
+            ack_requested = False
+            replicate(parser.to_resp_array(['REPLCONF', 'GETACK', '*']))
+        if not replication_buffer:
+            return
+        data = bytes(replication_buffer)
+        replication_buffer.clear()
+        backlog.append(data)
+        for replica in replicas:
+            replica.send(data)
+
+    def master_repl_offset():
+        return backlog.offset + len(replication_buffer)
+
+    def feed_append_only_file(content, resp_command):
+        # A relative TTL would restart on every reload, so log the deadline
+        if len(content) > 3 and content[0].lower() == 'set':
+            expire_at = keyspace.get_expire(content[1])
+            content = content[:3] if expire_at is None else content[:3] + ['PXAT', str(expire_at)]
+            resp_command = parser.to_resp_array(content)
+        aof.feed(resp_command)
+
+    def flush_append_only_file():
+        if aof is not None:
+            aof.flush()
+
+    def propagate_expired_key(key):
+        # Only a master deletes expired keys. Replicas keep them, hidden
+        # from reads, until this DEL reaches them.
+        propagate(['DEL', key])
+
+    keyspace.on_expire = propagate_expired_key
+
+    def propagate_evicted_key(key):
+        keyspace.touch(key)
+        propagate(['DEL', key])
+
+    evictor.on_evict = propagate_evicted_key
+
+    def active_expire_cycle():
+        # Spend at most a quarter of each 100 ms period reclaiming expired keys
+        if current_role == "master":
+            keyspace.active_expire_cycle(25)
+
+    def load_master_snapshot(payload):
+        """Replaces the dataset with the RDB the master sent on full resync."""
+        keyspace.clear()
+        loaded = RDBParser(None, verify_checksum=rdbchecksum).load_buffer(keyspace, payload)
+        logger.info(f"Loaded {loaded} keys ({len(payload)} bytes) from the master")
+
+    def apply_master_command(content):
+        # The master's stream runs like client input, but nobody reads the
+        # replies. Its commands see keys that expired here as live.
+        keyspace.expire_mode = EXPIRE_IGNORE
+        try:
+            dispatch(master_client, content)
+        finally:
+            keyspace.expire_mode = EXPIRE_HIDE
 
-    def handle_xread(notified_socket, content):
-        print("EXECUTING XADD NOW")
+    def xread_reply(keys, ids, count):
         result = []
-        total_pairs = int((len(content) - 2) / 2)
-        for i in range(total_pairs):
-            key_name = content[2 + i]
-            start_time = [int(x) for x in content[2 + total_pairs + i].split('-')]
-            cur_result = []
-
-            print(f"XADD START TIMES : {start_time}")
-            
-            key_seconds = [x for x in list(streams[key_name].keys()) if ((int(x.split('-')[0]) > start_time[0]) or ((int(x.split('-')[0]) == start_time[0] and int(x.split('-')[1]) > start_time[1])))]
-
-            for second in key_seconds:
-                key_value = []
-                for key, value in streams[key_name][second].items():
-                    key_value.append(key)
-                    key_value.append(value)
-                cur_result.append([second, key_value])
-
-            if len(cur_result) > 0:
-                result.append([key_name, cur_result])
-        
-
-        nonlocal new_xadd
-        new_xadd = False
+        for key_name, last_id in zip(keys, ids):
+            stream = get_stream(key_name)
+            if stream is None:
+                continue
+            entries = stream.read_after(last_id, count)
+            if entries:
+                result.append([key_name, entries])
 
         if len(result):
-            notified_socket.sendall(str.encode(parser.to_resp_array(result)))
+            return result
+        return None
+
+    @command_table.register('ping', -1)
+    def handle_ping(client, content):
+        return parser.PONG
+
+    @command_table.register('echo', 2)
+    def handle_echo(client, content):
+        return content[1]
+
+    @command_table.register('set', -3, (WRITE, PROPAGATE, DENYOOM), 1)
+    def handle_set(client, content):
+        key = content[1]
+        expire_time = None
+        keep_ttl = False
+        i = 3
+        while i < len(content):
+            option = content[i].lower()
+            if option == 'keepttl' and expire_time is None:
+                keep_ttl = True
+                i += 1
+            elif option in ('px', 'ex', 'pxat', 'exat') and keep_ttl:
+                raise CommandError("ERR syntax error")
+            elif option in ('px', 'ex', 'pxat', 'exat') and i + 1 < len(content):
+                try:
+                    ttl = int(content[i + 1])
+                except ValueError:
+                    raise CommandError("ERR value is not an integer or out of range")
+                if ttl <= 0:
+                    raise CommandError("ERR invalid expire time in 'set' command")
+                if option in ('ex', 'exat'):
+                    ttl *= 1000
+                expire_time = ttl if option.endswith('at') else now_ms() + ttl
+                # Deadlines are stored, saved and propagated as signed 64-bit milliseconds
+                if expire_time >= 1 << 63:
+                    raise CommandError("ERR invalid expire time in 'set' command")
+                i += 2
+            else:
+                raise CommandError("ERR syntax error")
+        keyspace.set_string(key, content[2], expire_time, keep_ttl)
+        return parser.OK
+
+    @command_table.register('get', 2, (READONLY,), 1)
+    def handle_get(client, content):
+        keyName = content[1]
+        value = keyspace.get(keyName)
+        if value is not None and not is_string(value):
+            raise CommandError(WRONGTYPE)
+        return decode_string(value)
+
+    @command_table.register('mget', -2, (READONLY,), 1, -1)
+    def handle_mget(client, content):
+        # Keys holding other types read as missing, like in Redis
+        values = []
+        for key in content[1:]:
+            value = keyspace.get(key)
+            values.append(decode_string(value) if value is not None and is_string(value) else None)
+        return values
+
+    @command_table.register('mset', -3, (WRITE, PROPAGATE, DENYOOM), 1, -1, 2)
+    def handle_mset(client, content):
+        if len(content) % 2 == 0:
+            raise CommandError("ERR wrong number of arguments for 'mset' command")
+        for i in range(1, len(content), 2):
+            keyspace.set_string(content[i], content[i + 1])
+        return parser.OK
+
+    @command_table.register('msetnx', -3, (WRITE, PROPAGATE, DENYOOM), 1, -1, 2)
+    def handle_msetnx(client, content):
+        if len(content) % 2 == 0:
+            raise CommandError("ERR wrong number of arguments for 'msetnx' command")
+        if any(content[i] in keyspace for i in range(1, len(content), 2)):
+            return 0
+        for i in range(1, len(content), 2):
+            keyspace.set_string(content[i], content[i + 1])
+        return 1
+
+    @command_table.register('del', -2, (WRITE, PROPAGATE), 1, -1)
+    def handle_del(client, content):
+        return sum(keyspace.delete(key) for key in content[1:])
+
+    # Values are freed by reference counting as soon as they are dropped,
+    # there is nothing to hand to a background thread
+    command_table.register('unlink', -2, (WRITE, PROPAGATE), 1, -1)(handle_del)
+
+    @command_table.register('exists', -2, (READONLY,), 1, -1)
+    def handle_exists(client, content):
+        return sum(key in keyspace for key in content[1:])
+
+    def parse_integer(text):
+        # Only canonical decimal integers, like Redis' string2ll
+        number = encode_string(text)
+        if type(number) is not int:
+            raise CommandError("ERR value is not an integer or out of range")
+        return number
+
+    def increment(key, delta):
+        value = keyspace.get(key)
+        if value is None:
+            value = 0
+        elif not is_string(value):
+            raise CommandError(WRONGTYPE)
+        elif type(value) is not int:
+            raise CommandError("ERR value is not an integer or out of range")
+        value += delta
+        if not -(1 << 63) <= value < (1 << 63):
+            raise CommandError("ERR increment or decrement would overflow")
+        # Counters stay ints, small ones shared, and never go through str
+        keyspace.set(key, SHARED_INTEGERS[value] if 0 <= value < SHARED_INTEGER_COUNT else value,
+                     keep_ttl=True)
+        return value
+
+    @command_table.register('incr', 2, (WRITE, PROPAGATE, DENYOOM), 1)
+    def handle_incr(client, content):
+        return increment(content[1], 1)
+
+    @command_table.register('decr', 2, (WRITE, PROPAGATE, DENYOOM), 1)
+    def handle_decr(client, content):
+        return increment(content[1], -1)
+
+    @command_table.register('incrby', 3, (WRITE, PROPAGATE, DENYOOM), 1)
+    def handle_incrby(client, content):
+        return increment(content[1], parse_integer(content[2]))
+
+    @command_table.register('decrby', 3, (WRITE, PROPAGATE, DENYOOM), 1)
+    def handle_decrby(client, content):
+        delta = parse_integer(content[2])
+        if delta == -(1 << 63):
+            raise CommandError("ERR decrement would overflow")
+        return increment(content[1], -delta)
+
+    def parse_float(text):
+        try:
+            number = float(text)
+        except ValueError:
+            return None
+        # float() also takes forms Redis refuses, such as ' 1' and 'nan'
+        if math.isnan(number) or text != text.strip() or '_' in text:
+            return None
+        return number
+
+    def format_float(number):
+        """Formats like Redis' INCRBYFLOAT: plain notation, no trailing zeros."""
+        text = format(Decimal(repr(number)), 'f')
+        if '.' in text:
+            text = text.rstrip('0').rstrip('.')
+        return text
+
+    @command_table.register('incrbyfloat', 3, (WRITE, PROPAGATE, DENYOOM), 1)
+    def handle_incrbyfloat(client, content):
+        key = content[1]
+        value = keyspace.get(key)
+        if value is not None and not is_string(value):
+            raise CommandError(WRONGTYPE)
+        current = 0.0 if value is None else parse_float(decode_string(value))
+        if current is None:
+            raise CommandError("ERR value is not a valid float")
+        delta = parse_float(content[2])
+        if delta is None:
+            raise CommandError("ERR value is not a valid float")
+        result = current + delta
+        if math.isinf(result) or math.isnan(result):
+            raise CommandError("ERR increment would produce NaN or Infinity")
+        text = format_float(result)
+        keyspace.set_string(key, text, keep_ttl=True)
+        # Replicas and the AOF get the result, float addition may differ there
+        content[:] = ['SET', key, text, 'KEEPTTL']
+        return text
+
+    @command_table.register('config', -2)
+    def handle_config(client, content):
+        subcommand = content[1].lower()
+        if subcommand == 'get' and len(content) == 3:
+            parameter = content[2].lower()
+            if parameter == 'dir':
+                return ['dir', directory]
+            elif parameter == 'dbfilename':
+                return ['dbfilename', dbfilename]
+            elif parameter == 'maxmemory':
+                return ['maxmemory', str(evictor.maxmemory)]
+            elif parameter == 'maxmemory-policy':
+                return ['maxmemory-policy', evictor.policy]
+            elif parameter == 'loglevel':
+                level = logging.getLogger().level
+                return ['loglevel', next(name for name, value in LOG_LEVELS.items() if value == level)]
+            elif parameter == 'slowlog-log-slower-than':
+                return ['slowlog-log-slower-than', str(slowlog.slower_than)]
+            elif parameter == 'slowlog-max-len':
+                return ['slowlog-max-len', str(slowlog.entries.maxlen)]
+            elif parameter.replace('-', '_') in vars(limits):
+                return [parameter, str(getattr(limits, parameter.replace('-', '_')))]
+            return []
+        if subcommand == 'resetstat' and len(content) == 2:
+            for command in command_table.all():
+                command.reset_stats()
+            evictor.evicted_keys = 0
+            return parser.OK
+        if subcommand == 'set' and len(content) == 4:
+            parameter = content[2].lower()
+            value = content[3]
+            if parameter == 'maxmemory':
+                try:
+                    evictor.maxmemory = parse_memory_size(value)
+                except ValueError:
+                    raise CommandError(f"ERR Invalid argument '{value}' for CONFIG SET 'maxmemory'")
+                if current_role == "master":
+                    evictor.free_memory()
+                return parser.OK
+            if parameter == 'maxmemory-policy':
+                if value.lower() not in POLICIES:
+                    raise CommandError(f"ERR Invalid argument '{value}' for CONFIG SET 'maxmemory-policy'")
+                evictor.set_policy(value.lower())
+                return parser.OK
+            if parameter == 'loglevel':
+                if value.lower() not in LOG_LEVELS:
+                    raise CommandError(f"ERR Invalid argument '{value}' for CONFIG SET 'loglevel'")
+                logging.getLogger().setLevel(LOG_LEVELS[value.lower()])
+                return parser.OK
+            if parameter in ('slowlog-log-slower-than', 'slowlog-max-len'):
+                try:
+                    number = int(value)
+                except ValueError:
+                    raise CommandError(f"ERR Invalid argument '{value}' for CONFIG SET '{parameter}'")
+                if parameter == 'slowlog-log-slower-than':
+                    slowlog.slower_than = number
+                elif number < 0:
+                    raise CommandError(f"ERR Invalid argument '{value}' for CONFIG SET '{parameter}'")
+                else:
+                    slowlog.set_max_len(number)
+                return parser.OK
+            if parameter.replace('-', '_') in vars(limits):
+                # Values already stored only convert when they next grow
+                try:
+                    number = int(value)
+                except ValueError:
+                    number = -1
+                if number < 0:
+                    raise CommandError(f"ERR Invalid argument '{value}' for CONFIG SET '{parameter}'")
+                setattr(limits, parameter.replace('-', '_'), number)
+                return parser.OK
+            raise CommandError(f"ERR Unknown option or number of arguments for CONFIG SET - '{content[2]}'")
+        raise CommandError(f"ERR unknown subcommand or wrong number of arguments for '{content[1]}'")
+
+    @command_table.register('keys', 2, (READONLY,))
+    def handle_keys(client, content):
+        matches = compile_glob(content[1])
+        return [key for key in keyspace.keys() if matches(key)]
+
+    @command_table.register('scan', -2, (READONLY,))
+    def handle_scan(client, content):
+        try:
+            cursor = int(content[1])
+        except ValueError:
+            raise CommandError("ERR invalid cursor")
+        matches = None
+        type_filter = None
+        count = 10
+        i = 2
+        while i < len(content):
+            option = content[i].lower()
+            if i + 1 >= len(content):
+                raise CommandError("ERR syntax error")
+            if option == 'match':
+                matches = compile_glob(content[i + 1])
+            elif option == 'count':
+                try:
+                    count = int(content[i + 1])
+                except ValueError:
+                    raise CommandError("ERR value is not an integer or out of range")
+                if count < 1:
+                    raise CommandError("ERR syntax error")
+            elif option == 'type':
+                type_filter = content[i + 1].lower()
+            else:
+                raise CommandError("ERR syntax error")
+            i += 2
+        if cursor < 0:
+            raise CommandError("ERR invalid cursor")
+        try:
+            cursor, candidates = keyspace.scan(cursor, count)
+        except ValueError:
+            raise CommandError("ERR invalid cursor")
+
+        found = []
+        for key in candidates:
+            # Looking at a key for SCAN is not an access for LRU or LFU
+            value = keyspace.peek(key)
+            if value is None:
+                continue
+            if matches is not None and not matches(key):
+                continue
+            if type_filter is not None and type_name(value) != type_filter:
+                continue
+            found.append(key)
+        return [str(cursor), found]
+
+    @command_table.register('info', -1)
+    def handle_info(client, content):
+        if len(content) > 1 and content[1].lower() == 'replication':
+            response = "role:" + current_role + "\n"
+            if (current_role == "master"):
+                response += "master_replid:" + replication_id + "\n"
+                response += "connected_slaves:" + str(len(replicas)) + "\n"
+                now = time.monotonic()
+                for index, replica in enumerate(replicas):
+                    state = "wait_bgsave" if replica.sync_child is not None else "online"
+                    lag = int(now - replica.repl_ack_time) if replica.repl_ack_time is not None else -1
+                    response += (f"slave{index}:ip={replica.address[0]},port={replica.listening_port},"
+                                 f"state={state},offset={replica.repl_ack_offset},lag={lag}\n")
+                response += "master_repl_offset:" + str(master_repl_offset()) + "\n"
+                response += "repl_backlog_active:1\n"
+                response += "repl_backlog_size:" + str(backlog.size) + "\n"
+                response += "repl_backlog_first_byte_offset:" + str(backlog.first_offset()) + "\n"
+                response += "repl_backlog_histlen:" + str(backlog.histlen) + "\n"
+            else:
+                response += "master_host:" + master_host + "\n"
+                response += "master_port:" + str(master_port) + "\n"
+                response += "master_link_status:" + ("up" if master_link.state == "connected" else "down") + "\n"
+                response += "slave_repl_offset:" + str(master_link.offset) + "\n"
+            return response
+        if len(content) > 1 and content[1].lower() == 'memory':
+            return (f"# Memory\n"
+                    f"used_memory:{keyspace.used_memory}\n"
+                    f"used_memory_human:{format_memory_size(keyspace.used_memory)}\n"
+                    f"used_memory_rss:{resident_memory()}\n"
+                    f"maxmemory:{evictor.maxmemory}\n"
+                    f"maxmemory_human:{format_memory_size(evictor.maxmemory)}\n"
+                    f"maxmemory_policy:{evictor.policy}\n"
+                    f"evicted_keys:{evictor.evicted_keys}\n")
+        if len(content) > 1 and content[1].lower() == 'commandstats':
+            response = "# Commandstats\n"
+            for command in command_table.all():
+                if command.calls or command.rejected_calls:
+                    per_call = command.usec / command.calls if command.calls else 0
+                    response += (f"cmdstat_{command.name}:calls={command.calls},usec={command.usec},"
+                                 f"usec_per_call={per_call:.2f},rejected_calls={command.rejected_calls},"
+                                 f"failed_calls={command.failed_calls}\n")
+            return response
+        if len(content) > 1 and content[1].lower() == 'latencystats':
+            response = "# Latencystats\n"
+            for command in command_table.all():
+                latency = command.latency
+                if latency.total:
+                    response += (f"latency_percentiles_usec_{command.name}:p50={latency.percentile(0.5)},"
+                                 f"p99={latency.percentile(0.99)},p99.9={latency.percentile(0.999)}\n")
+            return response
+        return ""
+
+    @command_table.register('latency', -2)
+    def handle_latency(client, content):
+        if content[1].lower() != 'histogram':
+            raise CommandError(f"ERR unknown subcommand '{content[1]}'. Try LATENCY HELP.")
+        if len(content) > 2:
+            commands = [command_table.lookup(name) for name in content[2:]]
+            commands = [command for command in commands if command is not None]
         else:
-            notified_socket.sendall(str.encode(parser.to_resp_null()))
-
-    def check_xadd_flag(notified_socket, content):
-        nonlocal new_xadd
-        while not new_xadd:
-            time.sleep(0.1)  # Avoid busy-waiting
-        handle_xread(notified_socket, content)
+            commands = command_table.all()
+        reply = []
+        for command in commands:
+            if command.latency.total:
+                reply += [command.name, ['calls', command.latency.total,
+                                         'histogram_usec', command.latency.cumulative()]]
+        return reply
+
+    @command_table.register('slowlog', -2)
+    def handle_slowlog(client, content):
+        subcommand = content[1].lower()
+        if subcommand == 'get' and len(content) <= 3:
+            count = 10
+            if len(content) == 3:
+                try:
+                    count = int(content[2])
+                except ValueError:
+                    raise CommandError("ERR value is not an integer or out of range")
+                if count < -1:
+                    raise CommandError("ERR count should be greater than or equal to -1")
+            return slowlog.get(count)
+        if subcommand == 'len' and len(content) == 2:
+            return len(slowlog)
+        if subcommand == 'reset' and len(content) == 2:
+            slowlog.reset()
+            return parser.OK
+        raise CommandError(f"ERR unknown subcommand or wrong number of arguments for '{content[1]}'. Try SLOWLOG HELP.")
+
+    @command_table.register('cluster', -2)
+    def handle_cluster(client, content):
+        if slot_map is None:
+            raise CommandError("ERR This instance has cluster support disabled")
+        subcommand = content[1].lower()
+        if subcommand == 'slots':
+            return slot_map.slots_reply()
+        if subcommand == 'nodes':
+            return slot_map.nodes_reply(shard_index)
+        if subcommand == 'myid':
+            return slot_map.node_ids[shard_index]
+        if subcommand == 'keyslot' and len(content) == 3:
+            return key_hash_slot(content[2])
+        if subcommand == 'info':
+            return (f"cluster_enabled:1\r\ncluster_state:ok\r\ncluster_slots_assigned:{CLUSTER_SLOTS}\r\n"
+                    f"cluster_slots_ok:{CLUSTER_SLOTS}\r\ncluster_known_nodes:{len(slot_map)}\r\n"
+                    f"cluster_size:{len(slot_map)}\r\n")
+        raise CommandError(f"ERR unknown subcommand '{content[1]}'. Try CLUSTER HELP.")
+
+    @command_table.register('type', 2, (READONLY,), 1)
+    def handle_type(client, content):
+        return SimpleString(type_name(keyspace.get(content[1])))
+
+    @command_table.register('replconf', -2)
+    def handle_replconf(client, content):
+        option = content[1].lower()
+        if option == 'ack':
+            # ACKs are never answered, a reply would land in the replica's
+            # stream; like Redis, a malformed one is silently ignored
+            offset = encode_string(content[2]) if len(content) > 2 else None
+            if type(offset) is int:
+                client.repl_ack_offset = offset
+                client.repl_ack_time = time.monotonic()
+                blocker.signal_key(REPLICA_ACKS)
+            return NO_REPLY
+        # Options come in name value pairs
+        if len(content) % 2 == 0:
+            raise CommandError("ERR syntax error")
+        if option == 'listening-port':
+            client.listening_port = parse_integer(content[2])
+        elif option == 'capa':
+            client.capabilities.update(capa.lower() for capa in content[2::2])
+        return parser.OK
+
+    @command_table.register('psync', 3)
+    def handle_psync(client, content):
+        try:
+            psync_offset = int(content[2])
+        except ValueError:
+            psync_offset = -1
+        # The stream so far belongs to the backlog, not to the new replica
+        flush_replication()
+        replicas.append(client)
+        logger.info(f"Appended slave with port number {client.listening_port}")
+
+        if content[1] == replication_id and backlog.covers(psync_offset):
+            # Partial resync: the replica only needs what it missed
+            if 'psync2' in client.capabilities:
+                client.send(parser.to_resp_simple_string(f"CONTINUE {replication_id}"))
+            else:
+                client.send(parser.to_resp_simple_string("CONTINUE"))
+            client.send(backlog.read_from(psync_offset))
+            logger.info(f"Partial resynchronization of replica {client.address}, "
+                  f"{backlog.offset + 1 - psync_offset} bytes of backlog sent")
+            return NO_REPLY
+
+        client.send(parser.to_resp_simple_string(f"FULLRESYNC {replication_id} {backlog.offset}"))
+        # The child inherits the FULLRESYNC line in the output buffer and
+        # sends it ahead of the snapshot; commands propagated meanwhile
+        # wait in the parent's copy of the buffer.
+        pid = fork_child(partial(send_snapshot, client), partial(snapshot_sent, client))
+        client.write_buffer.clear()
+        client.sync_child = pid
+        return NO_REPLY
+
+    def send_snapshot(client):
+        """Runs in the child: writes the dataset straight to the replica's socket."""
+        sock = client.sock
+
+        def send_all(data):
+            view = memoryview(data)
+            while view:
+                try:
+                    sent = sock.send(view)
+                except BlockingIOError:
+                    select.select([], [sock], [])
+                    continue
+                view = view[sent:]
+
+        send_all(client.write_buffer)
+        if 'eof' in client.capabilities:
+            # Diskless: the size is not known up front, so the payload is
+            # delimited by a random mark instead of a length
+            mark = os.urandom(20).hex().encode()
+            send_all(b"$EOF:" + mark + b"\r\n")
+            RDBWriter(send_all, rdbchecksum).save(keyspace)
+            send_all(mark)
+        else:
+            payload = bytearray()
+            RDBWriter(payload.extend, rdbchecksum).save(keyspace)
+            send_all(b"$%d\r\n" % len(payload))
+            send_all(payload)
+
+    def snapshot_sent(client, succeeded):
+        client.sync_child = None
+        if client.closed:
+            return
+        if not succeeded:
+            logger.warning(f"Full resync of replica {client.address} failed")
+            close_client(client)
+            return
+        logger.info(f"Synchronization with replica {client.address} succeeded")
+        write_to_client(client)
+
+    def fork_child(work, on_exit):
+        """Runs work() in a forked copy of the server and returns its pid.
+
+        The child sees the dataset as it was at fork time (the kernel
+        copies pages on write) while the parent keeps serving clients.
+        on_exit(succeeded) runs in the parent once the child has exited.
+        """
+        sys.stdout.flush()
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                work()
+                status = 0
+            except BaseException as e:
+                logger.warning(f"Child process {os.getpid()} failed: {e}")
+            finally:
+                sys.stdout.flush()
+                os._exit(status)
+        children[pid] = on_exit
+        return pid
+
+    def reap_children():
+        while children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                children.clear()
+                return
+            if pid == 0:
+                return
+            on_exit = children.pop(pid, None)
+            if on_exit is not None:
+                on_exit(os.waitstatus_to_exitcode(status) == 0)
+
+    def rdb_filename():
+        return os.path.join(directory, dbfilename)
+
+    @command_table.register('save', 1)
+    def handle_save(client, content):
+        nonlocal lastsave
+        if bgsave_child is not None:
+            raise CommandError("ERR Background save already in progress")
+        try:
+            save_to_file(keyspace, rdb_filename(), rdbchecksum)
+        except Exception as e:
+            # Disk errors as well as values the writer cannot serialize
+            logger.warning(f"Failed saving the DB: {e}")
+            raise CommandError("ERR")
+        lastsave = int(time.time())
+        logger.info("DB saved on disk")
+        return parser.OK
+
+    @command_table.register('bgsave', -1)
+    def handle_bgsave(client, content):
+        nonlocal bgsave_child
+        if bgsave_child is not None:
+            raise CommandError("ERR Background save already in progress")
+        started = int(time.time())
+
+        def bgsave_done(succeeded):
+            nonlocal bgsave_child, lastsave
+            bgsave_child = None
+            if succeeded:
+                lastsave = started
+                logger.info("Background saving terminated with success")
+            else:
+                logger.warning("Background saving error")
+
+        bgsave_child = fork_child(partial(save_to_file, keyspace, rdb_filename(), rdbchecksum), bgsave_done)
+        logger.info(f"Background saving started by pid {bgsave_child}")
+        return SimpleString("Background saving started")
+
+    @command_table.register('bgrewriteaof', 1)
+    def handle_bgrewriteaof(client, content):
+        nonlocal aof_rewrite_child
+        if aof_rewrite_child is not None:
+            raise CommandError("ERR Background append only file rewriting already in progress")
+        temp_filename = os.path.join(directory, f"temp-rewriteaof-bg-{os.getpid()}.aof")
+
+        def rewrite_done(succeeded):
+            nonlocal aof_rewrite_child
+            aof_rewrite_child = None
+            if not succeeded:
+                if aof is not None:
+                    aof.abort_rewrite()
+                logger.warning("Background AOF rewrite failed")
+                return
+            try:
+                if aof is not None:
+                    aof.finish_rewrite(temp_filename)
+                else:
+                    os.replace(temp_filename, aof_filename)
+            except OSError as e:
+                logger.warning(f"Could not install the rewritten AOF: {e}")
+                return
+            logger.info("Background AOF rewrite finished successfully")
+
+        if aof is not None:
+            aof.start_rewrite()
+        # The rewritten log is an RDB snapshot (an "RDB preamble") followed
+        # by the commands that ran while the child was writing it
+        aof_rewrite_child = fork_child(partial(save_to_file, keyspace, temp_filename, rdbchecksum), rewrite_done)
+        logger.info(f"Background append only file rewriting started by pid {aof_rewrite_child}")
+        return SimpleString("Background append only file rewriting started")
+
+    @command_table.register('lastsave', 1)
+    def handle_lastsave(client, content):
+        return lastsave
+
+    @command_table.register('wait', 3, (BLOCKING,))
+    def handle_wait(client, content):
+        nonlocal ack_requested
+        if current_role != "master":
+            raise CommandError("ERR WAIT cannot be used with replica instances")
+        try:
+            num_replicas = int(content[1])
+            timeout_ms = int(content[2])
+        except ValueError:
+            raise CommandError("ERR value is not an integer or out of range")
+        if timeout_ms < 0:
+            raise CommandError("ERR timeout is negative")
+
+        # Replicas that acknowledged this client's last write
+        target_offset = client.write_offset
+
+        def acknowledged():
+            return sum(1 for replica in replicas if replica.repl_ack_offset >= target_offset)
+
+        count = acknowledged()
+        # Inside EXEC WAIT cannot block, it reports what is known now
+        if count >= num_replicas or client.in_exec:
+            return count
+
+        def serve():
+            count = acknowledged()
+            return count if count >= num_replicas else None
+
+        ack_requested = True
+        timeout = timeout_ms / 1000 if timeout_ms else None
+        blocker.block(client, [REPLICA_ACKS], serve, timeout, acknowledged)
+        return NO_REPLY
+
+    def get_stream(key_name, create=False):
+        """Returns the Stream stored at key_name, None if there is none."""
+        stream = keyspace.get(key_name)
+        if stream is None:
+            if create:
+                stream = Stream()
+                keyspace.set(key_name, stream)
+            return stream
+        if type(stream) is not Stream:
+            raise CommandError(WRONGTYPE)
+        return stream
+
+    def parse_count(text):
+        try:
+            count = int(text)
+        except ValueError:
+            raise CommandError("ERR value is not an integer or out of range")
+        return max(count, 0)
+
+    @command_table.register('xadd', -5, (WRITE, PROPAGATE, DENYOOM), 1)
+    def handle_xadd(client, content):
+        key_name = content[1]
+        if len(content) % 2 == 0:
+            raise CommandError("ERR wrong number of arguments for 'xadd' command")
+        stream = get_stream(key_name)
+        try:
+            stream_id = (stream or Stream()).next_id(content[2], now_ms())
+        except StreamIdError as e:
+            raise CommandError(str(e))
+        if stream is None:
+            stream = get_stream(key_name, create=True)
+        before = stream.memory
+        stream.add(stream_id, content[3:])
+        keyspace.adjust_memory(stream.memory - before)
+
+        # Replicas must store the same id, so propagate the resolved one
+        content[2] = format_id(stream_id)
+        blocker.signal_key(key_name)
+        return content[2]
+
+    @command_table.register('xlen', 2, (READONLY,), 1)
+    def handle_xlen(client, content):
+        stream = get_stream(content[1])
+        return 0 if stream is None else len(stream)
+
+    def stream_range(content, reverse):
+        stream = get_stream(content[1])
+        count = None
+        if len(content) > 4:
+            if len(content) != 6 or content[4].lower() != 'count':
+                raise CommandError("ERR syntax error")
+            count = parse_count(content[5])
+        try:
+            if reverse:
+                end = parse_range_bound(content[2], False)
+                start = parse_range_bound(content[3], True)
+            else:
+                start = parse_range_bound(content[2], True)
+                end = parse_range_bound(content[3], False)
+        except StreamIdError as e:
+            raise CommandError(str(e))
+        if stream is None or count == 0:
+            return []
+        if reverse:
+            return stream.rev_range(end, start, count)
+        return stream.range(start, end, count)
+
+    @command_table.register('xrange', -4, (READONLY,), 1)
+    def handle_xrange(client, content):
+        return stream_range(content, False)
+
+    @command_table.register('xrevrange', -4, (READONLY,), 1)
+    def handle_xrevrange(client, content):
+        return stream_range(content, True)
+
+    def xread_keys(content):
+        # XREAD [COUNT n] [BLOCK ms] STREAMS key [key ...] id [id ...]
+        i = 1
+        while i < len(content):
+            option = content[i].lower()
+            if option == 'streams':
+                rest = content[i + 1:]
+                return rest[:len(rest) // 2]
+            i += 2 if option in ('count', 'block') else 1
+        return []
+
+    @command_table.register('xread', -4, (READONLY, BLOCKING), get_keys=xread_keys)
+    def handle_xread_command(client, content):
+        count = None
+        block_option = None
+        i = 1
+        while i < len(content):
+            option = content[i].lower()
+            if option == 'count' and i + 1 < len(content):
+                count = parse_count(content[i + 1])
+                i += 2
+            elif option == 'block' and i + 1 < len(content):
+                try:
+                    block_option = int(content[i + 1])
+                except ValueError:
+                    raise CommandError("ERR timeout is not an integer or out of range")
+                if block_option < 0:
+                    raise CommandError("ERR timeout is negative")
+                i += 2
+            elif option == 'streams':
+                i += 1
+                break
+            else:
+                raise CommandError("ERR syntax error")
+        else:
+            raise CommandError("ERR syntax error")
+
+        total_pairs, odd = divmod(len(content) - i, 2)
+        if odd or total_pairs == 0:
+            raise CommandError("ERR Unbalanced 'xread' list of streams: for each stream key an ID or '$' must be specified.")
+        keys = content[i:i + total_pairs]
+        ids = []
+        for key_name, id_text in zip(keys, content[i + total_pairs:]):
+            if id_text == '$':
+                stream = get_stream(key_name)
+                ids.append(stream.last_id if stream is not None else 0)
+            else:
+                try:
+                    ids.append(parse_id(id_text))
+                except StreamIdError as e:
+                    raise CommandError(str(e))
+
+        reply = xread_reply(keys, ids, count)
+        # Inside EXEC a blocking read behaves like a plain one
+        if reply is None and block_option is not None and not client.in_exec:
+            timeout = block_option / 1000 if block_option else None
+            blocker.block(client, keys, lambda: xread_reply(keys, ids, count), timeout)
+            return NO_REPLY
+        return reply
+
+    def get_collection(key_name, cls, create=False):
+        """Returns the cls value stored at key_name, None if there is none."""
+        value = keyspace.get(key_name)
+        if value is None:
+            if create:
+                value = cls()
+                keyspace.set(key_name, value)
+            return value
+        if type(value) is not cls:
+            raise CommandError(WRONGTYPE)
+        return value
+
+    def collection_changed(key_name, value, memory_before):
+        # Like in Redis, a collection that loses its last element is deleted
+        keyspace.adjust_memory(value.memory - memory_before)
+        if not len(value):
+            keyspace.delete(key_name)
+
+    def normalize_range(start, stop, length):
+        """Turns inclusive, possibly negative LRANGE style indexes into a slice."""
+        start = parse_integer(start)
+        stop = parse_integer(stop)
+        if start < 0:
+            start = max(start + length, 0)
+        if stop < 0:
+            stop += length
+        return start, max(start, min(stop + 1, length))
+
+    @command_table.register('hset', -4, (WRITE, PROPAGATE, DENYOOM), 1)
+    def handle_hset(client, content):
+        if len(content) % 2:
+            raise CommandError(f"ERR wrong number of arguments for '{content[0].lower()}' command")
+        key = content[1]
+        hash_value = get_collection(key, Hash, create=True)
+        before = hash_value.memory
+        added = sum(hash_value.set(content[i], content[i + 1]) for i in range(2, len(content), 2))
+        collection_changed(key, hash_value, before)
+        return parser.OK if content[0].lower() == 'hmset' else added
+
+    command_table.register('hmset', -4, (WRITE, PROPAGATE, DENYOOM), 1)(handle_hset)
+
+    @command_table.register('hsetnx', 4, (WRITE, PROPAGATE, DENYOOM), 1)
+    def handle_hsetnx(client, content):
+        key = content[1]
+        hash_value = get_collection(key, Hash, create=True)
+        if content[2] in hash_value:
+            return 0
+        before = hash_value.memory
+        hash_value.set(content[2], content[3])
+        collection_changed(key, hash_value, before)
+        return 1
+
+    @command_table.register('hget', 3, (READONLY,), 1)
+    def handle_hget(client, content):
+        hash_value = get_collection(content[1], Hash)
+        return None if hash_value is None else hash_value.get(content[2])
+
+    @command_table.register('hmget', -3, (READONLY,), 1)
+    def handle_hmget(client, content):
+        hash_value = get_collection(content[1], Hash)
+        if hash_value is None:
+            return [None] * (len(content) - 2)
+        return [hash_value.get(field) for field in content[2:]]
+
+    @command_table.register('hdel', -3, (WRITE, PROPAGATE), 1)
+    def handle_hdel(client, content):
+        key = content[1]
+        hash_value = get_collection(key, Hash)
+        if hash_value is None:
+            return 0
+        before = hash_value.memory
+        removed = sum(hash_value.delete(field) for field in content[2:])
+        collection_changed(key, hash_value, before)
+        return removed
+
+    @command_table.register('hlen', 2, (READONLY,), 1)
+    def handle_hlen(client, content):
+        hash_value = get_collection(content[1], Hash)
+        return 0 if hash_value is None else len(hash_value)
+
+    @command_table.register('hexists', 3, (READONLY,), 1)
+    def handle_hexists(client, content):
+        hash_value = get_collection(content[1], Hash)
+        return int(hash_value is not None and content[2] in hash_value)
+
+    @command_table.register('hgetall', 2, (READONLY,), 1)
+    def handle_hgetall(client, content):
+        hash_value = get_collection(content[1], Hash)
+        return [] if hash_value is None else [text for pair in hash_value.items() for text in pair]
+
+    @command_table.register('hkeys', 2, (READONLY,), 1)
+    def handle_hkeys(client, content):
+        hash_value = get_collection(content[1], Hash)
+        return [] if hash_value is None else list(hash_value.keys())
+
+    @command_table.register('hvals', 2, (READONLY,), 1)
+    def handle_hvals(client, content):
+        hash_value = get_collection(content[1], Hash)
+        return [] if hash_value is None else list(hash_value.values())
+
+    @command_table.register('hincrby', 4, (WRITE, PROPAGATE, DENYOOM), 1)
+    def handle_hincrby(client, content):
+        key, field = content[1], content[2]
+        delta = parse_integer(content[3])
+        hash_value = get_collection(key, Hash)
+        current = 0 if hash_value is None or field not in hash_value else encode_string(hash_value.get(field))
+        if type(current) is not int:
+            raise CommandError("ERR hash value is not an integer")
+        result = current + delta
+        if not -(1 << 63) <= result < (1 << 63):
+            raise CommandError("ERR increment or decrement would overflow")
+        hash_value = get_collection(key, Hash, create=True)
+        before = hash_value.memory
+        hash_value.set(field, str(result))
+        collection_changed(key, hash_value, before)
+        return result
+
+    @command_table.register('hincrbyfloat', 4, (WRITE, PROPAGATE, DENYOOM), 1)
+    def handle_hincrbyfloat(client, content):
+        key, field = content[1], content[2]
+        delta = parse_float(content[3])
+        if delta is None:
+            raise CommandError("ERR value is not a valid float")
+        hash_value = get_collection(key, Hash)
+        current = 0.0 if hash_value is None or field not in hash_value else parse_float(hash_value.get(field))
+        if current is None:
+            raise CommandError("ERR hash value is not a float")
+        result = current + delta
+        if math.isinf(result) or math.isnan(result):
+            raise CommandError("ERR increment would produce NaN or Infinity")
+        text = format_float(result)
+        hash_value = get_collection(key, Hash, create=True)
+        before = hash_value.memory
+        hash_value.set(field, text)
+        collection_changed(key, hash_value, before)
+        # Like INCRBYFLOAT, replicas and the AOF get the result
+        content[:] = ['HSET', key, field, text]
+        return text
+
+    def push(content, left):
+        key = content[1]
+        list_value = get_collection(key, List, create=True)
+        before = list_value.memory
+        list_value.push(content[2:], left)
+        collection_changed(key, list_value, before)
+        return len(list_value)
+
+    @command_table.register('lpush', -3, (WRITE, PROPAGATE, DENYOOM), 1)
+    def handle_lpush(client, content):
+        return push(content, True)
+
+    @command_table.register('rpush', -3, (WRITE, PROPAGATE, DENYOOM), 1)
+    def handle_rpush(client, content):
+        return push(content, False)
+
+    def pop(content, left):
+        if len(content) > 3:
+            raise CommandError(f"ERR wrong number of arguments for '{content[0].lower()}' command")
+        count = None
+        if len(content) == 3:
+            count = encode_string(content[2])
+            if type(count) is not int or count < 0:
+                raise CommandError("ERR value is out of range, must be positive")
+        key = content[1]
+        list_value = get_collection(key, List)
+        if list_value is None:
+            return None
+        before = list_value.memory
+        popped = list_value.pop(1 if count is None else count, left)
+        collection_changed(key, list_value, before)
+        return popped[0] if count is None else popped
+
+    @command_table.register('lpop', -2, (WRITE, PROPAGATE), 1)
+    def handle_lpop(client, content):
+        return pop(content, True)
+
+    @command_table.register('rpop', -2, (WRITE, PROPAGATE), 1)
+    def handle_rpop(client, content):
+        return pop(content, False)
+
+    @command_table.register('llen', 2, (READONLY,), 1)
+    def handle_llen(client, content):
+        list_value = get_collection(content[1], List)
+        return 0 if list_value is None else len(list_value)
+
+    @command_table.register('lindex', 3, (READONLY,), 1)
+    def handle_lindex(client, content):
+        index = parse_integer(content[2])
+        list_value = get_collection(content[1], List)
+        return None if list_value is None else list_value.index(index)
+
+    @command_table.register('lset', 4, (WRITE, PROPAGATE, DENYOOM), 1)
+    def handle_lset(client, content):
+        key = content[1]
+        index = parse_integer(content[2])
+        list_value = get_collection(key, List)
+        if list_value is None:
+            raise CommandError("ERR no such key")
+        before = list_value.memory
+        if not list_value.set(index, content[3]):
+            raise CommandError("ERR index out of range")
+        collection_changed(key, list_value, before)
+        return parser.OK
+
+    @command_table.register('lrange', 4, (READONLY,), 1)
+    def handle_lrange(client, content):
+        list_value = get_collection(content[1], List)
+        length = 0 if list_value is None else len(list_value)
+        start, stop = normalize_range(content[2], content[3], length)
+        return [] if list_value is None else list_value.range(start, stop)
+
+    @command_table.register('ltrim', 4, (WRITE, PROPAGATE), 1)
+    def handle_ltrim(client, content):
+        key = content[1]
+        list_value = get_collection(key, List)
+        length = 0 if list_value is None else len(list_value)
+        start, stop = normalize_range(content[2], content[3], length)
+        if list_value is not None:
+            before = list_value.memory
+            list_value.trim(start, stop)
+            collection_changed(key, list_value, before)
+        return parser.OK
+
+    @command_table.register('sadd', -3, (WRITE, PROPAGATE, DENYOOM), 1)
+    def handle_sadd(client, content):
+        key = content[1]
+        set_value = get_collection(key, Set, create=True)
+        before = set_value.memory
+        added = sum(set_value.add(member) for member in content[2:])
+        collection_changed(key, set_value, before)
+        return added
+
+    @command_table.register('srem', -3, (WRITE, PROPAGATE), 1)
+    def handle_srem(client, content):
+        key = content[1]
+        set_value = get_collection(key, Set)
+        if set_value is None:
+            return 0
+        before = set_value.memory
+        removed = sum(set_value.remove(member) for member in content[2:])
+        collection_changed(key, set_value, before)
+        return removed
+
+    @command_table.register('sismember', 3, (READONLY,), 1)
+    def handle_sismember(client, content):
+        set_value = get_collection(content[1], Set)
+        return int(set_value is not None and content[2] in set_value)
+
+    @command_table.register('smismember', -3, (READONLY,), 1)
+    def handle_smismember(client, content):
+        set_value = get_collection(content[1], Set)
+        return [int(set_value is not None and member in set_value) for member in content[2:]]
+
+    @command_table.register('smembers', 2, (READONLY,), 1)
+    def handle_smembers(client, content):
+        set_value = get_collection(content[1], Set)
+        return [] if set_value is None else list(set_value)
+
+    @command_table.register('scard', 2, (READONLY,), 1)
+    def handle_scard(client, content):
+        set_value = get_collection(content[1], Set)
+        return 0 if set_value is None else len(set_value)
+
+    @command_table.register('sinter', -2, (READONLY,), 1, -1)
+    def handle_sinter(client, content):
+        sets = [get_collection(key, Set) for key in content[1:]]
+        if any(set_value is None for set_value in sets):
+            return []
+        # Walk the smallest set and probe the others
+        sets.sort(key=len)
+        return [member for member in sets[0] if all(member in other for other in sets[1:])]
+
+    @command_table.register('sunion', -2, (READONLY,), 1, -1)
+    def handle_sunion(client, content):
+        union = {}
+        for key in content[1:]:
+            set_value = get_collection(key, Set)
+            if set_value is not None:
+                union.update(dict.fromkeys(set_value))
+        return list(union)
+
+    @command_table.register('sdiff', -2, (READONLY,), 1, -1)
+    def handle_sdiff(client, content):
+        sets = [get_collection(key, Set) for key in content[1:]]
+        if sets[0] is None:
+            return []
+        others = [set_value for set_value in sets[1:] if set_value is not None]
+        return [member for member in sets[0] if not any(member in other for other in others)]
+
+    def format_score(score):
+        """Scores as Redis prints them: '3', '1.5', 'inf'."""
+        if math.isinf(score):
+            return 'inf' if score > 0 else '-inf'
+        if score.is_integer() and abs(score) < 1 << 53:
+            return str(int(score))
+        return repr(score)
+
+    def parse_score_bound(text):
+        """Parses a ZRANGEBYSCORE bound like '1.5', '(1.5' or '-inf' into (score, exclusive)."""
+        exclusive = text.startswith('(')
+        score = parse_float(text[1:] if exclusive else text)
+        if score is None:
+            raise CommandError("ERR min or max is not a float")
+        return score, exclusive
+
+    def zset_reply(entries, with_scores):
+        if not with_scores:
+            return [member for _, member in entries]
+        return [text for score, member in entries for text in (member, format_score(score))]
+
+    @command_table.register('zadd', -4, (WRITE, PROPAGATE, DENYOOM), 1)
+    def handle_zadd(client, content):
+        key = content[1]
+        options = set()
+        i = 2
+        while i < len(content) and content[i].lower() in ('nx', 'xx', 'gt', 'lt', 'ch', 'incr'):
+            options.add(content[i].lower())
+            i += 1
+        pairs = content[i:]
+        if not pairs or len(pairs) % 2:
+            raise CommandError("ERR syntax error")
+        if 'nx' in options and 'xx' in options:
+            raise CommandError("ERR XX and NX options at the same time are not compatible")
+        if len(options & {'nx', 'gt', 'lt'}) > 1:
+            raise CommandError("ERR GT, LT, and/or NX options at the same time are not compatible")
+        if 'incr' in options and len(pairs) != 2:
+            raise CommandError("ERR INCR option supports a single increment-element pair")
+        scores = [parse_float(text) for text in pairs[::2]]
+        if None in scores:
+            raise CommandError("ERR value is not a valid float")
+
+        zset = get_collection(key, ZSet, create='xx' not in options)
+        if zset is None:
+            return None if 'incr' in options else 0
+        before = zset.memory
+        added = updated = 0
+        result = None
+        for score, member in zip(scores, pairs[1::2]):
+            old = zset.score(member)
+            if old is None and 'xx' in options or old is not None and 'nx' in options:
+                continue
+            if 'incr' in options and old is not None:
+                score += old
+                if math.isnan(score):
+                    collection_changed(key, zset, before)
+                    raise CommandError("ERR resulting score is not a number (NaN)")
+            if old is not None and ('gt' in options and score <= old or 'lt' in options and score >= old):
+                continue
+            zset.add(member, score)
+            result = score
+            if old is None:
+                added += 1
+            elif score != old:
+                updated += 1
+        collection_changed(key, zset, before)
+        if 'incr' in options:
+            return None if result is None else format_score(result)
+        return added + updated if 'ch' in options else added
+
+    @command_table.register('zincrby', 4, (WRITE, PROPAGATE, DENYOOM), 1)
+    def handle_zincrby(client, content):
+        key, member = content[1], content[3]
+        delta = parse_float(content[2])
+        if delta is None:
+            raise CommandError("ERR value is not a valid float")
+        zset = get_collection(key, ZSet)
+        old = None if zset is None else zset.score(member)
+        score = delta if old is None else old + delta
+        if math.isnan(score):
+            raise CommandError("ERR resulting score is not a number (NaN)")
+        zset = get_collection(key, ZSet, create=True)
+        before = zset.memory
+        zset.add(member, score)
+        collection_changed(key, zset, before)
+        return format_score(score)
+
+    @command_table.register('zscore', 3, (READONLY,), 1)
+    def handle_zscore(client, content):
+        zset = get_collection(content[1], ZSet)
+        score = None if zset is None else zset.score(content[2])
+        return None if score is None else format_score(score)
+
+    @command_table.register('zrem', -3, (WRITE, PROPAGATE), 1)
+    def handle_zrem(client, content):
+        key = content[1]
+        zset = get_collection(key, ZSet)
+        if zset is None:
+            return 0
+        before = zset.memory
+        removed = sum(zset.remove(member) for member in content[2:])
+        collection_changed(key, zset, before)
+        return removed
+
+    @command_table.register('zcard', 2, (READONLY,), 1)
+    def handle_zcard(client, content):
+        zset = get_collection(content[1], ZSet)
+        return 0 if zset is None else len(zset)
+
+    @command_table.register('zcount', 4, (READONLY,), 1)
+    def handle_zcount(client, content):
+        low, low_exclusive = parse_score_bound(content[2])
+        high, high_exclusive = parse_score_bound(content[3])
+        zset = get_collection(content[1], ZSet)
+        if zset is None:
+            return 0
+        start, stop = zset.score_range(low, low_exclusive, high, high_exclusive)
+        return stop - start
+
+    def zrank(content, reverse):
+        with_score = len(content) == 4 and content[3].lower() == 'withscore'
+        if len(content) > 3 and not with_score:
+            raise CommandError("ERR syntax error")
+        zset = get_collection(content[1], ZSet)
+        rank = None if zset is None else zset.rank(content[2])
+        if rank is None:
+            return None
+        if reverse:
+            rank = len(zset) - 1 - rank
+        return [rank, format_score(zset.score(content[2]))] if with_score else rank
+
+    @command_table.register('zrank', -3, (READONLY,), 1)
+    def handle_zrank(client, content):
+        return zrank(content, False)
+
+    @command_table.register('zrevrank', -3, (READONLY,), 1)
+    def handle_zrevrank(client, content):
+        return zrank(content, True)
+
+    def zrange(key, start, stop, by_score, reverse, limit, with_scores):
+        """Shared by the ZRANGE family. For scores, start and stop are the bounds in
+        the order given: (min, max), or (max, min) when reverse."""
+        if by_score:
+            low, low_exclusive = parse_score_bound(stop if reverse else start)
+            high, high_exclusive = parse_score_bound(start if reverse else stop)
+        zset = get_collection(key, ZSet)
+        length = 0 if zset is None else len(zset)
+        if not by_score:
+            first, last = normalize_range(start, stop, length)
+            if zset is None:
+                return []
+            if reverse:
+                first, last = length - last, length - first
+            entries = zset.range(first, last)
+            return zset_reply(entries[::-1] if reverse else entries, with_scores)
+        if zset is None:
+            return []
+        first, last = zset.score_range(low, low_exclusive, high, high_exclusive)
+        offset, count = limit if limit is not None else (0, -1)
+        if offset < 0:
+            return []
+        if reverse:
+            last -= offset
+            if count >= 0:
+                first = max(first, last - count)
+            return zset_reply(zset.range(first, last)[::-1], with_scores)
+        first += offset
+        if count >= 0:
+            last = min(last, first + count)
+        return zset_reply(zset.range(first, last), with_scores)
+
+    def parse_zrange_options(options, allowed):
+        """Returns (by_score, reverse, limit, with_scores) for the trailing ZRANGE options."""
+        by_score = reverse = with_scores = False
+        limit = None
+        i = 0
+        while i < len(options):
+            option = options[i].lower()
+            if option == 'withscores' and 'withscores' in allowed:
+                with_scores = True
+            elif option == 'byscore' and 'byscore' in allowed:
+                by_score = True
+            elif option == 'rev' and 'rev' in allowed:
+                reverse = True
+            elif option == 'limit' and 'limit' in allowed and i + 2 < len(options):
+                limit = (parse_integer(options[i + 1]), parse_integer(options[i + 2]))
+                i += 2
+            else:
+                raise CommandError("ERR syntax error")
+            i += 1
+        return by_score, reverse, limit, with_scores
+
+    @command_table.register('zrange', -4, (READONLY,), 1)
+    def handle_zrange(client, content):
+        by_score, reverse, limit, with_scores = parse_zrange_options(
+            content[4:], ('withscores', 'byscore', 'rev', 'limit'))
+        if limit is not None and not by_score:
+            raise CommandError("ERR syntax error, LIMIT is only supported in combination with either BYSCORE or BYLEX")
+        return zrange(content[1], content[2], content[3], by_score, reverse, limit, with_scores)
+
+    @command_table.register('zrevrange', -4, (READONLY,), 1)
+    def handle_zrevrange(client, content):
+        _, _, _, with_scores = parse_zrange_options(content[4:], ('withscores',))
+        return zrange(content[1], content[2], content[3], False, True, None, with_scores)
+
+    @command_table.register('zrangebyscore', -4, (READONLY,), 1)
+    def handle_zrangebyscore(client, content):
+        _, _, limit, with_scores = parse_zrange_options(content[4:], ('withscores', 'limit'))
+        return zrange(content[1], content[2], content[3], True, False, limit, with_scores)
+
+    @command_table.register('zrevrangebyscore', -4, (READONLY,), 1)
+    def handle_zrevrangebyscore(client, content):
+        _, _, limit, with_scores = parse_zrange_options(content[4:], ('withscores', 'limit'))
+        return zrange(content[1], content[2], content[3], True, True, limit, with_scores)
+
+    @command_table.register('object', -2, (READONLY,), 2)
+    def handle_object(client, content):
+        if content[1].lower() != 'encoding' or len(content) != 3:
+            raise CommandError(f"ERR unknown subcommand or wrong number of arguments for '{content[1]}'")
+        value = keyspace.get(content[2])
+        if value is None:
+            return None
+        if type(value) is int:
+            return "int"
+        if type(value) is str:
+            # Redis embeds strings of up to 44 bytes in the object header
+            return "embstr" if len(value) <= 44 else "raw"
+        return value.encoding
+
+    @command_table.register('multi', 1)
+    def handle_multi(client, content):
+        if client.multi_queue is not None:
+            raise CommandError("ERR MULTI calls can not be nested")
+        client.multi_queue = []
+        client.multi_error = False
+        return parser.OK
+
+    @command_table.register('exec', 1)
+    def handle_exec(client, content):
+        if client.multi_queue is None:
+            raise CommandError("ERR EXEC without MULTI")
+        queued = client.multi_queue
+        client.multi_queue = None
+        # A watched key that expired since WATCH counts as modified
+        for key in client.watched:
+            keyspace.expire_if_needed(key)
+        touched = any(keyspace.version(key) != version for key, version in client.watched.items())
+        unwatch_all(client)
+        if client.multi_error:
+            raise CommandError("EXECABORT Transaction discarded because of previous errors.")
+        if touched:
+            return parser.NULL_ARRAY
+        if len(queued) == 0:
+            return parser.EMPTY_ARRAY
+        client.in_exec = True
+        try:
+            return [execute(client, queued_content) for queued_content in queued]
+        finally:
+            client.in_exec = False
+
+    @command_table.register('discard', 1)
+    def handle_discard(client, content):
+        if client.multi_queue is not None:
+            client.multi_queue = None
+            unwatch_all(client)
+            return parser.OK
+        raise CommandError("ERR DISCARD without MULTI")
+
+    @command_table.register('watch', -2, (), 1, -1)
+    def handle_watch(client, content):
+        if client.multi_queue is not None:
+            raise CommandError("ERR WATCH inside MULTI is not allowed")
+        for key in content[1:]:
+            if key not in client.watched:
+                client.watched[key] = keyspace.watch(key)
+        return parser.OK
+
+    @command_table.register('unwatch', 1)
+    def handle_unwatch(client, content):
+        unwatch_all(client)
+        return parser.OK
+
+    def unwatch_all(client):
+        for key in client.watched:
+            keyspace.unwatch(key)
+        client.watched.clear()
 
     if replicaOption is not None:
         master_host, master_port = args.replicaof.split()
         master_port = int(master_port)
         current_role = "slave"
+        keyspace.expire_mode = EXPIRE_HIDE
 
-        # Start a new thread to handle the replica connection
-        replica_thread = threading.Thread(target=handle_replica, args=(master_host, master_port))
-        replica_thread.daemon = True  # Daemon thread to stop when the main program exits
-        replica_thread.start()
-
-    dbReader = RDBParser(directory + '/' + dbfilename)
-    dbReader.parse()
+        # The link connects once the event loop runs, after the local dataset is loaded
+        master_link = MasterLink(event_loop, parser, master_host, master_port, port_number,
+                                 load_master_snapshot, apply_master_command)
+        master_client = Connection(None, (master_host, master_port), set())
 
-    server_socket = socket.create_server(("localhost", port_number), reuse_port=True)
-    server_socket.setblocking(False)
-    socket_list = [server_socket]
-    
-    for db in dbReader.get_databases():
-        print(f"Database Index: {db['index']}")
-        for entry in db['hash_table']:
-            key = entry.get('key')
-            value = entry.get('value')
-            expire = entry.get('expire')
-            database[key] = [value, expire]
-    
+    def load_append_only_file(filename):
+        """Replays the AOF through the command table, like client traffic.
 
-    while True:
-        read_sockets, _, exception_sockets = select.select(socket_list, [], socket_list)
-
-
-        for notified_socket in read_sockets:
-            # new client socket:
-            if notified_socket == server_socket:
+        A rewritten AOF starts with an RDB snapshot, which is loaded
+        first. A command cut short by a crash at the end of the file is
+        dropped and the file truncated to the last complete command.
+        """
+        nonlocal loading
+        with open(filename, 'rb') as f:
+            data = f.read()
+        started = time.monotonic()
+        offset = 0
+        if data.startswith(b'REDIS'):
+            preamble = RDBParser(filename, verify_checksum=rdbchecksum)
+            preamble.load_buffer(keyspace, data)
+            offset = preamble.pos
+
+        commands, consumed = parser.parse_stream(data[offset:])
+        aof_client = Connection(None, 'aof', set())
+        loading = True
+        try:
+            for content in commands:
+                reply = execute(aof_client, content)
+                if isinstance(reply, CommandError):
+                    raise ValueError(f"Bad command in the AOF {content}: {reply}")
+        finally:
+            loading = False
+
+        if offset + consumed < len(data):
+            logger.warning(f"AOF ends with an incomplete command, truncating {len(data) - offset - consumed} bytes")
+            os.truncate(filename, offset + consumed)
+        logger.info(f"DB loaded from append only file: {len(keyspace)} keys, {len(commands)} commands "
+              f"in {time.monotonic() - started:.3f} seconds")
+
+    aof_filename = os.path.join(directory, args.appendfilename)
+    try:
+        if appendonly and os.path.exists(aof_filename):
+            load_append_only_file(aof_filename)
+        else:
+            dbReader = RDBParser(directory + '/' + dbfilename, verify_checksum=rdbchecksum)
+            dbReader.load_into(keyspace)
+    except (RDBError, OSError, ValueError) as e:
+        logger.error(f"Failed to load the dataset from {directory}: {e}")
+        sys.exit(1)
+    if appendonly:
+        aof = AppendOnlyFile(aof_filename, args.appendfsync)
+
+    def close_client(client):
+        unwatch_all(client)
+        if client.sync_child is not None:
+            # Nobody is left to receive the snapshot
+            os.kill(client.sync_child, signal.SIGTERM)
+        event_loop.remove(client.sock)
+        blocker.remove_client(client)
+        if client in replicas:
+            replicas.remove(client)
+        client.close()
+
+    def accept_clients(mask):
+        # Drain every pending connection, one wakeup can cover many of them
+        while True:
+            try:
                 client_socket, client_address = server_socket.accept()
-                client_socket.setblocking(False)
-                socket_list.append(client_socket)
-                clients[client_socket] = client_address
+            except BlockingIOError:
+                return
+            client_socket.setblocking(False)
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client = Connection(client_socket, client_address, clients_pending_write, output_limits)
+            logger.log(VERBOSE, "Accepted %s:%d", client_address[0], client_address[1])
+            event_loop.add_reader(client_socket, partial(handle_client, client))
+
+    def handle_clients_with_pending_writes():
+        # Replies produced while handling one round of events go out together
+        for client in list(clients_pending_write):
+            clients_pending_write.discard(client)
+            write_to_client(client)
+
+    def write_to_client(client):
+        if client.close_requested:
+            logger.warning(f"Closing client {client.address}: output buffer limit reached")
+            close_client(client)
+            return
+        if client.sync_child is not None:
+            return
+        try:
+            done = client.flush()
+        except OSError:
+            close_client(client)
+            return
+        event_loop.watch_writable(client.sock, not done)
+
+    def handle_client(client, mask):
+        if mask & selectors.EVENT_WRITE:
+            write_to_client(client)
+            if client.closed or not mask & selectors.EVENT_READ:
+                return
 
+        try:
+            data = client.sock.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+
+        if not data:
+            logger.log(VERBOSE, "Client %s closed the connection", client.address)
+            close_client(client)
+            return
+
+        # Keep partial frames buffered until the rest of them arrives
+        client.read_buffer += data
+        if client.blocked is None:
+            process_input(client)
+
+    def dispatch(client, content):
+        """Runs one command for client, or queues it inside MULTI.
+
+        Queued commands are checked against the table right away. A bad
+        one is answered with its error and makes EXEC abort.
+        """
+        if slot_map is not None:
+            command = command_table.lookup(content[0])
+            if command is not None and command.check_arity(len(content)):
+                error = check_slot(command, content)
+                if error is not None:
+                    command.rejected_calls += 1
+                    if client.multi_queue is not None:
+                        client.multi_error = True
+                    return error
+        if client.multi_queue is not None:
+            command = command_table.lookup(content[0])
+            if command is None or command.name not in ('exec', 'discard', 'multi', 'watch'):
+                error = check_command(command, content)
+                if error is not None:
+                    if command is not None:
+                        command.rejected_calls += 1
+                    client.multi_error = True
+                    return error
+                client.multi_queue.append(content)
+                return parser.QUEUED
+        return execute(client, content)
+
+    def reject_input(client, message):
+        # Like Redis, answer a protocol error and drop the connection
+        client.send(parser.to_resp_error(message))
+        try:
+            client.flush()
+        except OSError:
+            pass
+        close_client(client)
+
+    def process_input(client):
+        # Every command of a pipelined batch runs in order. Their replies
+        # pile up in the output buffer and are flushed together before the
+        # loop sleeps again. A blocked client keeps the rest of its batch
+        # until it is released.
+        while client.blocked is None and not client.closed:
+            if client.pending_commands:
+                commands = client.pending_commands
+                client.pending_commands = None
             else:
-                data = notified_socket.recv(1024)
-                
-                if not data:
-                    socket_list.remove(notified_socket)
-                    del clients[notified_socket]
-                    notified_socket.close()
-                    continue
-                
-                commands = parser.parse(data)
-                silent_set = False
-                concat_response = []
-
-                if commands[0][0].lower() == 'exec':
-                    if not notified_socket in multi_queue.keys():
-                        notified_socket.sendall(str.encode(parser.to_resp_error("ERR EXEC without MULTI")))
-                        continue
-                    if len(multi_queue[notified_socket]) == 0:
-                        notified_socket.sendall(str.encode(parser.to_resp_array([])))
-                        del multi_queue[notified_socket]
-                        continue
-                    commands = parser.parse(multi_queue[notified_socket])
-                    del multi_queue[notified_socket]
-                    silent_set = True
-
-                if commands[0][0].lower() == 'discard':
-                    if notified_socket in multi_queue.keys():
-                        del multi_queue[notified_socket]
-                        notified_socket.sendall(str.encode(parser.to_resp_string("OK")))
-                    else:
-                        notified_socket.sendall(str.encode(parser.to_resp_error("ERR DISCARD without MULTI")))
+                try:
+                    commands, _ = parser.consume_stream(client.read_buffer, client.parse_state)
+                except ValueError:
+                    reject_input(client, "ERR Protocol error")
+                    return
+                if not commands:
+                    return
+
+            debug = logger.isEnabledFor(logging.DEBUG)
+            for index, content in enumerate(commands):
+                if type(content) is not list:
                     continue
+                # Commands are non-empty arrays of bulk strings; anything
+                # else would reach the table lookup and the handlers
+                if not content or any(type(arg) is not str for arg in content):
+                    reject_input(client, "ERR Protocol error: expected a non-empty array of bulk strings")
+                    return
+                if debug:
+                    logger.debug("%s: %s", client.address, content)
+                reply = dispatch(client, content)
+                if reply is not NO_REPLY:
+                    client.send(parser.to_resp(reply))
+                if client.blocked is not None:
+                    client.pending_commands = commands[index + 1:]
+                    return
+
+    def resume_client(client, reply):
+        """Answers a client released by the blocker and runs its queued input."""
+        if client.closed:
+            return
+        client.send(parser.to_resp(reply))
+        process_input(client)
+
+    # Allow as many client sockets as the hard limit permits
+    soft_limit, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft_limit < hard_limit:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard_limit, hard_limit))
+        except (ValueError, OSError) as e:
+            logger.warning(f"Could not raise the open files limit: {e}")
 
+    server_socket = socket.create_server(("localhost", port_number), backlog=511, reuse_port=True)
+    server_socket.setblocking(False)
 
-                if notified_socket in multi_queue.keys():
-                    multi_queue[notified_socket] += data
-                    notified_socket.sendall(str.encode(parser.to_resp_string("QUEUED")))
-                    continue
-                
-
-                for content in commands:
-                    if type(content) is list:
-                        print(content)
-                        
-                        if content[0].lower() in {"set", "del"}:  # Write commands
-                            # Propagate the command to replicas
-                            resp_command = parser.to_resp_array(content)
-                            print(f"sending {content} to {len(replicas)} replicas")
-                            for replica_socket in replicas:
-                                try:
-                                    replica_socket.sendall(str.encode(resp_command))
-                                except Exception as e:
-                                    print(f"Error sending to replica: {e}")
-                                    replicas.remove(replica_socket)  # Remove failed replicas
-
-                        if content[0].lower() == "echo":
-                            notified_socket.sendall(str.encode(parser.to_resp_string(content[1])))
-                        elif content[0].lower() == "ping":
-                            notified_socket.sendall(b"+PONG\r\n")
-
-                        elif content[0].lower() == "set":
-                            expire_time = infinite_time
-                            current_time = datetime.now()
-                            # (current_time)
-                            if len(content) == 5 and content[3].lower() == 'px':
-                                expire_time = datetime.now() + timedelta(microseconds=int(content[4]))
-                            # print(expire_time)
-                            database[content[1]] = [content[2], expire_time]
-                            if not silent_set:
-                                notified_socket.sendall(str.encode(parser.to_resp_string("OK")))
-                            else:
-                                concat_response.append("OK")
-                            # Increment pending writes
-                            with pending_writes_lock:
-                                pending_writes += 1
-                            
-                        elif content[0].lower() == "get":
-                            keyName = content[1]
-                            current_time = datetime.now()
-                            if keyName in database.keys() and (current_time <= database[keyName][1] + timedelta(milliseconds=100)):
-                                if not silent_set:
-                                    notified_socket.sendall(str.encode(parser.to_resp_string(database[keyName][0])))
-                                else:
-                                    concat_response.append(database[keyName][0])
-                            else:
-                                notified_socket.sendall(str.encode(parser.to_resp_null()))
-
-                        elif content[0].lower() == 'config':
-                            if content[2].lower() == 'dir':
-                                notified_socket.sendall(str.encode(parser.to_resp_array(['dir', directory])))
-                            elif content[2].lower() == 'dbfilename':
-                                notified_socket.sendall(str.encode(parser.to_resp_array(['dbfilename', dbfilename])))
-
-                        elif content[0].lower() == 'keys':
-                            notified_socket.sendall(str.encode(parser.to_resp_array(database.keys())))
-
-                        elif content[0].lower() == 'info':
-                            if content[1].lower() == 'replication':
-                                response = "role:" + current_role + "\n"
-                                if (current_role == "master"):
-                                    response += "master_replid:" + replication_id + "\n"
-                                    response += "master_repl_offset:" + str(replication_offset) + "\n"
-                                notified_socket.sendall(str.encode(parser.to_resp_string(response)))
-
-                        elif content[0].lower() == 'replconf':
-                            if content[1].lower() == 'listening-port':
-                                listening_port_number = int(content[2])
-                                # slave_socket = socket.create_connection(("localhost", listening_port_number))
-                                print(f"Appended slave with port number {listening_port_number}")
-                                replicas.append(notified_socket)
-                            notified_socket.sendall(str.encode(parser.to_resp_string("OK")))
-                        elif content[0].lower() == 'psync':
-                            notified_socket.sendall(str.encode(parser.to_resp_simple_string(f"FULLRESYNC {replication_id} 0")) + parser.to_empty_RDB())
-                            
-                        elif content[0].lower() == 'wait':
-                            # Parse arguments: num_replicas and timeout in milliseconds
-                            num_replicas = int(content[1])
-                            timeout_ms = int(content[2])
-
-                            with pending_writes_lock:
-                                if pending_writes == 0:
-                                    # No writes pending, return 0 immediately
-                                    notified_socket.sendall(str.encode(parser.to_resp_integer(len(replicas))))
-                                    continue
-
-                            # Clear previous acknowledgments
-                            with ack_lock:
-                                acknowledged_replicas.clear()
-
-                            # Send ACK command to all replicas
-                            for replica_socket in replicas:
-                                try:
-                                    replica_socket.sendall(str.encode(parser.to_resp_array(['REPLCONF', 'GETACK', '*'])))  # Send ACK command
-                                except Exception as e:
-                                    print(f"Failed to send ACK to replica: {e}")
-
-                            # Wait for acknowledgments or timeout
-                            start_time = time.time()
-                            elapsed_time = 0
-
-                            while elapsed_time < timeout_ms / 1000:
-                                read_sockets, _, _ = select.select(replicas, [], [], 0.1)  # Check for incoming ACKs
-
-                                for sock in read_sockets:
-                                    data = sock.recv(1024)
-                                    content = parser.parse(data)[0]
-                                    print(f"Content receoved from read sockets : {content}")
-                                    if content[1].lower() == 'ack':
-                                        with ack_lock:
-                                            acknowledged_replicas.add(sock)
-
-                                # Check if we have enough acknowledgments
-                                with ack_lock:
-                                    if len(acknowledged_replicas) >= num_replicas:
-                                        break
-
-                                elapsed_time = time.time() - start_time
-
-                            # Respond with the number of replicas that acknowledged
-                            with ack_lock:
-                                notified_socket.sendall(str.encode(parser.to_resp_integer(len(acknowledged_replicas))))
-                            
-                        elif content[0].lower() == 'type':
-                            keyName = content[1]
-                            if keyName in database.keys() :
-                                notified_socket.sendall(str.encode(parser.to_resp_string("string")))
-                            elif keyName in streams.keys():
-                                notified_socket.sendall(str.encode(parser.to_resp_string("stream")))
-                            else:
-                                notified_socket.sendall(str.encode(parser.to_resp_string("none")))
-
-                        elif content[0].lower() == 'xadd':
-                            total_pairs = int((len(content) - 3) / 2)
-                            key_name = content[1]
-                            id = content[2]
-                            auto_gen = False
-
-                            if id == '*':
-                                current_unix_time_ms = int(time.time() * 1000)
-                                id = f"{str(current_unix_time_ms)}-0"
-                                if not key_name in streams.keys():
-                                    streams[key_name] = {}
-                            else:
-                                id_split = id.split('-')
-                                if id_split[1] == '*':
-                                    auto_gen = True
-                                print(f"Current ID : {id_split}")
-
-                                if not auto_gen:
-                                    id_split_int = [int(val) for val in id_split]
-                                    if id_split_int[0] <= 0 and id_split_int[1] <= 0:
-                                        notified_socket.sendall(str.encode(parser.to_resp_error("ERR The ID specified in XADD must be greater than 0-0"))) 
-                                        continue
-                                    if key_name in streams.keys():
-                                        last_id_split = list(streams[key_name].keys())[-1].split('-')
-                                        last_id_split = [int(val) for val in last_id_split]
-                                        
-                                        if last_id_split[0] > id_split_int[0] or (last_id_split[0] == id_split_int[0] and last_id_split[1] >= id_split_int[1]):
-                                            notified_socket.sendall(str.encode(parser.to_resp_error("ERR The ID specified in XADD is equal or smaller than the target stream top item"))) 
-                                            continue
-                                
-                                if not key_name in streams.keys():
-                                    streams[key_name] = {}
-                                
-                                if auto_gen:
-                                    key_seconds = [x.split('-')[0] for x in list(streams[key_name].keys())]
-                                    if id_split[0] not in key_seconds:
-                                        id_split[1] = '1' if id_split[0] == '0' else '0'
-                                        
-                                    else:
-                                        last_id_split = list(streams[key_name].keys())[-1].split('-')
-                                        last_id_split = [int(val) for val in last_id_split]
-                                        id_split[1] = str(last_id_split[1] + 1)
-                                    
-                                    id = '-'.join(id_split)
-
-                            
-                            streams[key_name][id] = {} 
-                            
-                            for i in range(total_pairs):
-                                key = content[3 + 2*i]
-                                value = content[3 + 2*i + 1]
-                                streams[key_name][id][key] = value
-
-                            new_xadd = True
-                            notified_socket.sendall(str.encode(parser.to_resp_string(id)))
-                                                  
-                        elif content[0].lower() == 'xrange':
-                            key_name = content[1]
-                            start_time = [-99999, -99999] if content[2] == '-' else [int(x) for x in content[2].split('-')]
-                            end_time = [math.inf, math.inf] if content[3] == '+' else [int(x) for x in content[3].split('-')]
-                            result = []
-                            key_seconds = []
-                            if start_time[0] != end_time[0]:
-                                key_seconds = [x for x in list(streams[key_name].keys()) if ((int(x.split('-')[0]) > start_time[0] and int(x.split('-')[0]) < end_time[0]) or ((int(x.split('-')[0]) == start_time[0] and int(x.split('-')[1]) >= start_time[1]) or (int(x.split('-')[0]) == end_time[0] and int(x.split('-')[1]) <= end_time[1])))]
-                            else:
-                                key_seconds = [x for x in list(streams[key_name].keys()) if ((int(x.split('-')[0]) == start_time[0] and int(x.split('-')[1]) >= start_time[1] and int(x.split('-')[1]) <= end_time[1]))]
-                            for second in key_seconds:
-                                key_value = []
-                                for key, value in streams[key_name][second].items():
-                                    key_value.append(key)
-                                    key_value.append(value)
-                                result.append([second, key_value])
-                            
-                            notified_socket.sendall(str.encode(parser.to_resp_array(result)))
-                            
-                        elif content[0].lower() == 'xread':
-                            if content[1].lower() == 'block':
-                                new_xadd = False
-                                block_option = int(content[2])
-                                content = content[:1] + content[3:]
-                                total_pairs = int((len(content) - 2) / 2)
-                                for i in range(total_pairs):
-                                    key_name = content[2 + i]
-                                    if content[2 + total_pairs + i] == '$':
-                                        content[2 + total_pairs + i] = list(streams[key_name].keys())[-1]
-                                if block_option == 0:
-                                    threading.Thread(target=check_xadd_flag, args=(notified_socket, content), daemon=True).start()
-                                else:
-                                    threading.Timer(block_option / 1000, handle_xread, args=(notified_socket, content)).start()
-                            else:
-                                handle_xread(notified_socket, content)
-
-                        elif content[0].lower() == 'incr':
-                            keyName = content[1]
-                            if keyName in database.keys():
-                                try:
-                                    value = int(database[keyName][0])
-                                    value += 1
-                                    database[keyName][0] = str(value)
-                                    if not silent_set:
-                                        notified_socket.sendall(str.encode(parser.to_resp_integer(database[keyName][0])))
-                                    else:
-                                        concat_response.append(int(database[keyName][0]))
-                                except ValueError as e:
-                                    if not silent_set:
-                                        notified_socket.sendall(str.encode(parser.to_resp_error("ERR value is not an integer or out of range")))
-                                    else:
-                                        try:
-                                            raise MyCustomException("ERR value is not an integer or out of range")
-                                        except MyCustomException as e:
-                                            concat_response.append(e)
-                            else:
-                                expire_time = infinite_time
-                                database[content[1]] = ['1', expire_time]
-                                if not silent_set:
-                                    notified_socket.sendall(str.encode(parser.to_resp_integer("1")))
-                                else:
-                                    concat_response.append(1)
-                                # Increment pending writes
-                                with pending_writes_lock:
-                                    pending_writes += 1
-
-                        elif content[0].lower() == 'multi':
-                            multi_queue[notified_socket] = b""
-                            notified_socket.sendall(str.encode(parser.to_resp_string("OK")))
-
-                if silent_set:
-                        notified_socket.sendall(str.encode(parser.to_resp(concat_response)))
-
-
-                    
-
-        for notified_socket in exception_sockets:
-            socket_list.remove(notified_socket)
-            del clients[notified_socket]
-            notified_socket.close()
+    event_loop.before_sleep.append(blocker.serve_ready_keys)
+    # Writes reach the AOF before their replies reach the clients
+    event_loop.before_sleep.append(flush_append_only_file)
+    event_loop.before_sleep.append(flush_replication)
+    event_loop.before_sleep.append(handle_clients_with_pending_writes)
+    event_loop.call_every(0.1, active_expire_cycle)
+    event_loop.call_every(0.1, reap_children)
+    event_loop.call_every(0.1, evictor.update_clock)
+    event_loop.add_reader(server_socket, accept_clients)
+    if master_link is not None:
+        master_link.start()
+    event_loop.run_forever()
 
 if __name__ == "__main__":
     main()
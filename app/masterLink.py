@@ -0,0 +1,268 @@
+import errno
+import logging
+import os
+import selectors
+import socket
+
+from app.redisParser import ParseState
+
+logger = logging.getLogger(__name__)
+
+# Link states
+CONNECTING = 'connecting'
+HANDSHAKE = 'handshake'
+TRANSFER = 'transfer'
+CONNECTED = 'connected'
+DISCONNECTED = 'disconnected'
+
+
+class MasterLink:
+    """The replica's connection to its master, driven by the event loop.
+
+    Runs the handshake one command at a time, receives the PSYNC reply
+    and the RDB payload, then parses the replication stream incrementally
+    out of one buffer. Every command is handed to on_command(content) and
+    ``offset`` advances by the exact number of bytes the command took on
+    the wire, which is what REPLCONF ACK reports. If the link drops, it
+    reconnects and asks to continue from that offset.
+    """
+
+    def __init__(self, event_loop, parser, host, port, listening_port,
+                 on_snapshot, on_command, reconnect_delay=1.0, ack_interval=1.0):
+        self.event_loop = event_loop
+        self.parser = parser
+        self.host = host
+        self.port = port
+        self.listening_port = listening_port
+        # on_snapshot(payload) replaces the dataset with an RDB payload
+        self.on_snapshot = on_snapshot
+        self.on_command = on_command
+        self.reconnect_delay = reconnect_delay
+
+        self.state = DISCONNECTED
+        self.sock = None
+        self.read_buffer = bytearray()
+        self.parse_state = ParseState()
+        self.write_buffer = bytearray()
+        # Replication id and offset of the stream processed so far; kept
+        # across reconnects for partial resynchronization
+        self.master_replid = None
+        self.offset = -1
+        self.acked_offset = None
+
+        self._handshake = []
+        # Bytes of RDB payload still expected, or None with an EOF mark
+        self._transfer_remaining = None
+        self._transfer_mark = None
+        self._payload = None
+
+        event_loop.call_every(ack_interval, self._send_periodic_ack)
+
+    def start(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setblocking(False)
+        self.state = CONNECTING
+        try:
+            address = socket.getaddrinfo(self.host, self.port, socket.AF_INET, socket.SOCK_STREAM)[0][4]
+            error = self.sock.connect_ex(address)
+        except OSError as e:
+            self._disconnect(f"Error connecting to master: {e}")
+            return
+        if error not in (0, errno.EINPROGRESS):
+            self._disconnect(f"Error connecting to master: {os.strerror(error)}")
+            return
+        self.event_loop.add_reader(self.sock, self._handle)
+        self.event_loop.watch_writable(self.sock, True)
+
+    def _disconnect(self, reason):
+        logger.warning(reason)
+        if self.sock is not None:
+            self.event_loop.remove(self.sock)
+            self.sock.close()
+            self.sock = None
+        self.state = DISCONNECTED
+        self.read_buffer.clear()
+        self.parse_state.reset()
+        self.write_buffer.clear()
+        self._payload = None
+        self.event_loop.call_later(self.reconnect_delay, self.start)
+
+    def _send(self, data):
+        self.write_buffer += data
+        self._flush()
+
+    def _send_command(self, *args):
+        self._send(self.parser.to_resp_array(args))
+
+    def _flush(self):
+        try:
+            while self.write_buffer:
+                sent = self.sock.send(self.write_buffer)
+                del self.write_buffer[:sent]
+        except BlockingIOError:
+            pass
+        self.event_loop.watch_writable(self.sock, bool(self.write_buffer))
+
+    def _handle(self, mask):
+        if self.state == CONNECTING:
+            error = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if error:
+                self._disconnect(f"Error connecting to master: {os.strerror(error)}")
+                return
+            logger.info(f"Connected to master at {self.host}:{self.port}")
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.state = HANDSHAKE
+            self._start_handshake()
+            return
+
+        try:
+            if mask & selectors.EVENT_WRITE:
+                self._flush()
+            if not mask & selectors.EVENT_READ:
+                return
+            try:
+                data = self.sock.recv(65536)
+            except BlockingIOError:
+                return
+            if not data:
+                self._disconnect("Master disconnected.")
+                return
+            self.read_buffer += data
+            self._process()
+        except (OSError, ValueError) as e:
+            self._disconnect(f"Lost the link to the master: {e}")
+
+    # Handshake
+
+    def _start_handshake(self):
+        if self.master_replid is None:
+            psync = ('PSYNC', '?', '-1')
+        else:
+            psync = ('PSYNC', self.master_replid, str(self.offset + 1))
+        self._handshake = [
+            ('PING',),
+            ('REPLCONF', 'listening-port', str(self.listening_port)),
+            ('REPLCONF', 'capa', 'eof', 'capa', 'psync2'),
+            psync,
+        ]
+        self._send_command(*self._handshake[0])
+
+    def _read_line(self):
+        end = self.read_buffer.find(b'\r\n')
+        if end == -1:
+            return None
+        line = bytes(self.read_buffer[:end])
+        del self.read_buffer[:end + 2]
+        return line
+
+    def _handshake_reply(self, line):
+        step = self._handshake.pop(0)
+        logger.debug(f"Response from master: {line.decode('utf-8', 'replace')}")
+        if step[0] == 'PSYNC':
+            self._psync_reply(line)
+            return
+        # Old masters reject REPLCONF capa; that is not fatal
+        if line.startswith(b'-') and step[0] == 'PING':
+            raise ValueError(f"Master refused PING: {line!r}")
+        self._send_command(*self._handshake[0])
+
+    def _psync_reply(self, line):
+        if line.startswith(b'+CONTINUE'):
+            new_replid = line[len(b'+CONTINUE'):].strip().decode()
+            self.master_replid = new_replid or self.master_replid
+            self.state = CONNECTED
+            logger.info(f"Partial resynchronization accepted, continuing from offset {self.offset}")
+            return
+        if not line.startswith(b'+FULLRESYNC'):
+            raise ValueError(f"Unexpected PSYNC reply: {line!r}")
+        _, self.master_replid, offset = line.decode().split()
+        self.offset = int(offset)
+        self._transfer_remaining = None
+        self._transfer_mark = None
+        self._payload = None
+        self.state = TRANSFER
+
+    # RDB transfer
+
+    def _transfer(self):
+        """Consumes RDB payload bytes. Returns True once the payload is loaded."""
+        buffer = self.read_buffer
+        if self._payload is None:
+            line = self._read_line()
+            if line is None:
+                return False
+            # Newlines keep the link alive while the master prepares the RDB
+            line = line.lstrip(b'\n')
+            if not line:
+                return self._transfer()
+            if line.startswith(b'$EOF:'):
+                self._transfer_mark = line[5:]
+            else:
+                self._transfer_remaining = int(line[1:])
+            self._payload = bytearray()
+
+        if self._transfer_mark is not None:
+            # Keep enough of the tail around to spot a mark split across reads
+            end = buffer.find(self._transfer_mark)
+            if end == -1:
+                keep = len(self._transfer_mark) - 1
+                self._payload += buffer[:max(len(buffer) - keep, 0)]
+                del buffer[:max(len(buffer) - keep, 0)]
+                return False
+            self._payload += buffer[:end]
+            del buffer[:end + len(self._transfer_mark)]
+        else:
+            take = min(self._transfer_remaining, len(buffer))
+            self._payload += buffer[:take]
+            del buffer[:take]
+            self._transfer_remaining -= take
+            if self._transfer_remaining:
+                return False
+
+        payload = self._payload
+        self._payload = None
+        self.on_snapshot(payload)
+        self.state = CONNECTED
+        return True
+
+    # Replication stream
+
+    def _process(self):
+        while self.state == HANDSHAKE:
+            line = self._read_line()
+            if line is None:
+                return
+            self._handshake_reply(line)
+        if self.state == TRANSFER and not self._transfer():
+            return
+        if self.state == CONNECTED:
+            self._apply_stream()
+
+    def _apply_stream(self):
+        commands, sizes = self.parser.consume_stream(self.read_buffer, self.parse_state)
+        for content, size in zip(commands, sizes):
+            if (type(content) is list and len(content) > 1 and str(content[0]).lower() == 'replconf'
+                    and str(content[1]).lower() == 'getack'):
+                # The reply covers everything before GETACK itself. The
+                # master knows about the GETACK, so it alone is no reason
+                # for another ACK later.
+                self._send_ack()
+                self.offset += size
+                self.acked_offset = self.offset
+            else:
+                if type(content) is list and content:
+                    self.on_command(content)
+                self.offset += size
+
+    def _send_ack(self):
+        self.acked_offset = self.offset
+        self._send_command('REPLCONF', 'ACK', str(self.offset))
+
+    def _send_periodic_ack(self):
+        # Only when there is something new to report, so WAIT sees progress
+        # without the master having to ask
+        if self.state == CONNECTED and self.offset != self.acked_offset:
+            try:
+                self._send_ack()
+            except OSError as e:
+                self._disconnect(f"Lost the link to the master: {e}")
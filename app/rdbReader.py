@@ -1,144 +1,571 @@
+import logging
+import mmap
+import os
 import struct
-from datetime import datetime, timedelta, MAXYEAR
-infinite_time = datetime(MAXYEAR - 1, 12, 31, 23, 59, 59, 999999)
+import time
+from app.crc64 import crc64
+from app.datatypes import Hash, List, Set, ZSet
+from app.expires import now_ms
+from app.keyspace import EXPIRE_DELETE
+from app.stream import Stream, make_id
+
+logger = logging.getLogger(__name__)
+
+# Opcodes
+OPCODE_FUNCTION2 = 0xF5
+OPCODE_FUNCTION_PRE_GA = 0xF6
+OPCODE_MODULE_AUX = 0xF7
+OPCODE_IDLE = 0xF8
+OPCODE_FREQ = 0xF9
+OPCODE_AUX = 0xFA
+OPCODE_RESIZEDB = 0xFB
+OPCODE_EXPIRETIME_MS = 0xFC
+OPCODE_EXPIRETIME = 0xFD
+OPCODE_SELECTDB = 0xFE
+OPCODE_EOF = 0xFF
+
+# Value types
+TYPE_STRING = 0
+TYPE_LIST = 1
+TYPE_SET = 2
+TYPE_ZSET = 3
+TYPE_HASH = 4
+TYPE_ZSET_2 = 5
+TYPE_MODULE_PRE_GA = 6
+TYPE_MODULE_2 = 7
+TYPE_HASH_ZIPMAP = 9
+TYPE_LIST_ZIPLIST = 10
+TYPE_SET_INTSET = 11
+TYPE_ZSET_ZIPLIST = 12
+TYPE_HASH_ZIPLIST = 13
+TYPE_LIST_QUICKLIST = 14
+TYPE_STREAM_LISTPACKS = 15
+TYPE_HASH_LISTPACK = 16
+TYPE_ZSET_LISTPACK = 17
+TYPE_LIST_QUICKLIST_2 = 18
+TYPE_STREAM_LISTPACKS_2 = 19
+TYPE_SET_LISTPACK = 20
+TYPE_STREAM_LISTPACKS_3 = 21
+
+# Special string encodings
+ENC_INT8 = 0
+ENC_INT16 = 1
+ENC_INT32 = 2
+ENC_LZF = 3
+
+QUICKLIST_NODE_PLAIN = 1
+QUICKLIST_NODE_PACKED = 2
+
+STREAM_ITEM_FLAG_DELETED = 1
+STREAM_ITEM_FLAG_SAMEFIELDS = 2
+
+MAX_RDB_VERSION = 12
+
+
+class RDBError(ValueError):
+    pass
+
+
+def lzf_decompress(data, expected_length):
+    data = bytes(data)
+    out = bytearray()
+    i = 0
+    end = len(data)
+    while i < end:
+        ctrl = data[i]
+        i += 1
+        if ctrl < 32:
+            # Literal run of ctrl + 1 bytes
+            out += data[i:i + ctrl + 1]
+            i += ctrl + 1
+        else:
+            # Back reference
+            length = ctrl >> 5
+            if length == 7:
+                length += data[i]
+                i += 1
+            ref = len(out) - ((ctrl & 0x1F) << 8) - data[i] - 1
+            i += 1
+            if ref < 0:
+                raise RDBError("Invalid LZF back reference")
+            length += 2
+            if ref + length <= len(out):
+                out += out[ref:ref + length]
+            else:
+                # Overlapping copy repeats the bytes being written
+                for k in range(length):
+                    out.append(out[ref + k])
+    if len(out) != expected_length:
+        raise RDBError("LZF decompressed length mismatch")
+    return bytes(out)
+
+
+def _decode(raw):
+    return raw.decode('utf-8', 'surrogateescape')
+
+
+def _parse_ziplist(blob):
+    """Yields the entries of a ziplist as bytes or int."""
+    pos = 10  # zlbytes, zltail, zllen
+    end = len(blob)
+    while pos < end:
+        if blob[pos] == 0xFF:
+            return
+        # Previous entry length, 1 or 5 bytes
+        pos += 5 if blob[pos] == 0xFE else 1
+        encoding = blob[pos]
+        kind = encoding >> 6
+        if kind == 0:
+            length = encoding & 0x3F
+            yield bytes(blob[pos + 1:pos + 1 + length])
+            pos += 1 + length
+        elif kind == 1:
+            length = ((encoding & 0x3F) << 8) | blob[pos + 1]
+            yield bytes(blob[pos + 2:pos + 2 + length])
+            pos += 2 + length
+        elif kind == 2:
+            length = struct.unpack_from('>I', blob, pos + 1)[0]
+            yield bytes(blob[pos + 5:pos + 5 + length])
+            pos += 5 + length
+        elif encoding == 0xC0:
+            yield struct.unpack_from('<h', blob, pos + 1)[0]
+            pos += 3
+        elif encoding == 0xD0:
+            yield struct.unpack_from('<i', blob, pos + 1)[0]
+            pos += 5
+        elif encoding == 0xE0:
+            yield struct.unpack_from('<q', blob, pos + 1)[0]
+            pos += 9
+        elif encoding == 0xF0:
+            yield int.from_bytes(blob[pos + 1:pos + 4], 'little', signed=True)
+            pos += 4
+        elif encoding == 0xFE:
+            yield struct.unpack_from('<b', blob, pos + 1)[0]
+            pos += 2
+        elif 0xF1 <= encoding <= 0xFD:
+            yield (encoding & 0x0F) - 1
+            pos += 1
+        else:
+            raise RDBError(f"Unknown ziplist encoding {encoding:#x}")
+    raise RDBError("Ziplist is missing its end marker")
+
+
+def _backlen_size(length):
+    if length <= 127:
+        return 1
+    if length < 16383:
+        return 2
+    if length < 2097151:
+        return 3
+    if length < 268435455:
+        return 4
+    return 5
+
+
+def _parse_listpack(blob):
+    """Yields the entries of a listpack as bytes or int."""
+    pos = 6  # total bytes, number of elements
+    end = len(blob)
+    while pos < end:
+        encoding = blob[pos]
+        if encoding == 0xFF:
+            return
+        if encoding < 0x80:
+            value, size = encoding, 1
+        elif encoding < 0xC0:
+            length = encoding & 0x3F
+            value, size = bytes(blob[pos + 1:pos + 1 + length]), 1 + length
+        elif encoding < 0xE0:
+            raw = ((encoding & 0x1F) << 8) | blob[pos + 1]
+            value, size = raw - (1 << 13) if raw >= 1 << 12 else raw, 2
+        elif encoding < 0xF0:
+            length = ((encoding & 0x0F) << 8) | blob[pos + 1]
+            value, size = bytes(blob[pos + 2:pos + 2 + length]), 2 + length
+        elif encoding == 0xF0:
+            length = struct.unpack_from('<I', blob, pos + 1)[0]
+            value, size = bytes(blob[pos + 5:pos + 5 + length]), 5 + length
+        elif encoding == 0xF1:
+            value, size = struct.unpack_from('<h', blob, pos + 1)[0], 3
+        elif encoding == 0xF2:
+            value, size = int.from_bytes(blob[pos + 1:pos + 4], 'little', signed=True), 4
+        elif encoding == 0xF3:
+            value, size = struct.unpack_from('<i', blob, pos + 1)[0], 5
+        elif encoding == 0xF4:
+            value, size = struct.unpack_from('<q', blob, pos + 1)[0], 9
+        else:
+            raise RDBError(f"Unknown listpack encoding {encoding:#x}")
+        yield value
+        pos += size + _backlen_size(size)
+    raise RDBError("Listpack is missing its end marker")
+
+
+def _parse_intset(blob):
+    width, length = struct.unpack_from('<II', blob, 0)
+    fmt = {2: 'h', 4: 'i', 8: 'q'}.get(width)
+    if fmt is None:
+        raise RDBError(f"Invalid intset encoding {width}")
+    return list(struct.unpack_from(f'<{length}{fmt}', blob, 8))
+
+
+def _parse_zipmap(blob):
+    pairs = []
+    pos = 1  # zmlen
+    end = len(blob)
+
+    def read_length():
+        nonlocal pos
+        length = blob[pos]
+        if length < 254:
+            pos += 1
+            return length
+        if length == 254:
+            length = struct.unpack_from('<I', blob, pos + 1)[0]
+            pos += 5
+            return length
+        return None
+
+    while pos < end:
+        length = read_length()
+        if length is None:
+            return pairs
+        key = bytes(blob[pos:pos + length])
+        pos += length
+        length = read_length()
+        free = blob[pos]
+        pos += 1
+        value = bytes(blob[pos:pos + length])
+        pos += length + free
+        pairs.append((key, value))
+    raise RDBError("Zipmap is missing its end marker")
+
+
+def _text(element):
+    """Ziplist/listpack elements are bytes or ints; the keyspace wants str."""
+    if type(element) is int:
+        return str(element)
+    return _decode(element)
+
+
+def _pairs(elements):
+    iterator = iter(elements)
+    return [(_text(field), _text(value)) for field, value in zip(iterator, iterator)]
+
 
 class RDBParser:
-    def __init__(self, filename):
+    """Streaming loader for RDB files up to version 12.
+
+    The file is mmap'd and decoded with a moving offset; entries() yields
+    one (db_index, key, value, expire_ms) tuple at a time so nothing but
+    the keyspace itself holds the dataset.
+    """
+
+    def __init__(self, filename, verify_checksum=True):
         self.filename = filename
+        self.verify_checksum = verify_checksum
         self.metadata = {}
-        self.databases = []
         self.end_checksum = None
+        self.version = None
+        self.buf = None
+        self.pos = 0
+
+    # Low level readers
+
+    def _read_byte(self):
+        byte = self.buf[self.pos]
+        self.pos += 1
+        return byte
+
+    def _read(self, n):
+        start = self.pos
+        end = start + n
+        if end > len(self.buf):
+            raise RDBError("Unexpected end of RDB file")
+        self.pos = end
+        return self.buf[start:end]
+
+    def _read_length_with_encoding(self):
+        """Returns (length, is_encoded); encoded lengths are string encodings."""
+        first = self._read_byte()
+        kind = first >> 6
+        if kind == 0:
+            return first & 0x3F, False
+        if kind == 1:
+            return ((first & 0x3F) << 8) | self._read_byte(), False
+        if kind == 3:
+            return first & 0x3F, True
+        if first == 0x80:
+            return struct.unpack('>I', self._read(4))[0], False
+        if first == 0x81:
+            return struct.unpack('>Q', self._read(8))[0], False
+        raise RDBError(f"Unknown length encoding {first:#x}")
+
+    def _read_size(self):
+        length, encoded = self._read_length_with_encoding()
+        if encoded:
+            raise RDBError("Unexpected string encoding where a length was expected")
+        return length
+
+    def _read_raw_string(self):
+        """Returns a string value as bytes, or as int for integer encodings."""
+        length, encoded = self._read_length_with_encoding()
+        if not encoded:
+            return bytes(self._read(length))
+        if length == ENC_INT8:
+            return struct.unpack('<b', self._read(1))[0]
+        if length == ENC_INT16:
+            return struct.unpack('<h', self._read(2))[0]
+        if length == ENC_INT32:
+            return struct.unpack('<i', self._read(4))[0]
+        if length == ENC_LZF:
+            compressed_length = self._read_size()
+            length = self._read_size()
+            return lzf_decompress(self._read(compressed_length), length)
+        raise RDBError(f"Unknown string encoding {length}")
+
+    def _read_blob(self):
+        raw = self._read_raw_string()
+        if type(raw) is int:
+            raise RDBError("Expected a serialized blob, got an integer")
+        return raw
+
+    def _read_string(self):
+        return _text(self._read_raw_string())
+
+    def _read_string_score(self):
+        length = self._read_byte()
+        if length == 253:
+            return float('nan')
+        if length == 254:
+            return float('inf')
+        if length == 255:
+            return float('-inf')
+        return float(bytes(self._read(length)))
+
+    def _read_binary_score(self):
+        return struct.unpack('<d', self._read(8))[0]
+
+    # Values
+
+    def _read_value(self, value_type):
+        if value_type == TYPE_STRING:
+            return self._read_string()
+        if value_type == TYPE_LIST:
+            return List(self._read_string() for _ in range(self._read_size()))
+        if value_type == TYPE_SET:
+            return Set(self._read_string() for _ in range(self._read_size()))
+        if value_type == TYPE_ZSET or value_type == TYPE_ZSET_2:
+            read_score = self._read_binary_score if value_type == TYPE_ZSET_2 else self._read_string_score
+            count = self._read_size()
+            return ZSet((self._read_string(), read_score()) for _ in range(count))
+        if value_type == TYPE_HASH:
+            count = self._read_size()
+            return Hash((self._read_string(), self._read_string()) for _ in range(count))
+        if value_type == TYPE_HASH_ZIPMAP:
+            return Hash((_decode(k), _decode(v)) for k, v in _parse_zipmap(self._read_blob()))
+        if value_type == TYPE_LIST_ZIPLIST:
+            return List(_text(e) for e in _parse_ziplist(self._read_blob()))
+        if value_type == TYPE_SET_INTSET:
+            return Set(str(e) for e in _parse_intset(self._read_blob()))
+        if value_type == TYPE_SET_LISTPACK:
+            return Set(_text(e) for e in _parse_listpack(self._read_blob()))
+        if value_type == TYPE_ZSET_ZIPLIST or value_type == TYPE_ZSET_LISTPACK:
+            parse = _parse_ziplist if value_type == TYPE_ZSET_ZIPLIST else _parse_listpack
+            iterator = iter(parse(self._read_blob()))
+            return ZSet((_text(member), float(score)) for member, score in zip(iterator, iterator))
+        if value_type == TYPE_HASH_ZIPLIST:
+            return Hash(_pairs(_parse_ziplist(self._read_blob())))
+        if value_type == TYPE_HASH_LISTPACK:
+            return Hash(_pairs(_parse_listpack(self._read_blob())))
+        if value_type == TYPE_LIST_QUICKLIST:
+            items = []
+            for _ in range(self._read_size()):
+                items.extend(_text(e) for e in _parse_ziplist(self._read_blob()))
+            return List(items)
+        if value_type == TYPE_LIST_QUICKLIST_2:
+            items = []
+            for _ in range(self._read_size()):
+                container = self._read_size()
+                blob = self._read_blob()
+                if container == QUICKLIST_NODE_PLAIN:
+                    items.append(_decode(blob))
+                else:
+                    items.extend(_text(e) for e in _parse_listpack(blob))
+            return List(items)
+        if value_type in (TYPE_STREAM_LISTPACKS, TYPE_STREAM_LISTPACKS_2, TYPE_STREAM_LISTPACKS_3):
+            return self._read_stream(value_type)
+        if value_type in (TYPE_MODULE_PRE_GA, TYPE_MODULE_2):
+            raise RDBError("Module values are not supported")
+        raise RDBError(f"Unknown value type {value_type}")
+
+    def _read_stream(self, value_type):
+        stream = Stream()
+        for _ in range(self._read_size()):
+            node_key = self._read_blob()
+            master_ms, master_seq = struct.unpack('>QQ', node_key)
+            elements = _parse_listpack(self._read_blob())
+            count = next(elements)
+            deleted = next(elements)
+            master_fields = [_text(next(elements)) for _ in range(next(elements))]
+            next(elements)  # master entry terminator
+            for _ in range(count + deleted):
+                flags = next(elements)
+                ms = master_ms + next(elements)
+                seq = master_seq + next(elements)
+                if flags & STREAM_ITEM_FLAG_SAMEFIELDS:
+                    fields = []
+                    for field in master_fields:
+                        fields.append(field)
+                        fields.append(_text(next(elements)))
+                else:
+                    fields = [_text(next(elements)) for _ in range(2 * next(elements))]
+                next(elements)  # lp-count of this entry
+                if not flags & STREAM_ITEM_FLAG_DELETED:
+                    stream.add(make_id(ms, seq), fields)
+
+        self._read_size()  # length
+        last_ms = self._read_size()
+        last_seq = self._read_size()
+        stream.last_id = max(stream.last_id, make_id(last_ms, last_seq))
+        if value_type >= TYPE_STREAM_LISTPACKS_2:
+            self._read_size()  # first id ms
+            self._read_size()  # first id seq
+            self._read_size()  # max deleted id ms
+            self._read_size()  # max deleted id seq
+            self._read_size()  # entries added
 
-    def parse(self):
+        # Consumer groups are not supported by the server, skip over them
+        for _ in range(self._read_size()):
+            self._read_blob()  # group name
+            self._read_size()  # last id ms
+            self._read_size()  # last id seq
+            if value_type >= TYPE_STREAM_LISTPACKS_2:
+                self._read_size()  # entries read
+            for _ in range(self._read_size()):
+                self._read(16)  # pending entry id
+                self._read(8)  # delivery time
+                self._read_size()  # delivery count
+            for _ in range(self._read_size()):
+                self._read_blob()  # consumer name
+                self._read(8)  # seen time
+                if value_type >= TYPE_STREAM_LISTPACKS_3:
+                    self._read(8)  # active time
+                for _ in range(self._read_size()):
+                    self._read(16)  # pending entry id
+        return stream
+
+    # File structure
+
+    def _parse_header(self):
+        header = bytes(self._read(9))
+        if header[:5] != b'REDIS' or not header[5:].isdigit():
+            raise RDBError("Invalid RDB file format or version")
+        self.version = int(header[5:])
+        if not 1 <= self.version <= MAX_RDB_VERSION:
+            raise RDBError(f"Unsupported RDB version {self.version}")
+
+    def entries(self):
+        """Yields (db_index, key, value, expire_ms) for every key in the file."""
+        self._parse_header()
+        db_index = 0
+        expire = None
+        while True:
+            opcode = self._read_byte()
+            if opcode == OPCODE_EXPIRETIME_MS:
+                expire = struct.unpack('<Q', self._read(8))[0]
+            elif opcode == OPCODE_EXPIRETIME:
+                expire = struct.unpack('<I', self._read(4))[0] * 1000
+            elif opcode == OPCODE_SELECTDB:
+                db_index = self._read_size()
+            elif opcode == OPCODE_RESIZEDB:
+                self._read_size()  # hash table size
+                self._read_size()  # expire table size
+            elif opcode == OPCODE_AUX:
+                name = self._read_string()
+                self.metadata[name] = self._read_string()
+            elif opcode == OPCODE_FREQ:
+                self._read(1)
+            elif opcode == OPCODE_IDLE:
+                self._read_size()
+            elif opcode == OPCODE_FUNCTION2:
+                self._read_blob()  # function library code, not supported
+            elif opcode in (OPCODE_FUNCTION_PRE_GA, OPCODE_MODULE_AUX):
+                raise RDBError(f"Unsupported RDB opcode {opcode:#x}")
+            elif opcode == OPCODE_EOF:
+                self._check_checksum()
+                return
+            else:
+                key = self._read_string()
+                value = self._read_value(opcode)
+                yield db_index, key, value, expire
+                expire = None
+
+    def _check_checksum(self):
+        if self.version < 5:
+            return
+        data_end = self.pos
+        self.end_checksum = bytes(self._read(8))
+        expected = struct.unpack('<Q', self.end_checksum)[0]
+        # A zero checksum means the writer had checksums disabled
+        if self.verify_checksum and expected != 0:
+            actual = crc64(0, self.buf[:data_end])
+            if actual != expected:
+                raise RDBError("RDB checksum mismatch")
+
+    def load_into(self, keyspace):
+        """Loads every live key into keyspace. Returns the number of keys loaded.
+
+        A missing file is an empty dataset; a corrupt one raises RDBError.
+        """
         try:
-            with open(self.filename, 'rb') as f:
-                self._parse_header(f)
-                while True:
-                    byte = f.read(1)
-                    if not byte:
-                        break
-                    byte = ord(byte)
-                    
-                    # Parse metadata sections (FA marks metadata)
-                    if byte == 0xFA:
-                        self._parse_metadata(f)
-                    # Parse database sections (FE marks a database subsection)
-                    elif byte == 0xFE:
-                        self.databases.append(self._parse_database(f))
-                    # Parse the end of file section (FF marks EOF)
-                    elif byte == 0xFF:
-                        self.end_checksum = f.read(8)
-                        break
-                    else:
-                        raise ValueError(f"Unknown section start: {hex(byte)}")
+            f = open(self.filename, 'rb')
         except FileNotFoundError:
-            print(f"Error: The file '{self.filename}' does not exist.")
-        except Exception as e:
-            print(f"An error occurred while parsing the file: {e}")
-
-    def _parse_header(self, f):
-        header = f.read(9)
-        if header != b'REDIS0011':
-            raise ValueError("Invalid RDB file format or version")
-        print(f"Header: {header.decode()}")
-
-    def _parse_metadata(self, f):
-        name = self._read_string(f)
-        value = self._read_string(f)
-        self.metadata[name] = value
-        print(f"Metadata - {name}: {value}")
-
-    def _parse_database(self, f):
-        db_index = self._read_size(f)
-        print(f"Database index: {db_index}")
-        database = {'index': db_index, 'hash_table': []}
-        
-        # Parse hash table size
-        f.read(1)  # Skip FB
-        key_size = self._read_size(f)
-        expire_size = self._read_size(f)
-        print(f"Key-Value Table Size: {key_size}, Expire Table Size: {expire_size}")
-
-        # Parse key-value pairs
-        for _ in range(key_size):
-            entry = self._parse_key_value(f)
-            database['hash_table'].append(entry)
-        
-        print(database)
-        return database
-
-    def _parse_key_value(self, f):
-        entry = {}
-        entry['expire'] = infinite_time
-
-        expire_type = ord(f.peek(1)[:1])  # Peek at the next byte without consuming it
-
-        # Optional expire information
-        if expire_type == 0xFD:
-            f.read(1)  # Consume the expiration marker byte
-            entry['expire'] = datetime.fromtimestamp(struct.unpack('<I', f.read(4))[0])  # Expire timestamp in seconds
-        elif expire_type == 0xFC:
-            f.read(1)  # Consume the expiration marker byte
-            entry['expire'] = datetime.fromtimestamp(struct.unpack('<Q', f.read(8))[0] / 1000) # Expire timestamp in milliseconds
-
-
-
-        # Value type
-        entry['type'] = ord(f.read(1))
-
-        # Key and value
-        entry['key'] = self._read_string(f)
-        entry['value'] = self._read_string(f)
-        print(f"Entry - Key: {entry['key']}, Value: {entry['value']}, Expire: {entry.get('expire', 'None')}")
-
-        return entry
-
-    def _read_size(self, f):
-        size_byte = ord(f.read(1))
-        if size_byte & 0xC0 == 0xC0:
-            # Special encoding for integers
-            encoding_type = size_byte
-            if encoding_type == 0xC0:  # 8-bit integer
-                value = ord(f.read(1))
-            elif encoding_type == 0xC1:  # 16-bit integer
-                value = struct.unpack('<H', f.read(2))[0]
-            elif encoding_type == 0xC2:  # 32-bit integer
-                value = struct.unpack('<I', f.read(4))[0]
-            else:
-                raise ValueError("Unsupported integer encoding")
-            return ("int", value)
-        elif size_byte & 0x80:
-            size = ((size_byte & 0x3F) << 8) | ord(f.read(1))
-        elif size_byte == 0xFE:
-            size = struct.unpack('>I', f.read(4))[0]
-        else:
-            size = size_byte
-        return size
+            logger.info(f"RDB file '{self.filename}' does not exist, starting with an empty dataset")
+            return 0
 
-    def _read_string(self, f):
-        length = self._read_size(f)
-        if length is None:
-            return None
-        elif isinstance(length, tuple) and length[0] == "int":
-            # Handle special integer encoding
-            return str(length[1])
-        else:
-            return f.read(length).decode()
+        started = time.monotonic()
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                raise RDBError("RDB file is empty")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                loaded = self.load_buffer(keyspace, mapped)
+
+        elapsed = max(time.monotonic() - started, 1e-9)
+        logger.info(f"DB loaded from disk: {loaded} keys, {size} bytes in {elapsed:.3f} seconds "
+              f"({size / elapsed / (1024 * 1024):.1f} MB/s)")
+        return loaded
+
+    def load_buffer(self, keyspace, data):
+        """Loads an RDB payload that is already in memory, such as the one
+        a master sends on full resync. Returns the number of keys loaded.
+
+        Expired keys are dropped only when the keyspace deletes expired keys
+        itself. A replica keeps them, hidden, until the master's DEL comes.
+        """
+        self.buf = memoryview(data)
+        self.pos = 0
+        try:
+            loaded = 0
+            now = now_ms()
+            skip_expired = keyspace.expire_mode is EXPIRE_DELETE
+            for _, key, value, expire in self.entries():
+                if skip_expired and expire is not None and expire <= now:
+                    continue
+                if type(value) is str:
+                    keyspace.set_string(key, value, expire)
+                else:
+                    keyspace.set(key, value, expire)
+                loaded += 1
+        except IndexError:
+            raise RDBError("Unexpected end of RDB file")
+        finally:
+            self.buf.release()
+            self.buf = None
+        return loaded
 
     def get_metadata(self):
         return self.metadata
 
-    def get_databases(self):
-        return self.databases
-
     def get_checksum(self):
         return self.end_checksum
 
-
-# Usage example
-if __name__ == "__main__":
-    parser = RDBParser("dump.rdb")
-    parser.parse()
-    print("Metadata:", parser.get_metadata())
-    print("Databases:", parser.get_databases())
-    print("End Checksum:", parser.get_checksum())
\ No newline at end of file
@@ -0,0 +1,298 @@
+import os
+import struct
+import time
+from app.crc64 import crc64
+from app.expires import now_ms
+from app.rdbReader import (
+    _backlen_size,
+    ENC_INT8, ENC_INT16, ENC_INT32,
+    OPCODE_AUX, OPCODE_EOF, OPCODE_EXPIRETIME_MS, OPCODE_RESIZEDB, OPCODE_SELECTDB,
+    QUICKLIST_NODE_PACKED, STREAM_ITEM_FLAG_SAMEFIELDS,
+    TYPE_HASH, TYPE_HASH_LISTPACK, TYPE_LIST_QUICKLIST_2, TYPE_SET, TYPE_SET_INTSET, TYPE_SET_LISTPACK,
+    TYPE_STREAM_LISTPACKS_3, TYPE_STRING, TYPE_ZSET_2, TYPE_ZSET_LISTPACK,
+)
+from app.datatypes import limits
+from app.keyspace import encode_string
+from app.stream import split_id
+
+RDB_VERSION = 11
+
+# Same as Redis' stream-node-max-entries default
+STREAM_NODE_MAX_ENTRIES = 100
+
+# Value type written for each kind and encoding of non-string value; like
+# in Redis, compactly encoded values are saved in the matching compact form
+VALUE_TYPES = {
+    ('list', 'listpack'): TYPE_LIST_QUICKLIST_2,
+    ('list', 'quicklist'): TYPE_LIST_QUICKLIST_2,
+    ('set', 'intset'): TYPE_SET_INTSET,
+    ('set', 'listpack'): TYPE_SET_LISTPACK,
+    ('set', 'hashtable'): TYPE_SET,
+    ('hash', 'listpack'): TYPE_HASH_LISTPACK,
+    ('hash', 'hashtable'): TYPE_HASH,
+    ('zset', 'listpack'): TYPE_ZSET_LISTPACK,
+    ('zset', 'skiplist'): TYPE_ZSET_2,
+    ('stream', 'stream'): TYPE_STREAM_LISTPACKS_3,
+}
+
+# Bytes collected before they are checksummed and handed to write()
+WRITE_CHUNK_SIZE = 64 * 1024
+
+
+def _encode(text):
+    return text.encode('utf-8', 'surrogateescape')
+
+
+def _encode_length(length):
+    if length < 1 << 6:
+        return bytes((length,))
+    if length < 1 << 14:
+        return bytes((0x40 | (length >> 8), length & 0xFF))
+    if length < 1 << 32:
+        return b'\x80' + struct.pack('>I', length)
+    return b'\x81' + struct.pack('>Q', length)
+
+
+def _backlen(size):
+    """Listpack back-length: the entry size, 7 bits per byte, readable backwards."""
+    chunks = [(size >> (7 * i)) & 127 for i in reversed(range(_backlen_size(size)))]
+    return bytes([chunks[0]] + [chunk | 128 for chunk in chunks[1:]])
+
+
+def _listpack_entry(element):
+    if type(element) is int:
+        if 0 <= element <= 127:
+            entry = bytes((element,))
+        elif -4096 <= element <= 4095:
+            element &= 0x1FFF
+            entry = bytes((0xC0 | (element >> 8), element & 0xFF))
+        elif -32768 <= element <= 32767:
+            entry = b'\xf1' + struct.pack('<h', element)
+        elif -(1 << 23) <= element < 1 << 23:
+            entry = b'\xf2' + element.to_bytes(3, 'little', signed=True)
+        elif -(1 << 31) <= element < 1 << 31:
+            entry = b'\xf3' + struct.pack('<i', element)
+        else:
+            entry = b'\xf4' + struct.pack('<q', element)
+    else:
+        length = len(element)
+        if length < 64:
+            entry = bytes((0x80 | length,)) + element
+        elif length < 4096:
+            entry = bytes((0xE0 | (length >> 8), length & 0xFF)) + element
+        else:
+            entry = b'\xf0' + struct.pack('<I', length) + element
+    return entry + _backlen(len(entry))
+
+
+def encode_listpack(elements):
+    """Builds a listpack out of ints and bytes."""
+    body = b''.join(_listpack_entry(element) for element in elements)
+    count = len(elements) if len(elements) < 65535 else 65535
+    return struct.pack('<IH', 6 + len(body) + 1, count) + body + b'\xff'
+
+
+def _listpack_element(text):
+    """Canonical integers go in as ints, like Redis stores them."""
+    number = encode_string(text)
+    return number if type(number) is int else _encode(text)
+
+
+def _listpack_score(score):
+    if score.is_integer() and -(1 << 63) <= score < 1 << 63:
+        return int(score)
+    return _encode(repr(score))
+
+
+def encode_intset(numbers):
+    """Builds an intset out of sorted ints, in the narrowest width that fits them all."""
+    low = numbers[0] if numbers else 0
+    high = numbers[-1] if numbers else 0
+    for width, fmt in ((2, 'h'), (4, 'i'), (8, 'q')):
+        bound = 1 << (8 * width - 1)
+        if -bound <= low and high < bound:
+            break
+    return struct.pack(f'<II{len(numbers)}{fmt}', width, len(numbers), *numbers)
+
+
+class RDBWriter:
+    """Serializes a Keyspace into the RDB format RDBParser reads.
+
+    Output goes to write(chunk) in WRITE_CHUNK_SIZE pieces with the CRC64
+    trailer computed on the way, so a snapshot can be streamed straight to
+    a file or a replica socket without being held in memory.
+    """
+
+    def __init__(self, write, checksum=True):
+        self.write = write
+        self.checksum = checksum
+        self.crc = 0
+        self.buf = bytearray()
+
+    def _flush(self):
+        if self.checksum:
+            self.crc = crc64(self.crc, self.buf)
+        self.write(bytes(self.buf))
+        self.buf.clear()
+
+    def _put(self, data):
+        self.buf += data
+        if len(self.buf) >= WRITE_CHUNK_SIZE:
+            self._flush()
+
+    def _put_blob(self, data):
+        self._put(_encode_length(len(data)))
+        self._put(data)
+
+    def _put_string(self, value):
+        """Writes a str or int string value, ints in their compact encodings."""
+        if type(value) is int:
+            if -(1 << 7) <= value < 1 << 7:
+                self._put(bytes((0xC0 | ENC_INT8,)) + struct.pack('<b', value))
+                return
+            if -(1 << 15) <= value < 1 << 15:
+                self._put(bytes((0xC0 | ENC_INT16,)) + struct.pack('<h', value))
+                return
+            if -(1 << 31) <= value < 1 << 31:
+                self._put(bytes((0xC0 | ENC_INT32,)) + struct.pack('<i', value))
+                return
+            value = str(value)
+        self._put_blob(_encode(value))
+
+    def _put_aux(self, name, value):
+        self._put(bytes((OPCODE_AUX,)))
+        self._put_string(name)
+        self._put_string(value)
+
+    def _put_key_value(self, key, value):
+        if type(value) is str or type(value) is int:
+            self._put(bytes((TYPE_STRING,)))
+            self._put_string(key)
+            self._put_string(value)
+            return
+
+        value_type = VALUE_TYPES.get((value.type_name, value.encoding))
+        if value_type is None:
+            raise ValueError(f"Cannot serialize values of type {value.type_name}")
+        self._put(bytes((value_type,)))
+        self._put_string(key)
+        if value_type == TYPE_LIST_QUICKLIST_2:
+            items = list(value)
+            nodes = range(0, len(items), limits.list_max_listpack_size)
+            self._put(_encode_length(len(nodes)))
+            for node_start in nodes:
+                self._put(_encode_length(QUICKLIST_NODE_PACKED))
+                node = items[node_start:node_start + limits.list_max_listpack_size]
+                self._put_blob(encode_listpack([_listpack_element(item) for item in node]))
+        elif value_type == TYPE_SET_INTSET:
+            self._put_blob(encode_intset(value.members))
+        elif value_type == TYPE_SET_LISTPACK:
+            self._put_blob(encode_listpack([_listpack_element(member) for member in value]))
+        elif value_type == TYPE_SET:
+            self._put(_encode_length(len(value)))
+            for member in value:
+                self._put_string(member)
+        elif value_type == TYPE_HASH_LISTPACK:
+            self._put_blob(encode_listpack([_listpack_element(text) for pair in value.items() for text in pair]))
+        elif value_type == TYPE_HASH:
+            self._put(_encode_length(len(value)))
+            for field, field_value in value.items():
+                self._put_string(field)
+                self._put_string(field_value)
+        elif value_type == TYPE_ZSET_LISTPACK:
+            elements = []
+            for member, score in value.items():
+                elements += (_listpack_element(member), _listpack_score(score))
+            self._put_blob(encode_listpack(elements))
+        elif value_type == TYPE_ZSET_2:
+            self._put(_encode_length(len(value)))
+            for member, score in value.items():
+                self._put_string(member)
+                self._put(struct.pack('<d', score))
+        else:
+            self._put_stream(value)
+
+    def _put_stream(self, stream):
+        ids = stream.ids
+        entries = stream.entries
+        nodes = range(0, len(ids), STREAM_NODE_MAX_ENTRIES)
+        self._put(_encode_length(len(nodes)))
+        for node_start in nodes:
+            node_end = min(node_start + STREAM_NODE_MAX_ENTRIES, len(ids))
+            master_ms, master_seq = split_id(ids[node_start])
+            master_fields = entries[node_start][0::2]
+
+            elements = [node_end - node_start, 0, len(master_fields)]
+            elements += [_encode(field) for field in master_fields]
+            elements.append(0)
+            for i in range(node_start, node_end):
+                ms, seq = split_id(ids[i])
+                fields = entries[i]
+                if fields[0::2] == master_fields:
+                    elements += [STREAM_ITEM_FLAG_SAMEFIELDS, ms - master_ms, seq - master_seq]
+                    elements += [_encode(v) for v in fields[1::2]]
+                    elements.append(3 + len(master_fields))
+                else:
+                    elements += [0, ms - master_ms, seq - master_seq, len(fields) // 2]
+                    elements += [_encode(v) for v in fields]
+                    elements.append(4 + len(fields))
+
+            self._put_blob(struct.pack('>QQ', master_ms, master_seq))
+            self._put_blob(encode_listpack(elements))
+
+        last_ms, last_seq = split_id(stream.last_id)
+        first_ms, first_seq = split_id(ids[0]) if ids else (0, 0)
+        for number in (len(ids), last_ms, last_seq, first_ms, first_seq,
+                       0, 0,  # max deleted entry id
+                       len(ids)):  # entries added
+            self._put(_encode_length(number))
+        self._put(_encode_length(0))  # consumer groups
+
+    def save(self, keyspace):
+        """Writes the whole keyspace, then the EOF opcode and checksum."""
+        self._put(b'REDIS%04d' % RDB_VERSION)
+        self._put_aux('redis-ver', '7.2.0')
+        self._put_aux('redis-bits', 64)
+        self._put_aux('ctime', int(time.time()))
+        self._put_aux('aof-base', 0)
+
+        data = keyspace.data
+        expires = keyspace.expires
+        if data:
+            self._put(bytes((OPCODE_SELECTDB,)) + _encode_length(0))
+            self._put(bytes((OPCODE_RESIZEDB,)) + _encode_length(len(data)) + _encode_length(len(expires)))
+            now = now_ms()
+            for key, value in data.items():
+                expire = expires.get(key)
+                if expire is not None:
+                    if expire <= now:
+                        continue
+                    if expire >= 1 << 63:
+                        raise ValueError(f"Expire time {expire} of key {key!r} does not fit in 64 bits")
+                    self._put(bytes((OPCODE_EXPIRETIME_MS,)) + struct.pack('<Q', expire))
+                self._put_key_value(key, value)
+
+        self._put(bytes((OPCODE_EOF,)))
+        self._flush()
+        self.write(struct.pack('<Q', self.crc if self.checksum else 0))
+
+
+def save_to_file(keyspace, filename, checksum=True):
+    """Writes an RDB snapshot to filename atomically.
+
+    The dump goes to a temporary file that is fsync'd and renamed over
+    filename, so a crash never leaves a half-written RDB behind.
+    """
+    temp_filename = os.path.join(os.path.dirname(filename) or '.', f"temp-{os.getpid()}.rdb")
+    try:
+        with open(temp_filename, 'wb') as f:
+            RDBWriter(f.write, checksum).save(keyspace)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_filename, filename)
+    except BaseException:
+        try:
+            os.unlink(temp_filename)
+        except OSError:
+            pass
+        raise
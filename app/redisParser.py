@@ -1,158 +1,259 @@
+class SimpleString(str):
+    """A reply string that is encoded as a RESP simple string (``+...``)."""
+
+
+# Replies for 0..SMALL_INTEGER_COUNT-1 are built once and shared
+SMALL_INTEGER_COUNT = 1024
+SMALL_INTEGERS = [b":%d\r\n" % i for i in range(SMALL_INTEGER_COUNT)]
+
+
+class ParseState:
+    """Progress through a partly received element, kept between reads.
+
+    Lets RedisParser.consume_stream continue where the previous read
+    stopped instead of parsing a large command from its first byte again.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # [elements parsed so far, elements still expected] for every open
+        # array, outermost first
+        self.arrays = []
+        # Bytes of the unfinished top-level element consumed so far
+        self.consumed = 0
+
+
 class RedisParser:
-    HARD_CODED_RDB_HEX = (
-        "524544495330303131fa0972656469732d76657205372e322e30fa0a72656469732d62697473"
-        "c040fa056374696d65c26d08bc65fa08757365642d6d656dc2b0c41000fa08616f662d626173"
-        "65c000fff06e3bfec0ff5aa2"
-    )
+    # Preencoded replies for the most common responses
+    OK = b"+OK\r\n"
+    PONG = b"+PONG\r\n"
+    QUEUED = b"+QUEUED\r\n"
+    NULL = b"$-1\r\n"
+    EMPTY_ARRAY = b"*0\r\n"
+    NULL_ARRAY = b"*-1\r\n"
 
     def parse(self, data):
         if not data:
             raise ValueError("No data to parse")
-        
+
+        results, consumed = self.parse_stream(data)
+        if consumed != len(data):
+            raise ValueError("Incomplete RESP data")
+        return results
+
+    def parse_stream(self, buffer):
+        """Parses every complete RESP element at the front of ``buffer``.
+
+        Returns the parsed elements and the number of bytes they occupied.
+        A trailing partial frame is left unconsumed so the caller can keep
+        it until the next read completes it.
+        """
         results = []
         offset = 0
+        end = len(buffer)
 
-        while offset < len(data):
-            element, next_offset = self.parse_element(data[offset:])
+        while offset < end:
+            element, next_offset = self.parse_element(buffer, offset)
+            if next_offset == -1:
+                break
             results.append(element)
-            offset += next_offset
+            offset = next_offset
 
-        return results
+        return results, offset
+
+    def consume_stream(self, buffer, state):
+        """Parses the complete RESP elements at the front of the bytearray
+        ``buffer`` and removes every byte it has parsed from it.
+
+        Elements of an array that is still arriving are removed too, and the
+        array is kept in ``state`` until a later call completes it. Each byte
+        is parsed once no matter how many reads a command is spread over.
+        Returns the elements and the number of bytes each took on the wire.
+        """
+        results = []
+        sizes = []
+        arrays = state.arrays
+        offset = 0
+        # Where the current top-level element starts within buffer
+        start = 0
+        end = len(buffer)
+
+        while offset < end:
+            if buffer[offset] == 0x2A:  # '*'
+                end_of_len = buffer.find(b'\r\n', offset)
+                if end_of_len == -1:
+                    break
+                length = int(buffer[offset + 1:end_of_len])
+                offset = end_of_len + 2
+                if length > 0:
+                    arrays.append([[], length])
+                    continue
+                element = None if length == -1 else []
+            else:
+                element, next_offset = self.parse_element(buffer, offset)
+                if next_offset == -1:
+                    break
+                offset = next_offset
+
+            # Hand the element to its array, closing every array it completes
+            while arrays:
+                array = arrays[-1]
+                array[0].append(element)
+                array[1] -= 1
+                if array[1]:
+                    break
+                arrays.pop()
+                element = array[0]
+            else:
+                results.append(element)
+                sizes.append(state.consumed + offset - start)
+                state.consumed = 0
+                start = offset
 
-    def parse_simple_string(self, data):
-        end_of_str = data.find(b'\r\n')
+        state.consumed += offset - start
+        del buffer[:offset]
+        return results, sizes
+
+    # Every parse_* method takes the whole buffer plus the offset of the
+    # element's type byte and returns (element, offset after the element).
+    # An offset of -1 means the element is not fully buffered yet.
+
+    def parse_simple_string(self, data, offset):
+        end_of_str = data.find(b'\r\n', offset)
         if end_of_str == -1:
-            raise ValueError("Malformed RESP simple string")
-        return data[1:end_of_str].decode('utf-8'), end_of_str + 2
+            return None, -1
+        return bytes(data[offset + 1:end_of_str]).decode('utf-8', 'surrogateescape'), end_of_str + 2
 
-    def parse_error(self, data):
-        end_of_err = data.find(b'\r\n')
+    def parse_error(self, data, offset):
+        end_of_err = data.find(b'\r\n', offset)
         if end_of_err == -1:
-            raise ValueError("Malformed RESP error")
-        return Exception(data[1:end_of_err].decode('utf-8')), end_of_err + 2
+            return None, -1
+        return Exception(bytes(data[offset + 1:end_of_err]).decode('utf-8', 'surrogateescape')), end_of_err + 2
 
-    def parse_integer(self, data):
-        end_of_int = data.find(b'\r\n')
+    def parse_integer(self, data, offset):
+        end_of_int = data.find(b'\r\n', offset)
         if end_of_int == -1:
-            raise ValueError("Malformed RESP integer")
-        return int(data[1:end_of_int]), end_of_int + 2
+            return None, -1
+        return int(data[offset + 1:end_of_int]), end_of_int + 2
 
-    """ def parse_bulk_string(self, data):
-        end_of_len = data.find(b'\r\n')
-        if end_of_len == -1:
-            raise ValueError("Malformed RESP bulk string length")
-        length = int(data[1:end_of_len])
-        if length == -1:
-            return None, end_of_len + 2  # RESP `nil` bulk string
-        
-        start = end_of_len + 2
-        end = start + length
-        if len(data) < end + 2:
-            raise ValueError("Malformed RESP bulk string content")
-        return data[start:end].decode('utf-8'), end + 2 """
-    
-    def parse_bulk_string(self, data):
+    def parse_bulk_string(self, data, offset):
         # Find the end of the bulk string length declaration
-        end_of_len = data.find(b'\r\n')
+        end_of_len = data.find(b'\r\n', offset)
         if end_of_len == -1:
-            raise ValueError("Malformed RESP bulk string length")
+            return None, -1
 
         # Get the length of the bulk string contents
-        length = int(data[1:end_of_len])
+        length = int(data[offset + 1:end_of_len])
+        if length == -1:
+            return None, end_of_len + 2  # RESP `nil` bulk string
 
         # Calculate start and end of the bulk string contents
         start = end_of_len + 2
         end = start + length
+        if len(data) < end:
+            return None, -1
 
-        # Check if the content matches the hardcoded RDB file hex value
-        content_hex = data[start:end].hex()
-        if content_hex == self.HARD_CODED_RDB_HEX:
-            return "RDB File Content", end
-
-        # Otherwise, handle as a normal bulk string
-        if len(data) < end + 2 or data[end:end + 2] != b'\r\n':
+        if len(data) < end + 2:
+            return None, -1
+        if data[end:end + 2] != b'\r\n':
             raise ValueError("Malformed RESP bulk string content")
 
-        return data[start:end].decode('utf-8'), end + 2
+        return bytes(data[start:end]).decode('utf-8', 'surrogateescape'), end + 2
 
-    def parse_array(self, data):
-        end_of_len = data.find(b'\r\n')
+    def parse_array(self, data, offset):
+        end_of_len = data.find(b'\r\n', offset)
         if end_of_len == -1:
-            raise ValueError("Malformed RESP array length")
-        length = int(data[1:end_of_len])
+            return None, -1
+        length = int(data[offset + 1:end_of_len])
         if length == -1:
             return None, end_of_len + 2  # RESP `nil` array
 
         elements = []
         offset = end_of_len + 2
         for _ in range(length):
-            element, next_offset = self.parse_element(data[offset:])
+            element, offset = self.parse_element(data, offset)
+            if offset == -1:
+                return None, -1
             elements.append(element)
-            offset += next_offset
         return elements, offset
 
-    def parse_element(self, data):
-        if data.startswith(b'+'):
-            return self.parse_simple_string(data)
-        elif data.startswith(b'-'):
-            return self.parse_error(data)
-        elif data.startswith(b':'):
-            return self.parse_integer(data)
-        elif data.startswith(b'$'):
-            return self.parse_bulk_string(data)
-        elif data.startswith(b'*'):
-            return self.parse_array(data)
+    def parse_element(self, data, offset=0):
+        if offset >= len(data):
+            return None, -1
+        prefix = data[offset]
+        if prefix == 0x2A:  # '*'
+            return self.parse_array(data, offset)
+        elif prefix == 0x24:  # '$'
+            return self.parse_bulk_string(data, offset)
+        elif prefix == 0x2B:  # '+'
+            return self.parse_simple_string(data, offset)
+        elif prefix == 0x3A:  # ':'
+            return self.parse_integer(data, offset)
+        elif prefix == 0x2D:  # '-'
+            return self.parse_error(data, offset)
         else:
             raise ValueError("Unknown RESP type")
-        
-
-
 
     def to_resp(self, data):
         """Converts Python data types to RESP format."""
+        if type(data) is bytes:
+            return data
+        out = bytearray()
+        self.encode_into(data, out)
+        return bytes(out)
+
+    def encode_into(self, data, out):
+        """Appends the RESP encoding of ``data`` to the bytearray ``out``.
+
+        Nested arrays are written into the same buffer in a single pass.
+        """
         if isinstance(data, str):
-            return self.to_resp_string(data)
+            if type(data) is SimpleString:
+                out += b"+" + data.encode('utf-8', 'surrogateescape') + b"\r\n"
+            else:
+                encoded = data.encode('utf-8', 'surrogateescape')
+                out += b"$%d\r\n" % len(encoded)
+                out += encoded
+                out += b"\r\n"
         elif isinstance(data, int):
-            return self.to_resp_integer(data)
-        elif isinstance(data, list) or isinstance(data, tuple):
-            return self.to_resp_array(data)
+            out += self.to_resp_integer(data)
+        elif isinstance(data, (list, tuple)):
+            out += b"*%d\r\n" % len(data)
+            for element in data:
+                self.encode_into(element, out)
         elif data is None:
-            return self.to_resp_null()
+            out += self.NULL
         elif isinstance(data, Exception):
-            return self.to_resp_error(data)
+            out += self.to_resp_error(data)
+        elif isinstance(data, bytes):
+            # Already encoded reply fragment, such as RedisParser.OK
+            out += data
         else:
             raise ValueError(f"Unsupported data type: {type(data)}")
 
     def to_resp_string(self, data):
-        """ if '\r' in data or '\n' in data:
-            # Convert to Bulk String if it contains line breaks
-            return f"${len(data)}\r\n{data}\r\n"
-        else:
-            # Simple String otherwise
-            return f"+{data}\r\n" """
-        return f"${len(data)}\r\n{data}\r\n"
-    
+        encoded = data.encode('utf-8', 'surrogateescape')
+        return b"$%d\r\n%s\r\n" % (len(encoded), encoded)
+
     def to_resp_simple_string(self, data):
-        return f"+{data}\r\n"
+        return b"+" + data.encode('utf-8', 'surrogateescape') + b"\r\n"
 
     def to_resp_integer(self, data):
-        return f":{data}\r\n"
+        if 0 <= data < SMALL_INTEGER_COUNT:
+            return SMALL_INTEGERS[data]
+        return b":%d\r\n" % data
 
     def to_resp_array(self, data):
-        elements = ''.join([self.to_resp(element) for element in data])
-        return f"*{len(data)}\r\n{elements}"
+        out = bytearray()
+        self.encode_into(list(data), out)
+        return bytes(out)
 
     def to_resp_null(self):
         # Represents a null bulk string
-        return "$-1\r\n"
-    
-    def to_empty_RDB(self):
-        hex_string = self.HARD_CODED_RDB_HEX
-        byte_string = bytes.fromhex(hex_string)
-        length_string = f"${len(byte_string)}\r\n"
-        return length_string.encode() + byte_string
-
+        return self.NULL
 
     def to_resp_error(self, data):
         # Represents an error message
-        return f"-{str(data)}\r\n"
\ No newline at end of file
+        return b"-" + str(data).encode('utf-8', 'surrogateescape') + b"\r\n"
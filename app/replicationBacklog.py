@@ -0,0 +1,58 @@
+class ReplicationBacklog:
+    """Fixed-size circular buffer holding the tail of the replication stream.
+
+    ``offset`` is the master replication offset: the number of bytes ever
+    appended. Only the last ``size`` of them are kept. A replica that
+    reconnects and asks for an offset still inside the buffer is sent
+    just the part it missed.
+
+    Offsets passed to covers() and read_from() use the PSYNC convention:
+    the offset of the first byte the replica still needs, i.e. its own
+    replication offset plus one.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.buf = bytearray(size)
+        self.offset = 0
+        # Bytes of history held, at most size
+        self.histlen = 0
+        # Where the next byte goes
+        self.idx = 0
+
+    def append(self, data):
+        size = self.size
+        self.offset += len(data)
+        if len(data) >= size:
+            self.buf[:] = data[-size:]
+            self.idx = 0
+            self.histlen = size
+            return
+        end = self.idx + len(data)
+        if end <= size:
+            self.buf[self.idx:end] = data
+        else:
+            first = size - self.idx
+            self.buf[self.idx:] = data[:first]
+            self.buf[:end - size] = data[first:]
+        self.idx = end % size
+        self.histlen = min(self.histlen + len(data), size)
+
+    def first_offset(self):
+        """PSYNC offset of the oldest byte still held."""
+        return self.offset - self.histlen + 1
+
+    def covers(self, psync_offset):
+        return self.first_offset() <= psync_offset <= self.offset + 1
+
+    def read_from(self, psync_offset):
+        """Returns every byte from psync_offset to the end of the stream."""
+        skip = psync_offset - self.first_offset()
+        length = self.histlen - skip
+        if length <= 0:
+            return b""
+        start = (self.idx - length) % self.size
+        end = start + length
+        if end <= self.size:
+            return bytes(self.buf[start:end])
+        return bytes(self.buf[start:]) + bytes(self.buf[:end - self.size])
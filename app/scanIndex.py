@@ -0,0 +1,101 @@
+HASH_BITS = 64
+HASH_MASK = (1 << HASH_BITS) - 1
+
+# A bucket splits in two once it holds more keys than this
+BUCKET_SIZE = 32
+# Empty buckets a SCAN call may step over per key asked for, as in Redis
+EMPTY_VISITS_PER_KEY = 10
+
+
+class Bucket(list):
+    """Keys whose hashes agree in their lowest ``depth`` bits."""
+
+    __slots__ = ('depth',)
+
+
+def _reverse(position):
+    return int(f'{position:064b}'[::-1], 2)
+
+
+class ScanIndex:
+    """The keys grouped into hash buckets, for SCAN's stateless cursors.
+
+    Extendible hashing: ``directory`` has 2 ** ``depth`` slots. Slot i
+    holds the bucket for every key whose hash ends in the bits of i, and
+    a bucket of smaller depth d is shared by all slots that agree in
+    their lowest d bits. A full bucket splits on its next hash bit,
+    which only moves its own keys. When it is as deep as the directory,
+    the directory doubles first, which only copies references.
+
+    Read with their bits reversed, the hashes of a bucket form one
+    contiguous range, and a split cuts that range in two. A cursor is a
+    position in this reversed order: the start of the next bucket to
+    return. Ranges are only ever cut, never merged, so the position stays
+    the start of a bucket however keys come and go. The cursor needs no
+    state on the server, never expires, and every key that exists for
+    the whole scan is returned at least once.
+    """
+
+    def __init__(self):
+        bucket = Bucket()
+        bucket.depth = 0
+        self.directory = [bucket]
+        self.depth = 0
+        # Low hash bits that pick a directory slot
+        self.mask = 0
+
+    def add(self, key):
+        bucket = self.directory[hash(key) & self.mask]
+        bucket.append(key)
+        if len(bucket) > BUCKET_SIZE and bucket.depth < HASH_BITS:
+            self._split(bucket)
+
+    def remove(self, key):
+        self.directory[hash(key) & self.mask].remove(key)
+
+    def _split(self, bucket):
+        depth = bucket.depth
+        if depth == self.depth:
+            self.directory += self.directory
+            self.depth += 1
+            self.mask = (1 << self.depth) - 1
+        bit = 1 << depth
+        pattern = hash(bucket[0]) & (bit - 1)
+        low = []
+        high = Bucket()
+        for key in bucket:
+            (high if hash(key) & bit else low).append(key)
+        bucket[:] = low
+        bucket.depth = high.depth = depth + 1
+        # Slots that shared the bucket and have the new bit set move over
+        directory = self.directory
+        slots = range(pattern | bit, len(directory), bit << 1)
+        directory[slots.start::slots.step] = [high] * len(slots)
+
+    def scan(self, cursor, count):
+        """Returns (next_cursor, keys) for one SCAN step, cursor 0 when done.
+
+        Whole buckets are returned until there are at least ``count`` keys,
+        so a key may come back more than once if its bucket was split
+        between calls. Raises ValueError for a cursor outside 64 bits.
+        """
+        if not 0 <= cursor <= HASH_MASK:
+            raise ValueError("cursor out of range")
+        keys = []
+        empty_visits = count * EMPTY_VISITS_PER_KEY
+        directory = self.directory
+        mask = self.mask
+        while True:
+            bucket = directory[_reverse(cursor) & mask]
+            keys += bucket
+            # The bucket's range ends at the next multiple of its size
+            size = 1 << (HASH_BITS - bucket.depth)
+            cursor = (cursor | (size - 1)) + 1
+            if cursor > HASH_MASK:
+                return 0, keys
+            if len(keys) >= count:
+                return cursor, keys
+            if not bucket:
+                empty_visits -= 1
+                if not empty_visits:
+                    return cursor, keys
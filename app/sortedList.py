@@ -0,0 +1,154 @@
+from bisect import bisect_left, bisect_right, insort
+
+# Buckets are split once they hold twice this many elements
+BUCKET_LOAD = 256
+
+
+class SortedList:
+    """Sorted sequence with logarithmic insert, remove, search and rank.
+
+    Elements live in sorted buckets of at most 2 * BUCKET_LOAD items.
+    ``maxes`` holds the last element of every bucket, so finding the
+    bucket for a value is a bisect. A Fenwick tree over the bucket sizes
+    turns a bucket into the position of its first element and a position
+    into its bucket, both in O(log n). Inserting into a bucket moves at
+    most 2 * BUCKET_LOAD pointers, a bounded cost, and the tree is only
+    rebuilt when a bucket is split or emptied.
+    """
+
+    def __init__(self, values=()):
+        values = sorted(values)
+        self.buckets = [values[i:i + BUCKET_LOAD] for i in range(0, len(values), BUCKET_LOAD)]
+        self.maxes = [bucket[-1] for bucket in self.buckets]
+        self.length = len(values)
+        self._rebuild_tree()
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for bucket in self.buckets:
+            yield from bucket
+
+    # Fenwick tree over the bucket sizes
+
+    def _rebuild_tree(self):
+        tree = [0] + [len(bucket) for bucket in self.buckets]
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def _tree_add(self, bucket, delta):
+        tree = self.tree
+        i = bucket + 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def _offset(self, bucket):
+        """Position of the first element of bucket."""
+        tree = self.tree
+        total = 0
+        i = bucket
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def _locate(self, position):
+        """(bucket, index in bucket) of the element at position."""
+        tree = self.tree
+        bucket = 0
+        step = 1 << (len(tree) - 1).bit_length()
+        while step:
+            candidate = bucket + step
+            if candidate < len(tree) and tree[candidate] <= position:
+                bucket = candidate
+                position -= tree[candidate]
+            step >>= 1
+        return bucket, position
+
+    # Changes
+
+    def add(self, value):
+        buckets = self.buckets
+        maxes = self.maxes
+        if not buckets:
+            buckets.append([value])
+            maxes.append(value)
+            self.length = 1
+            self._rebuild_tree()
+            return
+        b = bisect_left(maxes, value)
+        if b == len(maxes):
+            b -= 1
+        bucket = buckets[b]
+        insort(bucket, value)
+        maxes[b] = bucket[-1]
+        self.length += 1
+        if len(bucket) > 2 * BUCKET_LOAD:
+            buckets.insert(b + 1, bucket[BUCKET_LOAD:])
+            del bucket[BUCKET_LOAD:]
+            maxes.insert(b, bucket[-1])
+            self._rebuild_tree()
+        else:
+            self._tree_add(b, 1)
+
+    def remove(self, value):
+        """Removes one occurrence of value, which must be present."""
+        b = bisect_left(self.maxes, value)
+        bucket = self.buckets[b]
+        i = bisect_left(bucket, value)
+        if bucket[i] != value:
+            raise ValueError(f"{value!r} is not in the list")
+        del bucket[i]
+        self.length -= 1
+        if bucket:
+            self.maxes[b] = bucket[-1]
+            self._tree_add(b, -1)
+        else:
+            del self.buckets[b]
+            del self.maxes[b]
+            self._rebuild_tree()
+
+    # Lookups
+
+    def bisect_left(self, value):
+        b = bisect_left(self.maxes, value)
+        if b == len(self.maxes):
+            return self.length
+        return self._offset(b) + bisect_left(self.buckets[b], value)
+
+    def bisect_right(self, value):
+        b = bisect_right(self.maxes, value)
+        if b == len(self.maxes):
+            return self.length
+        return self._offset(b) + bisect_right(self.buckets[b], value)
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += self.length
+        if not 0 <= position < self.length:
+            raise IndexError("SortedList index out of range")
+        b, i = self._locate(position)
+        return self.buckets[b][i]
+
+    def slice(self, start, stop):
+        """Elements at positions start <= i < stop, in order."""
+        start = max(start, 0)
+        stop = min(stop, self.length)
+        if start >= stop:
+            return []
+        b, i = self._locate(start)
+        result = []
+        remaining = stop - start
+        buckets = self.buckets
+        while remaining > 0:
+            chunk = buckets[b][i:i + remaining]
+            result += chunk
+            remaining -= len(chunk)
+            b += 1
+            i = 0
+        return result
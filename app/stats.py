@@ -0,0 +1,90 @@
+import time
+from collections import deque
+
+# Bucket i counts durations d with d.bit_length() == i, i.e. 2**(i-1) <= d < 2**i
+# microseconds; 40 buckets reach beyond 2**39 us (six days)
+HISTOGRAM_BUCKETS = 40
+
+# Like Redis, slow log entries keep at most this many arguments and characters
+SLOWLOG_MAX_ARGC = 32
+SLOWLOG_MAX_ARGLEN = 128
+
+
+class LatencyHistogram:
+    """Command durations in power-of-two microsecond buckets.
+
+    Recording is a bit_length() and a list increment, cheap enough to run
+    on every call. Percentiles are reported as the upper bound of the
+    bucket they fall in, so they are accurate to a factor of two.
+    """
+
+    def __init__(self):
+        self.counts = [0] * HISTOGRAM_BUCKETS
+        self.total = 0
+
+    def record(self, usec):
+        self.counts[min(usec.bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+        self.total += 1
+
+    def percentile(self, fraction):
+        """Upper bound in microseconds below which fraction of the calls fall."""
+        if not self.total:
+            return 0
+        target = fraction * self.total
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return 1 << bucket
+        return 1 << (HISTOGRAM_BUCKETS - 1)
+
+    def cumulative(self):
+        """[bucket upper bound, calls at or below it, ...] for the non-empty range."""
+        reply = []
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            if count:
+                seen += count
+                reply += [1 << bucket, seen]
+        return reply
+
+
+class SlowLog:
+    """Bounded log of the commands that took longer than a threshold.
+
+    A threshold of 0 logs every command, a negative one disables the log.
+    """
+
+    def __init__(self, slower_than_usec=10000, max_len=128):
+        self.slower_than = slower_than_usec
+        self.entries = deque(maxlen=max_len)
+        self.next_id = 0
+
+    def set_max_len(self, max_len):
+        self.entries = deque(self.entries, maxlen=max_len)
+
+    def record(self, content, usec, client_address):
+        if self.slower_than < 0 or usec < self.slower_than:
+            return
+        args = content[:SLOWLOG_MAX_ARGC]
+        if len(content) > SLOWLOG_MAX_ARGC:
+            args[-1] = f"... ({len(content) - SLOWLOG_MAX_ARGC + 1} more arguments)"
+        args = [arg if len(arg) <= SLOWLOG_MAX_ARGLEN
+                else f"{arg[:SLOWLOG_MAX_ARGLEN]}... ({len(arg) - SLOWLOG_MAX_ARGLEN} more bytes)"
+                for arg in args]
+        if isinstance(client_address, tuple):
+            client_address = f"{client_address[0]}:{client_address[1]}"
+        self.entries.appendleft([self.next_id, int(time.time()), usec, args, str(client_address), ""])
+        self.next_id += 1
+
+    def get(self, count=10):
+        """The newest count entries, newest first; all of them for a negative count."""
+        if count < 0:
+            return list(self.entries)
+        return [entry for _, entry in zip(range(count), self.entries)]
+
+    def reset(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
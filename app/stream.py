@@ -0,0 +1,162 @@
+import sys
+from bisect import bisect_left, bisect_right
+
+from app.datatypes import CONTAINER_SIZE, LIST_SLOT_SIZE, string_memory
+
+SEQ_BITS = 64
+SEQ_MASK = (1 << SEQ_BITS) - 1
+MAX_MS = (1 << 64) - 1
+MIN_ID = 0
+MAX_ID = (MAX_MS << SEQ_BITS) | SEQ_MASK
+
+
+class StreamIdError(ValueError):
+    pass
+
+
+def make_id(ms, seq):
+    """Packs an (ms, seq) pair into one int that sorts like the pair."""
+    return (ms << SEQ_BITS) | seq
+
+
+def split_id(stream_id):
+    return stream_id >> SEQ_BITS, stream_id & SEQ_MASK
+
+
+def format_id(stream_id):
+    return f"{stream_id >> SEQ_BITS}-{stream_id & SEQ_MASK}"
+
+
+def _parse_id_part(text, limit):
+    """Parses the ms or seq part of an id: plain ASCII digits up to limit.
+
+    int() would also take signs, spaces and underscores such as '1_0'.
+    """
+    if not (text.isascii() and text.isdigit()):
+        raise StreamIdError("ERR Invalid stream ID specified as stream command argument")
+    value = int(text)
+    if value > limit:
+        raise StreamIdError("ERR Invalid stream ID specified as stream command argument")
+    return value
+
+
+def parse_id(text, missing_seq=0):
+    """Parses 'ms-seq' or 'ms' into a packed id.
+
+    missing_seq is used when the sequence part is left out, e.g. 0 for
+    the start of a range and SEQ_MASK for its end.
+    """
+    ms_part, sep, seq_part = text.partition('-')
+    ms = _parse_id_part(ms_part, MAX_MS)
+    seq = _parse_id_part(seq_part, SEQ_MASK) if sep else missing_seq
+    return make_id(ms, seq)
+
+
+def parse_range_bound(text, is_start):
+    """Parses an XRANGE bound: '-', '+', 'ms', 'ms-seq' or an exclusive '(id'."""
+    if text == '-':
+        return MIN_ID
+    if text == '+':
+        return MAX_ID
+    if text.startswith('('):
+        stream_id = parse_id(text[1:], 0 if is_start else SEQ_MASK)
+        if is_start:
+            if stream_id == MAX_ID:
+                raise StreamIdError("ERR invalid start ID for the interval")
+            return stream_id + 1
+        if stream_id == MIN_ID:
+            raise StreamIdError("ERR invalid end ID for the interval")
+        return stream_id - 1
+    return parse_id(text, 0 if is_start else SEQ_MASK)
+
+
+class Stream:
+    """Append-only log of entries ordered by id.
+
+    Ids are packed ints kept in a sorted list next to a parallel list of
+    flat [field, value, ...] lists. New ids are always larger than the
+    last one, so XADD is an O(1) append and every range lookup is a
+    bisect.
+    """
+
+    type_name = "stream"
+    encoding = "stream"
+
+    def __init__(self):
+        self.ids = []
+        self.entries = []
+        self.last_id = MIN_ID
+        # Estimated bytes used: per entry the id, its fields list and the
+        # slots of both in the parallel lists
+        self.memory = CONTAINER_SIZE
+
+    def __len__(self):
+        return len(self.ids)
+
+    def next_id(self, text, now_ms):
+        """Resolves the id argument of XADD ('*', 'ms-*' or 'ms-seq')."""
+        last_ms, last_seq = split_id(self.last_id)
+        if text == '*':
+            if self.last_id == MAX_ID:
+                raise StreamIdError("ERR The stream has exhausted the last possible ID, unable to add more items")
+            if now_ms > last_ms:
+                return make_id(now_ms, 0)
+            if last_seq == SEQ_MASK:
+                return make_id(last_ms + 1, 0)
+            return self.last_id + 1
+
+        ms_part, sep, seq_part = text.partition('-')
+        if sep and seq_part == '*':
+            ms = _parse_id_part(ms_part, MAX_MS)
+            if ms < last_ms or (ms == last_ms and self.ids and last_seq == SEQ_MASK):
+                raise StreamIdError("ERR The ID specified in XADD is equal or smaller than the target stream top item")
+            if ms == last_ms and self.ids:
+                return self.last_id + 1
+            return make_id(ms, 1 if ms == 0 else 0)
+
+        stream_id = parse_id(text)
+        if stream_id == MIN_ID:
+            raise StreamIdError("ERR The ID specified in XADD must be greater than 0-0")
+        if stream_id <= self.last_id:
+            raise StreamIdError("ERR The ID specified in XADD is equal or smaller than the target stream top item")
+        return stream_id
+
+    def add(self, stream_id, fields):
+        self.ids.append(stream_id)
+        self.entries.append(fields)
+        self.last_id = stream_id
+        self.memory += (sys.getsizeof(stream_id) + sys.getsizeof(fields) + 2 * LIST_SLOT_SIZE
+                        + sum(map(string_memory, fields)))
+
+    def _reply(self, lo, hi):
+        ids = self.ids
+        entries = self.entries
+        return [[format_id(ids[i]), entries[i]] for i in range(lo, hi)]
+
+    def range(self, start, end, count=None):
+        """Entries with start <= id <= end, oldest first."""
+        if start > end:
+            return []
+        lo = bisect_left(self.ids, start)
+        hi = bisect_right(self.ids, end)
+        if count is not None:
+            hi = min(hi, lo + count)
+        return self._reply(lo, hi)
+
+    def rev_range(self, end, start, count=None):
+        """Entries with start <= id <= end, newest first."""
+        if start > end:
+            return []
+        lo = bisect_left(self.ids, start)
+        hi = bisect_right(self.ids, end)
+        if count is not None:
+            lo = max(lo, hi - count)
+        return self._reply(lo, hi)[::-1]
+
+    def read_after(self, stream_id, count=None):
+        """Entries with an id strictly greater than stream_id (XREAD)."""
+        lo = bisect_right(self.ids, stream_id)
+        hi = len(self.ids)
+        if count is not None:
+            hi = min(hi, lo + count)
+        return self._reply(lo, hi)
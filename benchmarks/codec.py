@@ -0,0 +1,82 @@
+"""Micro-benchmarks for the RESP parser and encoders and the RDB loader.
+
+Run from the repository root and compare the JSON between versions:
+
+    python3 -m benchmarks.codec
+    python3 -m benchmarks.codec --repeat 7 --rdb-keys 200000
+"""
+import argparse
+import json
+import timeit
+
+from app.keyspace import Keyspace
+from app.rdbReader import RDBParser
+from app.rdbWriter import RDBWriter
+from app.redisParser import RedisParser
+from app.stream import Stream, make_id
+
+
+def build_rdb(keys):
+    """An RDB payload with string, integer and stream keys."""
+    keyspace = Keyspace()
+    for i in range(keys):
+        if i % 3 == 0:
+            keyspace.set_string(f"key:{i}", str(i))
+        else:
+            keyspace.set_string(f"key:{i}", f"value:{i}" * 4)
+    stream = Stream()
+    for i in range(1000):
+        stream.add(make_id(1700000000000 + i, 0), ['field', f'value:{i}', 'other', str(i)])
+    keyspace.set('stream', stream)
+    chunks = []
+    RDBWriter(chunks.append).save(keyspace)
+    return b''.join(chunks)
+
+
+def cases(args):
+    parser = RedisParser()
+    set_command = parser.to_resp_array(['SET', 'key:123456', 'x' * args.value_size])
+    pipeline = set_command * 100
+    xrange_reply = [[f'1700000000000-{i}', ['field', 'value', 'other', str(i)]] for i in range(10)]
+    rdb = build_rdb(args.rdb_keys)
+
+    def load_rdb():
+        RDBParser(None).load_buffer(Keyspace(), rdb)
+
+    # name, function, calls per run of the function
+    return [
+        ("parse one SET", lambda: parser.parse(set_command), 1),
+        ("parse_stream 100 pipelined SETs", lambda: parser.parse_stream(pipeline), 100),
+        ("to_resp bulk string", lambda: parser.to_resp('x' * args.value_size), 1),
+        ("to_resp integer", lambda: parser.to_resp(123456), 1),
+        ("to_resp_array command", lambda: parser.to_resp_array(['SET', 'key:123456', 'value']), 1),
+        ("to_resp XRANGE reply of 10 entries", lambda: parser.to_resp(xrange_reply), 1),
+        (f"RDBParser.load_buffer {args.rdb_keys} keys", load_rdb, args.rdb_keys + 1),
+    ]
+
+
+def measure(name, function, items, repeat):
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat, number)) / number
+    return {
+        "case": name,
+        "ns_per_call": round(best * 1e9, 1),
+        "ns_per_item": round(best * 1e9 / items, 1),
+        "items_per_sec": round(items / best, 1),
+    }
+
+
+def main():
+    args_parser = argparse.ArgumentParser(description="Micro-benchmark the protocol and RDB code")
+    args_parser.add_argument('--repeat', type=int, default=5, help="Timing runs per case, the best one counts")
+    args_parser.add_argument('--value-size', type=int, default=3, help="Bytes per value")
+    args_parser.add_argument('--rdb-keys', type=int, default=50000, help="Keys in the RDB payload")
+    args = args_parser.parse_args()
+
+    results = [measure(name, function, items, args.repeat) for name, function, items in cases(args)]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
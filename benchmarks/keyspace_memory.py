@@ -0,0 +1,70 @@
+"""Reports how many bytes each key costs in the keyspace.
+
+Run from the repository root:
+
+    python3 -m benchmarks.keyspace_memory --keys 1000000
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+
+from app.expires import now_ms
+from app.keyspace import Keyspace
+
+
+def measure(name, keys, fill):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    keyspace = fill(keys)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    used = after - before
+    del keyspace
+    return {
+        "case": name,
+        "keys": keys,
+        "bytes": used,
+        "bytes_per_key": round(used / keys, 1),
+    }
+
+
+def fill_strings(keys):
+    keyspace = Keyspace()
+    for i in range(keys):
+        keyspace.set_string(f"key:{i}", f"value:{i}")
+    return keyspace
+
+
+def fill_integers(keys):
+    keyspace = Keyspace()
+    for i in range(keys):
+        keyspace.set_string(f"key:{i}", str(i))
+    return keyspace
+
+
+def fill_strings_with_ttl(keys):
+    keyspace = Keyspace()
+    expire_at = now_ms() + 3600 * 1000
+    for i in range(keys):
+        keyspace.set_string(f"key:{i}", f"value:{i}", expire_at + i)
+    return keyspace
+
+
+def main():
+    args_parser = argparse.ArgumentParser(description="Measure keyspace bytes per key")
+    args_parser.add_argument('--keys', type=int, default=1_000_000, help="Number of keys per case")
+    args = args_parser.parse_args()
+
+    results = [
+        measure("string values", args.keys, fill_strings),
+        measure("integer values", args.keys, fill_integers),
+        measure("string values with ttl", args.keys, fill_strings_with_ttl),
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
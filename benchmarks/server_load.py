@@ -0,0 +1,331 @@
+"""Drives a running server over TCP and reports throughput and latency.
+
+Like redis-benchmark: every test runs --requests operations spread over
+--clients connections, each keeping up to --pipeline operations in
+flight. Keys are drawn at random from --keyspace keys and values are
+--data-size bytes. Results are printed as JSON, one object per test.
+
+Start a server, then run from the repository root:
+
+    python3 -m benchmarks.server_load --port 6379 --clients 50 --pipeline 16
+    python3 -m benchmarks.server_load --tests set,get --processes 4
+
+An operation is one command for most tests. For multi_exec it is
+MULTI, SET, INCR and EXEC; for xread_block it is an XREAD BLOCK on one
+connection woken up by an XADD on a second one; for wait it is a SET
+followed by WAIT for --replicas replicas.
+"""
+import abc
+import argparse
+import json
+import multiprocessing
+import random
+import selectors
+import socket
+import time
+
+from app.redisParser import RedisParser
+
+parser = RedisParser()
+
+
+class Test(abc.ABC):
+    """One kind of operation. Subclasses say which commands an operation sends."""
+
+    # Connections each client needs
+    connections = 1
+    # Largest pipeline depth that keeps the operation meaningful
+    max_pipeline = None
+
+    def __init__(self, args, rng):
+        self.args = args
+        self.rng = rng
+        self.value = 'x' * args.data_size
+
+    def random_key(self):
+        return f"key:{self.rng.randrange(self.args.keyspace)}"
+
+    def setup(self):
+        """Commands run once, before the clients start."""
+        return []
+
+    @abc.abstractmethod
+    def operation(self, client):
+        """Returns [(connection index, command args), ...] for the next operation."""
+
+    def on_reply(self, client, args, reply):
+        pass
+
+
+class Ping(Test):
+    def operation(self, client):
+        return [(0, ['PING'])]
+
+
+class Set(Test):
+    def operation(self, client):
+        return [(0, ['SET', self.random_key(), self.value])]
+
+
+class Get(Test):
+    # Keys per MSET when seeding the keyspace
+    batch = 1000
+
+    def setup(self):
+        # Every key random_key() can draw exists, so each GET is a hit
+        commands = []
+        for start in range(0, self.args.keyspace, self.batch):
+            command = ['MSET']
+            for i in range(start, min(start + self.batch, self.args.keyspace)):
+                command += [f"key:{i}", self.value]
+            commands.append(command)
+        return commands
+
+    def operation(self, client):
+        return [(0, ['GET', self.random_key()])]
+
+
+class Incr(Test):
+    def operation(self, client):
+        return [(0, ['INCR', f"counter:{self.rng.randrange(self.args.keyspace)}"])]
+
+
+class Xadd(Test):
+    def operation(self, client):
+        return [(0, ['XADD', 'bench:stream', '*', 'field', self.value])]
+
+
+class Xrange(Test):
+    def setup(self):
+        return [['DEL', 'bench:range']] + [['XADD', 'bench:range', '*', 'field', self.value] for _ in range(1000)]
+
+    def operation(self, client):
+        return [(0, ['XRANGE', 'bench:range', '-', '+', 'COUNT', '10'])]
+
+
+class XreadBlock(Test):
+    # The reader must be parked before the next entry shows up
+    connections = 2
+    max_pipeline = 1
+
+    def __init__(self, args, rng):
+        super().__init__(args, rng)
+        # Fresh streams for every run, so reading from 0-0 blocks at first
+        self.run_id = time.time_ns()
+
+    def operation(self, client):
+        key = f"bench:xread:{self.run_id}:{client.index}"
+        if client.last_id is None:
+            client.last_id = '0-0'
+        return [(0, ['XREAD', 'BLOCK', '0', 'STREAMS', key, client.last_id]),
+                (1, ['XADD', key, '*', 'field', self.value])]
+
+    def on_reply(self, client, args, reply):
+        if args[0] == 'XADD' and isinstance(reply, str):
+            client.last_id = reply
+
+
+class MultiExec(Test):
+    def operation(self, client):
+        return [(0, ['MULTI']), (0, ['SET', self.random_key(), self.value]),
+                (0, ['INCR', 'bench:counter']), (0, ['EXEC'])]
+
+
+class Wait(Test):
+    max_pipeline = 1
+
+    def operation(self, client):
+        return [(0, ['SET', self.random_key(), self.value]),
+                (0, ['WAIT', str(self.args.replicas), str(self.args.wait_timeout)])]
+
+
+TESTS = {
+    'ping': Ping,
+    'set': Set,
+    'get': Get,
+    'incr': Incr,
+    'xadd': Xadd,
+    'xrange': Xrange,
+    'xread_block': XreadBlock,
+    'multi_exec': MultiExec,
+    'wait': Wait,
+}
+DEFAULT_TESTS = 'ping,set,get,incr,xadd,xrange,xread_block,multi_exec'
+
+
+class Operation:
+    __slots__ = ('started', 'pending')
+
+    def __init__(self, started, pending):
+        self.started = started
+        self.pending = pending
+
+
+class Client:
+    def __init__(self, index, socks):
+        self.index = index
+        self.socks = socks
+        self.buffers = [bytearray() for _ in socks]
+        # Per connection: (operation, args) for every reply still expected
+        self.expected = [[] for _ in socks]
+        self.in_flight = 0
+        self.last_id = None
+
+
+def connect(args):
+    sock = socket.create_connection((args.host, args.port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+def run_setup(args, test):
+    commands = test.setup()
+    if not commands:
+        return
+    sock = connect(args)
+    sock.sendall(b''.join(parser.to_resp_array(command) for command in commands))
+    buffer = bytearray()
+    replies = 0
+    while replies < len(commands):
+        buffer += sock.recv(65536)
+        parsed, consumed = parser.parse_stream(buffer)
+        del buffer[:consumed]
+        replies += len(parsed)
+    sock.close()
+
+
+def run_clients(args, test_name, clients, requests, seed):
+    """Runs requests operations over clients connections in this process.
+
+    Returns (latencies in microseconds, elapsed seconds, error replies)."""
+    rng = random.Random(seed)
+    test = TESTS[test_name](args, rng)
+    pipeline = args.pipeline if test.max_pipeline is None else min(args.pipeline, test.max_pipeline)
+    selector = selectors.DefaultSelector()
+    all_clients = []
+    for index in range(clients):
+        client = Client(seed * 100000 + index, [connect(args) for _ in range(test.connections)])
+        all_clients.append(client)
+        for conn, sock in enumerate(client.socks):
+            sock.setblocking(False)
+            selector.register(sock, selectors.EVENT_READ, (client, conn))
+
+    latencies = []
+    issued = 0
+    errors = 0
+
+    def issue(client):
+        nonlocal issued
+        out = [bytearray() for _ in client.socks]
+        while client.in_flight < pipeline and issued < requests:
+            commands = test.operation(client)
+            operation = Operation(time.perf_counter(), len(commands))
+            for conn, command in commands:
+                out[conn] += parser.to_resp_array(command)
+                client.expected[conn].append((operation, command))
+            client.in_flight += 1
+            issued += 1
+        for sock, data in zip(client.socks, out):
+            if data:
+                sock.setblocking(True)
+                sock.sendall(data)
+                sock.setblocking(False)
+
+    started = time.perf_counter()
+    for client in all_clients:
+        issue(client)
+    while len(latencies) < requests:
+        for key, _ in selector.select():
+            client, conn = key.data
+            data = key.fileobj.recv(1 << 20)
+            if not data:
+                raise ConnectionError("The server closed the connection")
+            buffer = client.buffers[conn]
+            buffer += data
+            replies, consumed = parser.parse_stream(buffer)
+            del buffer[:consumed]
+            now = time.perf_counter()
+            for reply in replies:
+                operation, command = client.expected[conn].pop(0)
+                if isinstance(reply, Exception):
+                    errors += 1
+                test.on_reply(client, command, reply)
+                operation.pending -= 1
+                if operation.pending == 0:
+                    latencies.append(int((now - operation.started) * 1_000_000))
+                    client.in_flight -= 1
+            issue(client)
+    elapsed = time.perf_counter() - started
+
+    for client in all_clients:
+        for sock in client.socks:
+            selector.unregister(sock)
+            sock.close()
+    return latencies, elapsed, errors
+
+
+def percentile(ordered, fraction):
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def run_test(args, test_name):
+    run_setup(args, TESTS[test_name](args, random.Random(0)))
+    processes = min(args.processes, args.clients)
+    shares = [(args.clients * (i + 1) // processes - args.clients * i // processes,
+               args.requests * (i + 1) // processes - args.requests * i // processes)
+              for i in range(processes)]
+    if processes == 1:
+        results = [run_clients(args, test_name, args.clients, args.requests, 1)]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.starmap(run_clients, [(args, test_name, clients, requests, seed + 1)
+                                                 for seed, (clients, requests) in enumerate(shares)])
+
+    latencies = sorted(latency for result in results for latency in result[0])
+    elapsed = max(result[1] for result in results)
+    return {
+        "test": test_name,
+        "requests": len(latencies),
+        "clients": args.clients,
+        "pipeline": args.pipeline,
+        "data_size": args.data_size,
+        "elapsed_sec": round(elapsed, 3),
+        "ops_per_sec": round(len(latencies) / elapsed, 1),
+        "errors": sum(result[2] for result in results),
+        "latency_usec": {
+            "min": latencies[0],
+            "p50": percentile(latencies, 0.5),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "p999": percentile(latencies, 0.999),
+            "max": latencies[-1],
+        },
+    }
+
+
+def main():
+    args_parser = argparse.ArgumentParser(description="Measure server throughput and latency")
+    args_parser.add_argument('--host', default='localhost')
+    args_parser.add_argument('--port', type=int, default=6379)
+    args_parser.add_argument('--clients', type=int, default=50, help="Parallel connections")
+    args_parser.add_argument('--requests', type=int, default=100000, help="Operations per test")
+    args_parser.add_argument('--pipeline', type=int, default=1, help="Operations in flight per connection")
+    args_parser.add_argument('--keyspace', type=int, default=100000, help="Number of distinct random keys")
+    args_parser.add_argument('--data-size', type=int, default=3, help="Value size in bytes")
+    args_parser.add_argument('--tests', default=DEFAULT_TESTS,
+                             help=f"Comma separated, out of: {','.join(TESTS)}")
+    args_parser.add_argument('--processes', type=int, default=1,
+                             help="Client processes, when one cannot keep the server busy")
+    args_parser.add_argument('--replicas', type=int, default=1, help="Replicas WAIT waits for")
+    args_parser.add_argument('--wait-timeout', type=int, default=1000, help="WAIT timeout in milliseconds")
+    args = args_parser.parse_args()
+
+    tests = [name.strip() for name in args.tests.split(',') if name.strip()]
+    unknown = [name for name in tests if name not in TESTS]
+    if unknown:
+        args_parser.error(f"unknown tests: {', '.join(unknown)}")
+    print(json.dumps([run_test(args, name) for name in tests], indent=2))
+
+
+if __name__ == "__main__":
+    main()